@@ -0,0 +1,125 @@
+"""Admin command line tools.
+
+    python admin.py import subscriptions.csv
+    python admin.py import dump.jsonl --batch-size 20000
+    python admin.py import netflix.csv --user-id 123456
+    python admin.py report --top 20
+    python admin.py rates rates.json
+
+The database is the bot's (DATABASE_URL or subscription.db) unless --db is given.
+"""
+from dotenv import load_dotenv
+load_dotenv()
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+from db_manager import (
+    init_pool, close_pool, run_migrations, get_spending_summary, refresh_exchange_rates, DATABASE_URL, DB_NAME,
+    STATS_HORIZON_DAYS
+)
+from money import BASE_CURRENCY, format_total
+from rates import load_rates_file
+from subscription_io import IMPORT_BATCH_SIZE, detect_format, import_records, open_records, FORMAT_CSV, FORMAT_JSON
+
+logger = logging.getLogger(__name__)
+
+
+def _print_error(line: int, message: str) -> None:
+    print(f"строка {line}: {message}", file=sys.stderr)
+
+
+async def import_file(path: str, file_format: str, user_id: int | None, batch_size: int) -> int:
+    """Streams the file into the database; returns the number of rejected lines."""
+    started = time.perf_counter()
+    with open(path, encoding="utf-8-sig", newline="") as text:
+        report = await import_records(
+            open_records(text, file_format), user_id=user_id, batch_size=batch_size, on_error=_print_error
+        )
+    elapsed = time.perf_counter() - started
+    logger.info(
+        "Импорт %s завершен за %.1f с: добавлено %d (%.0f строк/с), ошибок %d.",
+        path, elapsed, report.imported, report.imported / elapsed if elapsed else 0, report.error_count
+    )
+    return report.error_count
+
+
+async def print_report(horizon_days: int, top: int) -> None:
+    """Global spending report from the aggregate tables, in BASE_CURRENCY."""
+    await refresh_exchange_rates()
+    summary = await get_spending_summary(None, horizon_days, top)
+    print(f"Пользователей с подписками: {summary.users}")
+    print(f"Подписок: {summary.subscriptions}")
+    print(f"В месяц: {format_total(summary.monthly_total)}")
+    print(f"В год: {format_total(summary.monthly_total * 12)}")
+    print(f"К оплате в ближайшие {horizon_days} дней: {format_total(summary.upcoming_total)}")
+    print(f"Просрочено: {format_total(summary.overdue_total)}")
+    print(f"Топ-{top} сервисов по расходам в месяц:")
+    for service_name, subscriptions, monthly_total in summary.top_services:
+        print(f"  {service_name}: {format_total(monthly_total)} ({subscriptions} подписок)")
+    if summary.unconverted:
+        print(f"Без курса к {BASE_CURRENCY}, не вошли в суммы: {', '.join(summary.unconverted)}")
+
+
+async def _run(args: argparse.Namespace) -> int:
+    await init_pool(args.db)
+    try:
+        await run_migrations()
+        if args.command == "report":
+            await print_report(args.days, args.top)
+            return 0
+        if args.command == "rates":
+            try:
+                await load_rates_file(args.path)
+            except (OSError, ValueError) as e:
+                print(f"Ошибка: {e}", file=sys.stderr)
+                return 2
+            return 0
+
+        file_format = args.format or detect_format(args.path)
+        if file_format is None:
+            print("Ошибка: не удалось определить формат по расширению, укажите --format", file=sys.stderr)
+            return 2
+        try:
+            errors = await import_file(args.path, file_format, args.user_id, args.batch_size)
+        except ValueError as e:
+            print(f"Ошибка: {e}", file=sys.stderr)
+            return 2
+        return 1 if errors else 0
+    finally:
+        await close_pool()
+
+
+def main():
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=os.getenv("LOG_LEVEL", "INFO").upper()
+    )
+    parser = argparse.ArgumentParser(description="Административные команды бота подписок")
+    parser.add_argument("--db", default=DATABASE_URL or DB_NAME, help="путь к SQLite или postgresql:// URL")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="загрузить подписки из CSV/JSON файла")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--format", choices=(FORMAT_CSV, FORMAT_JSON), help="по умолчанию по расширению файла")
+    import_parser.add_argument(
+        "--user-id", type=int, help="владелец всех подписок файла; без него нужна колонка user_id"
+    )
+    import_parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE, help="строк на транзакцию")
+
+    report_parser = commands.add_parser("report", help="общая статистика расходов")
+    report_parser.add_argument("--days", type=int, default=STATS_HORIZON_DAYS, help="горизонт ближайших платежей")
+    report_parser.add_argument("--top", type=int, default=10, help="сколько сервисов показать")
+
+    rates_parser = commands.add_parser("rates", help="заменить курсы валют курсами из JSON/CSV файла")
+    rates_parser.add_argument("path")
+
+    args = parser.parse_args()
+    sys.exit(asyncio.run(_run(args)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+"""Compares two benchmarks/run.py reports.
+
+    python -m benchmarks.compare baseline.json candidate.json --threshold 0.10
+
+Exits with status 1 if any benchmark's mean got slower by more than the threshold.
+"""
+import argparse
+import json
+import sys
+
+
+def _load(path: str) -> dict[tuple[str, int], dict]:
+    with open(path, encoding="utf-8") as f:
+        report = json.load(f)
+    return {(result["name"], result["size"]): result for result in report["results"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение двух отчетов бенчмарков")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=0.10, help="допустимое замедление, доля")
+    args = parser.parse_args()
+
+    baseline, candidate = _load(args.baseline), _load(args.candidate)
+    regressions = 0
+    print(f"{'benchmark':<36} {'size':>9} {'base ms':>11} {'new ms':>11} {'change':>8}")
+    for key in sorted(baseline.keys() & candidate.keys()):
+        old, new = baseline[key]["mean_ms"], candidate[key]["mean_ms"]
+        change = (new - old) / old if old else 0.0
+        marker = ""
+        if change > args.threshold:
+            regressions += 1
+            marker = "  <-- регрессия"
+        print(f"{key[0]:<36} {key[1]:>9} {old:>11.3f} {new:>11.3f} {change:>+8.1%}{marker}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
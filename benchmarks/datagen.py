@@ -0,0 +1,125 @@
+"""Synthetic subscription databases for benchmarks.
+
+Users have a heavy-tailed number of subscriptions (most have a handful, a few have dozens),
+payment dates cluster on the first days of the month and spread over the next two months,
+with a small share already overdue. Reminder statuses match what the sweep would have set.
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import random
+import sqlite3
+import time
+
+import db_manager
+
+SERVICES = [
+    "Netflix", "Spotify", "YouTube Premium", "Яндекс.Плюс", "iCloud", "Google One", "ChatGPT Plus",
+    "Кинопоиск", "VK Музыка", "Okko", "Telegram Premium", "Adobe CC", "Microsoft 365", "Duolingo",
+    "Hosting", "VPN", "Фитнес-клуб", "Мобильная связь", "Интернет", "Coursera",
+]
+
+INSERT_BATCH = 50000
+# amount_minor is in kopecks, currency keeps its default (RUB)
+INSERT_SQL = (
+    "INSERT INTO subscriptions (user_id, service_name, amount_minor, next_payment_date, reminder_status) "
+    "VALUES (?, ?, ?, ?, ?)"
+)
+
+
+def _subscriptions_per_user(rng: random.Random) -> int:
+    # Pareto-like tail: median ~3, a few power users with 50+
+    return min(1 + int(rng.paretovariate(1.3) * 2), 200)
+
+
+def _payment_day(rng: random.Random, today: int) -> int:
+    roll = rng.random()
+    if roll < 0.05:
+        return today - rng.randint(1, 30)      # overdue
+    if roll < 0.35:
+        # billing days cluster at the start of a month
+        first = datetime.date.fromordinal(today).replace(day=1)
+        month_start = (first + datetime.timedelta(days=32 * rng.randint(1, 2))).replace(day=1)
+        return month_start.toordinal() + rng.randint(0, 4)
+    return today + rng.randint(0, 60)
+
+
+def _reminder_status(day: int, today: int) -> int:
+    """Status as of just before today's sweep, so the sweep gets one day's worth of work."""
+    if day >= today + 3:
+        return 0
+    if day >= today + 1:
+        return 1
+    if day >= today - 1:
+        return 2
+    return 3
+
+
+def generate_rows(count: int, seed: int = 42, today: datetime.date | None = None):
+    """Yields (user_id, service_name, amount_minor, next_payment_date day number, reminder_status)."""
+    rng = random.Random(seed)
+    today_day = (today or datetime.date.today()).toordinal()
+    produced = 0
+    user_id = 100000
+    while produced < count:
+        user_id += rng.randint(1, 7)
+        for _ in range(min(_subscriptions_per_user(rng), count - produced)):
+            day = _payment_day(rng, today_day)
+            amount_minor = round(rng.choice([99, 149, 199, 299, 399, 599, 999, 1490]) * rng.uniform(0.9, 1.1) * 100)
+            yield user_id, rng.choice(SERVICES), amount_minor, day, _reminder_status(day, today_day)
+            produced += 1
+
+
+async def _migrate(path: str) -> None:
+    await db_manager.init_pool(path, readers=1)
+    try:
+        await db_manager.run_migrations()
+    finally:
+        await db_manager.close_pool()
+
+
+def create_database(path: str, count: int, seed: int = 42) -> float:
+    """Builds a fresh database with count subscriptions; returns seconds spent."""
+    started = time.perf_counter()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    asyncio.run(_migrate(path))
+
+    con = sqlite3.connect(path)
+    con.execute("PRAGMA journal_mode = WAL")
+    con.execute("PRAGMA synchronous = OFF")
+    batch = []
+    for row in generate_rows(count, seed):
+        batch.append(row)
+        if len(batch) >= INSERT_BATCH:
+            con.executemany(
+                INSERT_SQL,
+                batch
+            )
+            batch.clear()
+    if batch:
+        con.executemany(
+            INSERT_SQL,
+            batch
+        )
+    con.commit()
+    con.execute("ANALYZE")
+    con.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    con.close()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Генератор синтетической базы подписок")
+    parser.add_argument("path")
+    parser.add_argument("--count", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    elapsed = create_database(args.path, args.count, args.seed)
+    print(f"{args.count} подписок записано в {args.path} за {elapsed:.1f} с")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Local stand-in for the Bot API over HTTP, for driving the real Application and its httpx pool.
+
+Answers every method after the configured latency: send*/edit* with a Message in the requested
+chat, getMe with the bot, anything else with True. Keeps connections alive like api.telegram.org.
+"""
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+from urllib.parse import parse_qs
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Load", "username": "load_test_bot"}
+
+
+class FakeBotAPI:
+    def __init__(self, latency: float = 0.05, jitter: float = 0.02, seed: int = 42):
+        self.latency = latency
+        self.jitter = jitter
+        self._rng = random.Random(seed)
+        self._message_id = 0
+        self._server: asyncio.AbstractServer | None = None
+        self.requests = Counter()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Returns the base_url to build the application with."""
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}/bot"
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def _result(self, method: str, params: dict):
+        if method == "getme":
+            return BOT_USER
+        if method.startswith(("send", "edit")):
+            self._message_id += 1
+            try:
+                chat_id = int(params.get("chat_id", 0))
+            except ValueError:
+                chat_id = 0
+            return {
+                "message_id": self._message_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": BOT_USER,
+                "text": params.get("text", ""),
+            }
+        return True
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                # /bot<token>/<method>
+                method = request_line.decode("latin-1").split()[1].rsplit("/", 1)[-1].lower()
+                params = {}
+                if headers.get("content-type", "").startswith("application/x-www-form-urlencoded"):
+                    params = {key: values[0] for key, values in parse_qs(body.decode()).items()}
+                self.requests[method] += 1
+
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+                try:
+                    await asyncio.sleep(max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter)))
+                finally:
+                    self.in_flight -= 1
+
+                payload = json.dumps({"ok": True, "result": self._result(method, params)}).encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\n"
+                    b"Content-Type: application/json\r\n"
+                    + f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def counters(self) -> dict:
+        return {
+            "requests": sum(self.requests.values()),
+            "by_method": dict(self.requests),
+            "max_in_flight": self.max_in_flight,
+        }
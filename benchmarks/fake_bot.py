@@ -0,0 +1,45 @@
+"""Local stand-in for telegram.Bot: simulated latency, flood control and blocked users."""
+import asyncio
+import random
+
+from telegram.error import Forbidden, RetryAfter
+
+
+class FakeBot:
+    def __init__(self, latency: float = 0.05, jitter: float = 0.02, flood_rate: float = 0.0,
+                 retry_after: int = 1, blocked_rate: float = 0.0, seed: int = 42):
+        self.latency = latency
+        self.jitter = jitter
+        self.flood_rate = flood_rate
+        self.retry_after = retry_after
+        self.blocked_rate = blocked_rate
+        self._rng = random.Random(seed)
+        self.sent = 0
+        self.flood_errors = 0
+        self.blocked_errors = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter)))
+            if self.flood_rate and self._rng.random() < self.flood_rate:
+                self.flood_errors += 1
+                raise RetryAfter(self.retry_after)
+            # the same chats are always "blocked", like real users who left
+            if self.blocked_rate and (chat_id * 2654435761 % 1000) < self.blocked_rate * 1000:
+                self.blocked_errors += 1
+                raise Forbidden("Forbidden: bot was blocked by the user")
+            self.sent += 1
+        finally:
+            self.in_flight -= 1
+
+    def counters(self) -> dict:
+        return {
+            "sent": self.sent,
+            "flood_errors": self.flood_errors,
+            "blocked_errors": self.blocked_errors,
+            "max_in_flight": self.max_in_flight,
+        }
@@ -0,0 +1,296 @@
+"""Load test: synthetic users drive the real Application from main.build_application.
+
+    python -m benchmarks.load --size 100000 --users 100 1000 --concurrent-updates 1 32
+
+Every simulated user is a loop that sends /list, /add (all three steps), /paid, /delete or /stats
+as a fake Update and waits for it to be handled before thinking and sending the next one, so the
+number of users is the number of updates in flight. Updates go through the update processor,
+the handlers and ConversationHandler exactly as polling would feed them; the bot talks HTTP to
+FakeBotAPI, with its own connection pool and timeouts. A reminder sweep runs alongside, and
+--external-writers adds other processes' write transactions (like admin.py import) to the
+same SQLite file. Each users x concurrent-updates pair runs on a fresh copy of the database.
+
+Reports p50/p99 per command, throughput, errors by type and how many of them were
+"database is locked". Results are written as JSON in the benchmarks/run.py format.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import os
+import platform
+import random
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+from telegram import Update
+
+import db_manager
+import main as bot_main
+import reminder_scheduler
+from benchmarks.datagen import INSERT_SQL, create_database, generate_rows
+from benchmarks.fake_api import FakeBotAPI
+from benchmarks.run import _fresh_copy, _git_commit, _sample_subscriptions, _summary
+from delivery import delivery_clock
+from dispatcher import ReminderDispatcher
+
+TOKEN = "123456:load-test"
+DATABASE_LOCKED = "database is locked"
+
+# relative weights of what users do
+DEFAULT_MIX = {"list": 35, "add": 20, "paid": 25, "delete": 5, "stats": 15}
+COMMANDS = {"list": "/list", "paid": "/paid", "delete": "/delete", "stats": "/stats"}
+ADD_SERVICES = ["Netflix", "Spotify", "Кинопоиск", "iCloud", "VPN"]
+
+
+class LoadRun:
+    """One users x concurrent-updates run: the application, its users and what they measured."""
+
+    def __init__(self, application, args, rng: random.Random):
+        self.application = application
+        self.args = args
+        self.rng = rng
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors = Counter()
+        self.locked = 0
+        self._update_id = 0
+        self._message_id = 0
+        application.add_error_handler(self._on_error)
+
+    async def _on_error(self, update, context) -> None:
+        self.record_error(context.error)
+
+    def record_error(self, error: BaseException) -> None:
+        self.errors[type(error).__name__] += 1
+        if DATABASE_LOCKED in str(error):
+            self.locked += 1
+
+    def _update(self, user_id: int, text: str) -> Update:
+        self._update_id += 1
+        self._message_id += 1
+        message = {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Load"},
+            "text": text,
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return Update.de_json({"update_id": self._update_id, "message": message}, self.application.bot)
+
+    async def send(self, name: str, user_id: int, text: str) -> None:
+        """Feeds one update the way the polling loop does and records how long it took to handle."""
+        update = self._update(user_id, text)
+        started = time.perf_counter()
+        await self.application.update_processor.process_update(update, self.application.process_update(update))
+        self.latencies[name].append(time.perf_counter() - started)
+
+    async def user_session(self, user_id: int, sub_ids: list[int]) -> None:
+        actions, weights = list(self.args.mix), list(self.args.mix.values())
+        for _ in range(self.args.actions):
+            if self.args.think_time:
+                await asyncio.sleep(self.rng.expovariate(1 / self.args.think_time))
+            action = self.rng.choices(actions, weights)[0]
+            if action in ("paid", "delete") and not sub_ids:
+                action = "list"
+            if action == "add":
+                next_payment = datetime.date.today() + datetime.timedelta(days=self.rng.randint(1, 60))
+                await self.send("add", user_id, "/add")
+                await self.send("add_service_name", user_id, self.rng.choice(ADD_SERVICES))
+                await self.send("add_amount", user_id, str(self.rng.randint(99, 2999)))
+                await self.send("add_date", user_id, next_payment.isoformat())
+            elif action == "paid":
+                await self.send("paid", user_id, f"/paid {self.rng.choice(sub_ids)}")
+            elif action == "delete":
+                await self.send("delete", user_id, f"/delete {sub_ids.pop(self.rng.randrange(len(sub_ids)))}")
+            else:
+                await self.send(action, user_id, COMMANDS[action])
+
+
+def _external_writer(path: str, args, stop: threading.Event, stats: Counter, seed: int) -> None:
+    """Another process's bulk import: batches of inserts, one write transaction each."""
+    con = sqlite3.connect(path, timeout=5)
+    rows = generate_rows(10 ** 9, seed)
+    try:
+        while not stop.is_set():
+            batch = [next(rows) for _ in range(args.writer_batch)]
+            started = time.perf_counter()
+            try:
+                con.executemany(INSERT_SQL, batch)
+                con.commit()
+                stats["transactions"] += 1
+                stats["rows"] += len(batch)
+            except sqlite3.OperationalError as e:
+                con.rollback()
+                stats["locked" if DATABASE_LOCKED in str(e) else "errors"] += 1
+            stats["held_ms"] += int((time.perf_counter() - started) * 1000)
+            stop.wait(args.writer_pause)
+    finally:
+        con.close()
+
+
+async def _sweep(run: LoadRun, args) -> dict:
+    bot = run.application.bot
+    if args.telegram_limits:
+        dispatcher = ReminderDispatcher(bot)
+    else:
+        dispatcher = ReminderDispatcher(bot, concurrency=args.sweep_concurrency, global_rate=1e9, per_chat_rate=1e9)
+    # as of the end of the day, when every delivery slot has come: a full day's reminders whatever the time
+    end_of_day = datetime.datetime.combine(datetime.date.today(), datetime.time(23, 59))
+    clock = delivery_clock(end_of_day.timestamp())
+    started = time.perf_counter()
+    try:
+        stats, _ = await reminder_scheduler.run_reminder_sweep(bot, dispatcher, clock=clock)
+    except Exception as e:
+        run.record_error(e)
+        return {"error": f"{type(e).__name__}: {e}"}
+    return {
+        "seconds": time.perf_counter() - started,
+        "sent": stats.sent, "failed": stats.failed, "retries": stats.retries,
+    }
+
+
+async def run_load(path: str, size: int, users: list[tuple[int, list[int]]], concurrency: int, args) -> list[dict]:
+    api = FakeBotAPI(latency=args.latency, jitter=args.jitter, seed=args.seed)
+    base_url = await api.start()
+    db_path = _fresh_copy(path, f"load_{len(users)}_{concurrency}")
+    # opened before initialize(), where the persistence would open the default database
+    await db_manager.init_pool(db_path)
+    application = bot_main.build_application(TOKEN, base_url=base_url, concurrent_updates=concurrency)
+    run = LoadRun(application, args, random.Random(args.seed))
+
+    stop_writers = threading.Event()
+    writer_stats = Counter()
+    writers = [
+        threading.Thread(target=_external_writer, args=(db_path, args, stop_writers, writer_stats, args.seed + i))
+        for i in range(args.external_writers)
+    ]
+    try:
+        await application.initialize()
+        await application.start()
+        for writer in writers:
+            writer.start()
+        sweep = asyncio.create_task(_sweep(run, args)) if not args.skip_sweep else None
+
+        started = time.perf_counter()
+        await asyncio.gather(*(run.user_session(user_id, list(sub_ids)) for user_id, sub_ids in users))
+        elapsed = time.perf_counter() - started
+        sweep_result = await sweep if sweep is not None else None
+    finally:
+        stop_writers.set()
+        for writer in writers:
+            writer.join()
+        if application.running:
+            await application.stop()
+        await application.shutdown()
+        await db_manager.close_pool()
+        await api.stop()
+
+    label = f"{len(users)}u_{concurrency}cu"
+    results = [
+        _summary(f"load_{name}_{label}", size, samples, users=len(users), concurrent_updates=concurrency)
+        for name, samples in sorted(run.latencies.items())
+    ]
+    all_samples = [sample for samples in run.latencies.values() for sample in samples]
+    results.append(_summary(
+        f"load_all_{label}", size, all_samples,
+        users=len(users), concurrent_updates=concurrency,
+        seconds=elapsed,
+        updates_per_s=len(all_samples) / elapsed if elapsed else 0.0,
+        errors=dict(run.errors),
+        database_locked=run.locked,
+        sweep=sweep_result,
+        external_writers=dict(writer_stats),
+        api=api.counters(),
+    ))
+    return results
+
+
+def _users(path: str, size: int, count: int, seed: int) -> list[tuple[int, list[int]]]:
+    """count existing users, each with some of their subscriptions to /paid and /delete."""
+    by_user: dict[int, list[int]] = defaultdict(list)
+    for user_id, sub_id in _sample_subscriptions(path, count * 3, size, seed):
+        by_user[user_id].append(sub_id)
+    return list(by_user.items())[:count]
+
+
+def _parse_mix(items: list[str]) -> dict[str, int]:
+    mix = {}
+    for item in items:
+        action, _, weight = item.partition("=")
+        if action not in DEFAULT_MIX or not weight.isdigit():
+            raise argparse.ArgumentTypeError(f"Ожидалось действие=вес, действия: {', '.join(DEFAULT_MIX)}")
+        mix[action] = int(weight)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест хендлеров бота")
+    parser.add_argument("--size", type=int, default=100000, help="подписок в базе")
+    parser.add_argument("--users", type=int, nargs="+", default=[100, 1000], help="одновременных пользователей")
+    parser.add_argument("--concurrent-updates", type=int, nargs="+", default=[bot_main.CONCURRENT_UPDATES])
+    parser.add_argument("--actions", type=int, default=10, help="действий на пользователя")
+    parser.add_argument("--think-time", type=float, default=0.5, help="средняя пауза между действиями, с")
+    parser.add_argument("--mix", nargs="+", default=[f"{k}={v}" for k, v in DEFAULT_MIX.items()],
+                        help="веса действий, например list=50 add=10")
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка ответа Bot API, с")
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--skip-sweep", action="store_true", help="без проверки напоминаний во время нагрузки")
+    parser.add_argument("--sweep-concurrency", type=int, default=200)
+    parser.add_argument("--telegram-limits", action="store_true", help="рассылка с реальными лимитами 30 сообщ./с")
+    parser.add_argument("--external-writers", type=int, default=0, help="потоков записи в тот же файл, как admin.py import")
+    parser.add_argument("--writer-batch", type=int, default=20000, help="строк в транзакции внешнего писателя")
+    parser.add_argument("--writer-pause", type=float, default=0.5, help="пауза между транзакциями, с")
+    parser.add_argument("--data-dir", default=".bench_data")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="bench_results_load.json", help="файл для JSON-отчета")
+    args = parser.parse_args()
+    args.mix = _parse_mix(args.mix)
+
+    # handler errors are counted by the error handler, and the sweep logs every reminder
+    logging.getLogger().setLevel(logging.WARNING)
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    today = datetime.date.today().isoformat()
+    path = os.path.join(args.data_dir, f"subs_{args.size}_{args.seed}_{today}.db")
+    if not os.path.exists(path):
+        elapsed = create_database(path, args.size, args.seed)
+        print(f"[load] сгенерирована база {path} за {elapsed:.1f} с", file=sys.stderr)
+
+    results = []
+    for count in args.users:
+        users = _users(path, args.size, count, args.seed)
+        for concurrency in args.concurrent_updates:
+            level_results = asyncio.run(run_load(path, args.size, users, concurrency, args))
+            results.extend(level_results)
+            for result in level_results:
+                print(f"[load] {result['name']:<36} p50 {result['p50_ms']:9.3f} ms"
+                      f"  p99 {result['p99_ms']:9.3f} ms  n {result['iterations']}", file=sys.stderr)
+            total = level_results[-1]
+            print(f"[load] {len(users)} польз., concurrent_updates={concurrency}: "
+                  f"{total['updates_per_s']:.1f} апдейтов/с, ошибок {sum(total['errors'].values())}, "
+                  f"database is locked: {total['database_locked']}", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"[load] отчет записан в {args.output}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+"""Benchmarks for db_manager and reminder_scheduler.
+
+    python -m benchmarks.run --sizes 10000 100000 --output bench_results.json
+
+Each size gets its own synthetic database (see datagen.py), reused between runs of the same day.
+The sweep runs on a fresh copy against FakeBot, so it always has the same amount of work.
+Results are written as JSON; compare two runs with benchmarks/compare.py.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+
+import db_manager
+import reminder_scheduler
+from benchmarks.datagen import create_database
+from benchmarks.fake_bot import FakeBot
+from dispatcher import ReminderDispatcher
+
+DEFAULT_SIZES = [10000, 100000]
+
+
+def _summary(name: str, size: int, samples: list[float], **extra) -> dict:
+    samples_ms = sorted(s * 1000 for s in samples)
+    if len(samples_ms) > 1:
+        quantiles = statistics.quantiles(samples_ms, n=100, method="inclusive")
+    else:
+        quantiles = samples_ms * 99
+    total = sum(samples)
+    return {
+        "name": name,
+        "size": size,
+        "iterations": len(samples),
+        "mean_ms": statistics.fmean(samples_ms),
+        "p50_ms": quantiles[49],
+        "p95_ms": quantiles[94],
+        "p99_ms": quantiles[98],
+        "min_ms": samples_ms[0],
+        "max_ms": samples_ms[-1],
+        "ops_per_s": len(samples) / total if total else 0.0,
+        **extra,
+    }
+
+
+def _sample_subscriptions(path: str, count: int, size: int, seed: int) -> list[tuple[int, int]]:
+    """Random existing (user_id, sub_id) pairs, looked up by rowid to avoid ORDER BY RANDOM()."""
+    rng = random.Random(seed)
+    con = sqlite3.connect(path)
+    try:
+        pairs = []
+        for sub_id in rng.sample(range(1, size + 1), min(count, size)):
+            row = con.execute("SELECT user_id, id FROM subscriptions WHERE id = ?", (sub_id,)).fetchone()
+            if row:
+                pairs.append(row)
+        return pairs
+    finally:
+        con.close()
+
+
+async def _timed(func, *args) -> float:
+    started = time.perf_counter()
+    await func(*args)
+    return time.perf_counter() - started
+
+
+def _fresh_copy(path: str, suffix: str) -> str:
+    """Benchmarks write to the database, so each one gets its own copy of the generated file."""
+    copy_path = f"{path}.{suffix}"
+    for extension in ("", "-wal", "-shm"):
+        if os.path.exists(copy_path + extension):
+            os.remove(copy_path + extension)
+    shutil.copyfile(path, copy_path)
+    return copy_path
+
+
+async def bench_queries(path: str, size: int, args) -> list[dict]:
+    pairs = _sample_subscriptions(path, args.iterations, size, args.seed)
+    results = []
+    await db_manager.init_pool(_fresh_copy(path, "queries"))
+    try:
+        samples = []
+        for user_id, _ in pairs:
+            db_manager._subscriptions_cache.clear()
+            samples.append(await _timed(db_manager.get_subscribtion_by_user, user_id))
+        results.append(_summary("get_subscribtion_by_user_uncached", size, samples))
+
+        samples = [await _timed(db_manager.get_subscribtion_by_user, user_id) for user_id, _ in pairs]
+        results.append(_summary("get_subscribtion_by_user_cached", size, samples,
+                                cache=db_manager.get_cache_stats()))
+
+        samples = [await _timed(db_manager.update_subscription_after_payment, user_id, sub_id)
+                   for user_id, sub_id in pairs]
+        results.append(_summary("update_subscription_after_payment", size, samples))
+
+        samples = []
+        due = 0
+        for _ in range(args.scan_repeats):
+            started = time.perf_counter()
+            due = 0
+            async for chunk in db_manager.iter_due_reminders():
+                due += len(chunk)
+            samples.append(time.perf_counter() - started)
+        results.append(_summary("iter_due_reminders", size, samples, due=due))
+    finally:
+        await db_manager.close_pool()
+    return results
+
+
+async def bench_sweep(path: str, size: int, args) -> dict:
+    bot = FakeBot(latency=args.latency, flood_rate=args.flood_rate, blocked_rate=args.blocked_rate, seed=args.seed)
+    if args.telegram_limits:
+        dispatcher = ReminderDispatcher(bot)
+    else:
+        # measure our own overhead, not Telegram's 30 msg/s ceiling
+        dispatcher = ReminderDispatcher(bot, concurrency=args.concurrency, global_rate=1e9, per_chat_rate=1e9)
+
+    await db_manager.init_pool(_fresh_copy(path, "sweep"))
+    try:
+        started = time.perf_counter()
+        stats, _ = await reminder_scheduler.run_reminder_sweep(bot, dispatcher)
+        elapsed = time.perf_counter() - started
+    finally:
+        await db_manager.close_pool()
+    return _summary(
+        "check_and_send_reminders", size, [elapsed],
+        mode=reminder_scheduler.REMINDER_MODE,
+        sent=stats.sent, failed=stats.failed, blocked=stats.blocked, retries=stats.retries,
+        messages_per_s=stats.sent / elapsed if elapsed else 0.0,
+        bot=bot.counters(),
+    )
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки db_manager и reminder_scheduler")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--iterations", type=int, default=1000, help="вызовов на точечный бенчмарк")
+    parser.add_argument("--scan-repeats", type=int, default=5)
+    parser.add_argument("--data-dir", default=".bench_data")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка FakeBot, с")
+    parser.add_argument("--flood-rate", type=float, default=0.001, help="доля ответов 429")
+    parser.add_argument("--blocked-rate", type=float, default=0.01, help="доля заблокировавших бота")
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--telegram-limits", action="store_true", help="соблюдать реальные лимиты 30 сообщ./с")
+    parser.add_argument("--skip-sweep", action="store_true")
+    parser.add_argument("--output", default="bench_results.json", help="файл для JSON-отчета")
+    args = parser.parse_args()
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    today = datetime.date.today().isoformat()
+    results = []
+    for size in args.sizes:
+        path = os.path.join(args.data_dir, f"subs_{size}_{args.seed}_{today}.db")
+        if not os.path.exists(path):
+            elapsed = create_database(path, size, args.seed)
+            print(f"[bench] сгенерирована база {path} за {elapsed:.1f} с", file=sys.stderr)
+        size_results = asyncio.run(bench_queries(path, size, args))
+        if not args.skip_sweep:
+            size_results.append(asyncio.run(bench_sweep(path, size, args)))
+        results.extend(size_results)
+        for result in size_results:
+            print(f"[bench] {size:>9} {result['name']:<36} mean {result['mean_ms']:9.3f} ms"
+                  f"  p99 {result['p99_ms']:9.3f} ms", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"[bench] отчет записан в {args.output}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""When reminders reach a user: their timezone, delivery hour and the resulting delivery slot.
+
+A slot is the minute, counted from UTC midnight of the user's local date, at which that date's
+reminders go out: delivery_hour * 60 - utc_offset, plus a spread inside the hour by user_id, so
+users sharing a setting don't all land in the same minute. It can be negative or past 1440.
+A user's reminder day is the latest local date whose slot has already come; the due-reminder
+queries compute it per row from the same expression as slot_of().
+"""
+import datetime
+import os
+import re
+import time
+import zoneinfo
+from dataclasses import dataclass
+from functools import lru_cache
+
+# for users who haven't picked their own in /settings; None - the server's timezone
+DEFAULT_TIMEZONE = os.getenv("DEFAULT_TIMEZONE") or None
+DEFAULT_DELIVERY_HOUR = int(os.getenv("REMINDER_HOUR", "10"))
+# every delivery hour is split into this many slots, users are spread over them by user_id
+DELIVERY_SLOTS_PER_HOUR = int(os.getenv("DELIVERY_SLOTS_PER_HOUR", "4"))
+SLOT_MINUTES = 60 // DELIVERY_SLOTS_PER_HOUR
+
+EPOCH_DAY = datetime.date(1970, 1, 1).toordinal()
+MINUTES_PER_DAY = 24 * 60
+# the furthest any timezone is ahead of UTC (Pacific/Kiritimati)
+MAX_UTC_OFFSET = 14 * 60
+
+_UTC_OFFSET_RE = re.compile(r"^(?:utc|gmt)?\s*([+-])\s*(\d{1,2})(?::?00)?$", re.IGNORECASE)
+_HOUR_RE = re.compile(r"^(\d{1,2})(?::00)?$")
+
+
+@dataclass(frozen=True)
+class DeliveryClock:
+    """A sweep's view of time: the current UTC minute and the settings of users who have none."""
+    now_minute: int  # minutes since the Unix epoch
+    default_hour: int
+    default_offset: int  # minutes east of UTC
+    slots_per_hour: int
+    slot_minutes: int
+
+    @property
+    def max_day(self) -> int:
+        """Upper bound of any user's reminder day, as a day number; bounds the index range scans."""
+        return EPOCH_DAY + (self.now_minute + MAX_UTC_OFFSET) // MINUTES_PER_DAY
+
+
+def delivery_clock(now: float | None = None) -> DeliveryClock:
+    now = time.time() if now is None else now
+    return DeliveryClock(
+        now_minute=int(now // 60),
+        default_hour=DEFAULT_DELIVERY_HOUR,
+        default_offset=utc_offset(DEFAULT_TIMEZONE, now),
+        slots_per_hour=DELIVERY_SLOTS_PER_HOUR,
+        slot_minutes=SLOT_MINUTES,
+    )
+
+
+@lru_cache(maxsize=None)
+def _zone(name: str) -> zoneinfo.ZoneInfo:
+    return zoneinfo.ZoneInfo(name)
+
+
+@lru_cache(maxsize=1)
+def _zone_names() -> dict[str, str]:
+    return {name.lower(): name for name in zoneinfo.available_timezones()}
+
+
+def utc_offset(timezone: str | None, at: float | None = None) -> int:
+    """Minutes east of UTC of the timezone (None - the server's) at the unix time `at`."""
+    at = time.time() if at is None else at
+    if timezone is None:
+        moment = datetime.datetime.fromtimestamp(at).astimezone()
+    else:
+        moment = datetime.datetime.fromtimestamp(at, _zone(timezone))
+    return int(moment.utcoffset().total_seconds() // 60)
+
+
+def parse_timezone(text: str) -> str:
+    """IANA name (any case) or a whole-hour UTC offset like UTC+3 / +3. Raises ValueError."""
+    text = text.strip()
+    match = _UTC_OFFSET_RE.match(text)
+    if match:
+        sign, hours = match.group(1), int(match.group(2))
+        if hours > 14 or (sign == "-" and hours > 12):
+            raise ValueError(f"Такого смещения от UTC не бывает: {text}")
+        # Etc/GMT zones have the sign inverted: Etc/GMT-3 is UTC+3
+        return f"Etc/GMT{'-' if sign == '+' else '+'}{hours}" if hours else "UTC"
+    name = _zone_names().get(text.lower())
+    if name is None:
+        raise ValueError(f"Неизвестный часовой пояс: {text}. Пример: Europe/Moscow или UTC+3")
+    return name
+
+
+def parse_hour(text: str) -> int:
+    match = _HOUR_RE.match(text.strip())
+    if not match or int(match.group(1)) > 23:
+        raise ValueError(f"Время напоминаний - целый час от 0 до 23, например 9 или 21:00, а не {text}")
+    return int(match.group(1))
+
+
+def is_hour(text: str) -> bool:
+    return _HOUR_RE.match(text.strip()) is not None
+
+
+def describe_timezone(timezone: str | None) -> str:
+    timezone = timezone or DEFAULT_TIMEZONE
+    offset = utc_offset(timezone)
+    sign = "+" if offset >= 0 else "-"
+    utc = f"UTC{sign}{abs(offset) // 60:02d}:{abs(offset) % 60:02d}"
+    if timezone is None or timezone.startswith("Etc/") or timezone == "UTC":
+        return utc
+    return f"{timezone} ({utc})"
+
+
+def delivery_minute(user_id: int) -> int:
+    """The user's minute inside their delivery hour."""
+    return abs(user_id) % DELIVERY_SLOTS_PER_HOUR * SLOT_MINUTES
+
+
+def slot_of(user_id: int, timezone: str | None, delivery_hour: int | None, at: float | None = None) -> int:
+    """The user's delivery slot now; must match the slot expression of the storage queries."""
+    hour = DEFAULT_DELIVERY_HOUR if delivery_hour is None else delivery_hour
+    offset = utc_offset(timezone or DEFAULT_TIMEZONE, at)
+    return hour * 60 - offset + delivery_minute(user_id)
+
+
+def reminder_day(slot: int, now_minute: int) -> int:
+    """Day number of the latest local date whose delivery slot has come by now_minute."""
+    return EPOCH_DAY + (now_minute - slot) // MINUTES_PER_DAY
+
+
+def slot_time(day: int, slot: int) -> datetime.datetime:
+    """The instant of the slot on a day, as the server's naive local time the scheduler runs on."""
+    return datetime.datetime.fromtimestamp(((day - EPOCH_DAY) * MINUTES_PER_DAY + slot) * 60)
+
+
+def local_today(timezone: str | None) -> datetime.date:
+    if timezone is None and DEFAULT_TIMEZONE is None:
+        return datetime.date.today()
+    return datetime.datetime.now(_zone(timezone or DEFAULT_TIMEZONE)).date()
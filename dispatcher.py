@@ -0,0 +1,136 @@
+import asyncio
+import datetime
+import logging
+import time
+from dataclasses import dataclass
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+
+from metrics import DISPATCH_RETRIES, REMINDERS_SENT
+
+logger = logging.getLogger(__name__)
+
+DISPATCH_CONCURRENCY = 20
+GLOBAL_RATE = 30       # сообщений в секунду на бота
+PER_CHAT_RATE = 1      # сообщений в секунду в один чат
+MAX_ATTEMPTS = 4
+
+SEND_OK = "sent"
+SEND_BLOCKED = "blocked"
+SEND_FAILED = "failed"
+
+
+class TokenBucket:
+    """Async token bucket; waiters are served in FIFO order."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+@dataclass
+class DispatchStats:
+    sent: int = 0
+    failed: int = 0
+    blocked: int = 0
+    retries: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        return self.sent / self.elapsed if self.elapsed else 0.0
+
+
+def _seconds(retry_after) -> float:
+    if isinstance(retry_after, datetime.timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+class ReminderDispatcher:
+    """Sends messages with bounded concurrency under Telegram's global and per-chat limits."""
+
+    def __init__(self, bot, concurrency: int = DISPATCH_CONCURRENCY,
+                 global_rate: float = GLOBAL_RATE, per_chat_rate: float = PER_CHAT_RATE):
+        self.bot = bot
+        self.stats = DispatchStats()
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._global_bucket = TokenBucket(global_rate, global_rate)
+        self._per_chat_rate = per_chat_rate
+        self._chat_buckets: dict[int, TokenBucket] = {}
+        self._started = time.monotonic()
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self._per_chat_rate, 1)
+        return bucket
+
+    async def send(self, chat_id: int, text: str, **kwargs) -> str:
+        """Returns SEND_OK, SEND_BLOCKED (the user blocked the bot or the chat is gone) or SEND_FAILED."""
+        async with self._semaphore:
+            result = await self._send_with_retries(chat_id, text, **kwargs)
+        REMINDERS_SENT.inc(1, result)
+        if result == SEND_OK:
+            self.stats.sent += 1
+        elif result == SEND_BLOCKED:
+            self.stats.blocked += 1
+        else:
+            self.stats.failed += 1
+        return result
+
+    async def _send_with_retries(self, chat_id: int, text: str, **kwargs) -> str:
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            await self._chat_bucket(chat_id).acquire()
+            await self._global_bucket.acquire()
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=text, **kwargs)
+                return SEND_OK
+            except RetryAfter as e:
+                # flood control is per bot, so every sender backs off, not only this one
+                delay = _seconds(e.retry_after)
+                logger.warning("Flood control: пауза %.1f с (чат %s)", delay, chat_id)
+                self._global_bucket.pause(delay)
+            except Forbidden as e:
+                logger.info("Пользователь %s недоступен: %s", chat_id, e)
+                return SEND_BLOCKED
+            except BadRequest as e:
+                if "chat not found" in str(e).lower():
+                    return SEND_BLOCKED
+                logger.error("Telegram отклонил сообщение для чата %s: %s", chat_id, e)
+                return SEND_FAILED
+            except (TimedOut, NetworkError) as e:
+                logger.warning("Сетевая ошибка при отправке в чат %s (попытка %d): %s", chat_id, attempt, e)
+                await asyncio.sleep(min(2 ** attempt, 30))
+            except Exception as e:
+                logger.error("Не удалось отправить сообщение в чат %s: %s", chat_id, e)
+                return SEND_FAILED
+            if attempt < MAX_ATTEMPTS:
+                self.stats.retries += 1
+                DISPATCH_RETRIES.inc()
+        return SEND_FAILED
+
+    def finish(self) -> DispatchStats:
+        self.stats.elapsed = time.monotonic() - self._started
+        return self.stats
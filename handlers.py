@@ -1,18 +1,57 @@
 import datetime
+import io
 import logging
-from telegram import Update
+import tempfile
+from telegram import InlineKeyboardMarkup, InputFile, Update
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes, ConversationHandler, filters
 from telegram.constants import ParseMode
-from db_manager import add_subscription, get_subscribtion_by_user, delete_subscription, update_subscription_after_payment, update_reminder_status, get_subscriptions_for_reminders
+from db_manager import add_subscription, get_subscribtion_by_user, iter_subscriptions, delete_subscription, update_subscription_after_payment, unblock_user, add_reminder_wakeup, set_subscription_period, get_spending_summary, STATS_HORIZON_DAYS, get_subscriptions_page, get_user_settings, set_user_settings, get_exchange_rates
+from delivery import (
+    DEFAULT_DELIVERY_HOUR, delivery_minute, describe_timezone, is_hour, local_today, parse_hour, parse_timezone, slot_of
+)
+from keyboards import (
+    ACTION_DELETE, ACTION_DELETE_CANCEL, ACTION_DELETE_CONFIRM, ACTION_PAGE_PREV, confirm_delete_row, list_keyboard,
+    parse_callback_data, replace_subscription_row, subscription_row
+)
+from metrics import track_handler
+from money import BASE_CURRENCY, Money, format_total, parse_money
+from recurrence import describe_period, parse_period
+from subscription_io import FORMAT_CSV, FORMAT_JSON, detect_format, import_records, open_records, write_export
+from reminder_scheduler import REMINDER_SCHEDULER_KEY, REMINDER_SHARDS, next_reminder_at
 
 ADD_SERVICE_NAME, ADD_AMOUNT, ADD_DATE = range(3)
 
 DELETE_ID, DELETE_CONFIRMATION = range(3, 5)
 
+IMPORT_FILE = 5
+
+# Bot API doesn't let bots download files larger than 20 MB
+IMPORT_MAX_FILE_SIZE = 20 * 1024 * 1024
+IMPORT_MAX_ROWS = 1000
+IMPORT_ERRORS_SHOWN = 10
+
 logger = logging.getLogger(__name__)
 
+async def schedule_reminders(context: ContextTypes.DEFAULT_TYPE, user_id: int, *next_payment_dates: str) -> None:
+    """Tells the reminder scheduler (or, with REMINDER_SHARDS, the user's worker) about new or moved payment dates."""
+    scheduler = context.bot_data.get(REMINDER_SCHEDULER_KEY)
+    if scheduler is None and not REMINDER_SHARDS:
+        return
+    slot = slot_of(user_id, *await get_user_settings(user_id))
+    for next_payment_date in next_payment_dates:
+        if scheduler is not None:
+            scheduler.schedule_subscription(next_payment_date, slot)
+            continue
+        when = next_reminder_at(next_payment_date, 0, slot)
+        if when is not None:
+            await add_reminder_wakeup(user_id, REMINDER_SHARDS, when)
+
+@track_handler
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user = update.effective_user
+    # /start after a block means the user is reachable again
+    await unblock_user(user.id)
     await update.message.reply_text(
         f"Привет, {user.mention_markdown()}!👋\n\n"
         "Я твой личный помощник для отслеживания подписок и регулярных платежей. "
@@ -21,20 +60,32 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         "✨ Добавлять новые подписки: **/add**\n"
         "📋 Показать все твои подписки: **/list**\n"
         "✅ Отметить подписку как оплаченную: **/paid <ID>**\n"
-        "🗑️ Удалить подписку: **/delete <ID>**\n\n"
+        "🔁 Изменить период оплаты: **/period <ID> <период>**\n"
+        "🗑️ Удалить подписку: **/delete <ID>**\n"
+        "📊 Посмотреть расходы: **/stats**\n"
+        "📥 Загрузить или выгрузить подписки файлом: **/import**, **/export**\n"
+        "⚙️ Часовой пояс и время напоминаний: **/settings**\n\n"
         "Если нужна помощь, просто напиши **/help**.",
         parse_mode=ParseMode.MARKDOWN 
     )
 
+@track_handler
 async def help(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     await update.message.reply_text(
         "Вот список команд, которые я понимаю:\n\n"
-        "**/add** - Начать процесс добавления новой подписки. Я попрошу название, сумму и дату следующей оплаты.\n"
-        "**/list** - Показать все твои активные подписки с их ID, названиями, суммами и датами оплаты.\n"
-        "**/paid <ID>** - Отметить подписку как оплаченную. Я перенесу дату оплаты на месяц вперед и сброшу напоминания.\n"
+        "**/add** - Начать процесс добавления новой подписки. Я попрошу название, сумму с валютой (например, `9.99 USD`) и дату следующей оплаты.\n"
+        "**/list** - Показать твои подписки с их ID, суммами и датами оплаты, по 10 на страницу. Кнопки ✅ и 🗑 под списком отмечают оплату и удаляют подписку.\n"
+        "**/paid <ID>** - Отметить подписку как оплаченную. Я перенесу дату оплаты на один период вперед и сброшу напоминания.\n"
         "   _Пример:_ `/paid 123` (где 123 - это ID подписки из /list)\n"
+        "**/period <ID> <период>** - Изменить период оплаты (по умолчанию месяц): неделя, месяц, квартал, год или `14д`, `2н`, `6м`.\n"
+        "   _Пример:_ `/period 123 год`\n"
         "**/delete <ID>** - Удалить подписку из твоего списка.\n"
         "   _Пример:_ `/delete 456`\n"
+        "**/stats** - Сколько уходит на подписки в месяц и в год, ближайшие платежи и самые дорогие сервисы.\n"
+        "**/import** - Загрузить подписки из CSV или JSON файла: отправь команду, а потом сам файл.\n"
+        "**/export** - Выгрузить подписки в CSV файл, `/export json` - в JSON.\n"
+        "**/settings** - Часовой пояс и час, в который приходят напоминания (по умолчанию 10:00).\n"
+        "   _Пример:_ `/settings Europe/Moscow 9` или `/settings UTC+5`\n"
         "**/cancel** - Отменить любую текущую операцию (например, если ты добавляешь подписку, но передумал).\n\n"
         "Если у тебя возникнут вопросы, не стесняйся спрашивать!",
         parse_mode=ParseMode.MARKDOWN 
@@ -42,6 +93,7 @@ async def help(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 # --- Function for command /add (Conversation Handler) ---
 
+@track_handler
 async def add_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Starting add-process and asks for name of serv"""
     await update.message.reply_text(
@@ -52,40 +104,43 @@ async def add_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     )
     return ADD_SERVICE_NAME 
 
+@track_handler
 async def add_service_name(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Getiing name of serv and asking user for summ"""
     context.user_data['service_name'] = update.message.text
     await update.message.reply_text(
-        f"Хорошо, **'{context.user_data['service_name']}'**. Теперь **Шаг 2 из 3:** Введи сумму платежа (например, `9.99` или `100.50`):\n\n"
+        f"Хорошо, **'{context.user_data['service_name']}'**. Теперь **Шаг 2 из 3:** Введи сумму платежа (например, `299`, `9.99 USD` или `9,99€`; без валюты - {BASE_CURRENCY}):\n\n"
         "_Если хочешь отменить, напиши_ **/cancel**.",
         parse_mode=ParseMode.MARKDOWN
     )
     return ADD_AMOUNT
 
+@track_handler
 async def add_amount(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    amount_str = update.message.text
     try:
-        ammount = float(update.message.text.replace('.', '.'))
-        context.user_data['amount'] = ammount
+        amount = parse_money(update.message.text)
+        context.user_data['amount'] = amount
         await update.message.reply_text(
-            f"Понял, сумма: **{ammount:.2f} RUB**. И последний шаг – **Шаг 3 из 3:** Введи дату следующей оплаты в формате ГГГГ-ММ-ДД (например, `2025-07-25`):\n\n"
+            f"Понял, сумма: **{amount}**. И последний шаг – **Шаг 3 из 3:** Введи дату следующей оплаты в формате ГГГГ-ММ-ДД (например, `2025-07-25`):\n\n"
             "_Если хочешь отменить, напиши_ **/cancel**.",
             parse_mode=ParseMode.MARKDOWN
         )
         return ADD_DATE
-    except ValueError:
-        await update.message.reply_text('Это не похоже на число. Пожалуйста, введите сумму цифрами (например, "9.99"):')
+    except ValueError as e:
+        await update.message.reply_text(f"{e}\nПожалуйста, введите сумму еще раз:")
         return ADD_AMOUNT
     
+@track_handler
 async def add_date(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     date_str = update.message.text.strip()
-    logging.info(f"Получена строка даты от пользователя '{date_str}'")
+    logger.debug("Получена строка даты от пользователя '%s'", date_str)
 
     try:
         parsed_date = datetime.datetime.strptime(date_str, '%Y-%m-%d').date()
-        logging.info(f"Дата успешно репарсена: {parsed_date}")
+        logger.debug("Дата успешно репарсена: %s", parsed_date)
 
-        if parsed_date < datetime.date.today():
+        timezone, _ = await get_user_settings(update.effective_user.id)
+        if parsed_date < local_today(timezone):
             await update.message.reply_text("Дата оплаты не может быть в прошлом. Пожалуйста, введите корректную дату.")
             return ADD_DATE
         
@@ -95,22 +150,27 @@ async def add_date(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
             amount=context.user_data['amount'],
             next_payment_date=date_str
         )
+        await schedule_reminders(context, update.effective_user.id, date_str)
         
         await update.message.reply_text(
-            f"Отлично! Подписка **'{context.user_data['service_name']}'** на сумму {context.user_data['amount']} RUB со следующей оплатой **{date_str}** добавлена. "
+            f"Отлично! Подписка **'{context.user_data['service_name']}'** на сумму {context.user_data['amount']} со следующей оплатой **{date_str}** добавлена. "
             "Чтобы посмотреть все свои подписки, используй команду **/list**.",
             parse_mode=ParseMode.MARKDOWN
         )
 
+        # an emptied user_data is dropped from the persisted state
+        context.user_data.pop('service_name', None)
+        context.user_data.pop('amount', None)
         return ConversationHandler.END
     except ValueError as e:
-        logging.info(f"Ошибка парсинга даты '{date_str}': {e}")
+        logger.debug("Ошибка парсинга даты '%s': %s", date_str, e)
         await update.message.reply_text('Неверный формат даты. Пожалуйста, введите дату в формате ГГГГ-ММ-ДД:')
         return ADD_DATE
     
+@track_handler
 async def cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 
-    logging.info(f"Операция отменена пользователем {update.effective_user.id}")
+    logger.info("Операция отменена пользователем %s", update.effective_user.id)
     
     if 'service_name' in context.user_data:
         del context.user_data['service_name']
@@ -120,36 +180,76 @@ async def cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     await update.message.reply_text('Операция отменена. Вы вернулись в главное меню. Теперь можете начать заново.')
     return ConversationHandler.END
 
+@track_handler
 async def cancel_already_in_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
     await update.message.reply_text('Вы уже находитесь в главном меню. Нет активных операций для отмены.')
     
-async def list_subscriptions(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.effective_user.id
-    subscriptions = await get_subscribtion_by_user(user_id)
+async def render_subscriptions_page(user_id: int, cursor: int = 0, backward: bool = False,
+                                    notice: str | None = None) -> tuple[str, InlineKeyboardMarkup | None]:
+    """Text and buttons of a /list page; notice goes on top (the result of a button press)."""
+    subscriptions, has_prev, has_next = await get_subscriptions_page(user_id, cursor, backward)
+    if not subscriptions and cursor:
+        # the page emptied out (deleted from another message): back to the start
+        subscriptions, has_prev, has_next = await get_subscriptions_page(user_id)
+        cursor, backward = 0, False
+
+    logger.debug("Получено %d подписок для пользователя %s", len(subscriptions), user_id)
+    message_parts = [notice + "\n"] if notice else []
+    if not subscriptions:
+        message_parts.append("У вас пока нет активных подписок. Используйте /add для добавления первой!")
+        return "\n".join(message_parts), None
+
+    # the forward cursor that reads this same page again, for re-rendering after a button press
+    page = (subscriptions[0][0] - 1 if has_prev else 0) if backward else cursor
+    message_parts.append("📋 **Твои подписки:**\n")
+    rates = get_exchange_rates()
+    for sub_id, service_name, amount, next_payment_date, period in subscriptions:
+        message_parts.append(
+            f"`{sub_id}` | **{service_name}** | {_with_converted(amount, rates)} | `{next_payment_date}` | "
+            f"{describe_period(period)}"
+        )
+    message_parts.append("\n_Нажми ✅, когда оплатишь подписку, или 🗑, чтобы ее удалить._")
+    return "\n".join(message_parts), list_keyboard(subscriptions, page, has_prev, has_next)
 
-    logger.info(f"Получены подписки для пользователя {user_id} из БД: {subscriptions}")
+def _with_converted(amount: Money, rates) -> str:
+    """The amount, and for other currencies roughly how much it is in BASE_CURRENCY."""
+    factor = rates.factor(amount.currency)
+    if amount.currency == BASE_CURRENCY or factor is None:
+        return str(amount)
+    return f"{amount} (~{format_total(amount.minor * factor)})"
 
-    if not subscriptions:
-        await update.message.reply_text("У вас пока нет активных подписок. Используйте /add для добавления первой!")
-        return
-    
-    message_parts = [
-        "Вот список твоих активных подписок: \n",
-        "**ID | Сервис | Сумма| Следующая оплата**"
-    ]
-    for sub_id, service_name, amount, next_payment_date in subscriptions:
-        message_parts.append(f"`{sub_id}` | **{service_name}** | {amount:.2f} RUB | `{next_payment_date}`") \
+async def _edit_message(query, text: str, reply_markup: InlineKeyboardMarkup | None) -> None:
+    try:
+        await query.edit_message_text(text, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
+    except BadRequest as e:
+        # the same page rendered again
+        if "not modified" not in str(e).lower():
+            raise
 
-    message_parts.append("\n_Чтобы отметить оплату, используй: /paid `<ID>`_\n")
-    message_parts.append("_Чтобы удалить подписку, используй: /delete `<ID>`_\n")
-    message_parts.append("_ID подписки указан в первой колонке_")     
+async def _edit_keyboard(query, reply_markup: InlineKeyboardMarkup | None) -> None:
+    try:
+        await query.edit_message_reply_markup(reply_markup=reply_markup)
+    except BadRequest as e:
+        if "not modified" not in str(e).lower():
+            raise
 
-    await update.message.reply_text(
-        "\n".join(message_parts),
-        parse_mode=ParseMode.MARKDOWN
+@track_handler
+async def list_subscriptions(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    text, reply_markup = await render_subscriptions_page(update.effective_user.id)
+    await update.message.reply_text(text, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
+
+@track_handler
+async def list_page_button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    action, cursor, _, _ = parse_callback_data(query.data)
+    text, reply_markup = await render_subscriptions_page(
+        update.effective_user.id, cursor, backward=action == ACTION_PAGE_PREV
     )
+    await query.answer()
+    await _edit_message(query, text, reply_markup)
 
+@track_handler
 async def delete_subscription_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
  
     user_id = update.effective_user.id
@@ -184,12 +284,12 @@ async def delete_subscription_command(update: Update, context: ContextTypes.DEFA
     else:
         await update.message.reply_text(f"Подписка с ID **{sub_id_to_delete}** не найдена в вашем списке.")
 
+@track_handler
 async def paid_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
     user_id = update.effective_user.id
     args = context.args
 
-    print(f"[DEBUG-HANDLERS] Пользователь {user_id} вызвал /paid.")
 
     if not args:
         await update.message.reply_text(
@@ -210,13 +310,13 @@ async def paid_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 
     success, service_name, new_date_str = await update_subscription_after_payment(user_id, sub_id_to_mark_paid)
 
-    logger.info(f"Пользователь {user_id} пытается отметить подписку ID {sub_id_to_mark_paid} как оплаченную.")
-    print(f"[DEBUG-DB] Поиск подписки: user_id={user_id}, sub_id={sub_id_to_mark_paid}")
+    logger.debug("Пользователь %s отмечает подписку ID %s как оплаченную.", user_id, sub_id_to_mark_paid)
 
     if success:
-        logger.info(f"Подписка ID {sub_id_to_mark_paid} успешно обновлена. Новая дата: {new_date_str}")
+        await schedule_reminders(context, user_id, new_date_str)
+        logger.info("Подписка ID %s успешно обновлена. Новая дата: %s", sub_id_to_mark_paid, new_date_str)
     else:
-        logger.warning(f"Не удалось обновить подписку ID {sub_id_to_mark_paid} для пользователя {user_id}.")
+        logger.warning("Не удалось обновить подписку ID %s для пользователя %s.", sub_id_to_mark_paid, user_id)
 
     if success:
         await update.message.reply_text(
@@ -231,4 +331,251 @@ async def paid_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
             f"Не удалось найти подписку с ID `{sub_id_to_mark_paid}` для твоего аккаунта, или что-то пошло не так.\n"
             "Убедись, что ID правильный. Можешь проверить свои подписки командой **/list**.",
             parse_mode=ParseMode.MARKDOWN
-        )
\ No newline at end of file
+        )
+
+@track_handler
+async def period_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+
+    user_id = update.effective_user.id
+    args = context.args
+
+    if len(args) < 2:
+        await update.message.reply_text(
+            "Пожалуйста, укажите ID подписки и период оплаты. "
+            "Чтобы узнать ID, используйте команду /list.\n"
+            "Пример: `/period 123 год` или `/period 123 2н`"
+        )
+        return
+
+    try:
+        sub_id = int(args[0])
+    except ValueError:
+        await update.message.reply_text(
+            "Неверный формат ID. Пожалуйста, введите числовой ID подписки. "
+            "Пример: `/period 123 месяц`"
+        )
+        return
+
+    try:
+        period = parse_period(" ".join(args[1:]))
+    except ValueError as e:
+        await update.message.reply_text(
+            f"{e}.\nМожно указать: неделя, месяц, квартал, год или число с единицей: `14д`, `2н`, `6м`, `1г`."
+        )
+        return
+
+    if await set_subscription_period(user_id, sub_id, period):
+        logger.info("Период подписки ID %s изменен на %s", sub_id, period.code)
+        await update.message.reply_text(
+            f"🔁 Период подписки с ID **{sub_id}** изменен: {describe_period(period)}. "
+            "После /paid дата оплаты будет переноситься на этот период.",
+            parse_mode=ParseMode.MARKDOWN
+        )
+    else:
+        await update.message.reply_text(f"Подписка с ID **{sub_id}** не найдена в вашем списке.")
+
+@track_handler
+async def import_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    await update.message.reply_text(
+        "📥 Пришли мне файл .csv или .json, и я добавлю из него подписки.\n\n"
+        "**CSV:** первая строка - заголовок, разделитель запятая или точка с запятой:\n"
+        "`service_name,amount,currency,next_payment_date,period`\n"
+        "`Netflix,9.99,USD,2025-07-25,месяц`\n\n"
+        "**JSON:** массив объектов с теми же полями:\n"
+        "`[{\"service_name\": \"Netflix\", \"amount\": 9.99, \"currency\": \"USD\", \"next_payment_date\": \"2025-07-25\"}]`\n\n"
+        f"Колонки currency (по умолчанию {BASE_CURRENCY}) и period (по умолчанию месяц) необязательны. За раз - до {IMPORT_MAX_ROWS} подписок. "
+        "Файл в таком формате выдает команда /export. Передумал - отправь /cancel.",
+        parse_mode=ParseMode.MARKDOWN
+    )
+    return IMPORT_FILE
+
+@track_handler
+async def import_document(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    user_id = update.effective_user.id
+    document = update.message.document
+    file_format = detect_format(document.file_name)
+
+    if file_format is None:
+        await update.message.reply_text("Я понимаю только файлы .csv и .json. Пришли другой файл или /cancel.")
+        return IMPORT_FILE
+    if document.file_size and document.file_size > IMPORT_MAX_FILE_SIZE:
+        await update.message.reply_text("Файл слишком большой: Telegram дает ботам скачивать файлы до 20 МБ.")
+        return IMPORT_FILE
+
+    telegram_file = await document.get_file()
+    data = await telegram_file.download_as_bytearray()
+    text = io.TextIOWrapper(io.BytesIO(data), encoding="utf-8-sig", newline="")
+
+    try:
+        report = await import_records(open_records(text, file_format), user_id=user_id, max_rows=IMPORT_MAX_ROWS)
+    except UnicodeDecodeError:
+        await update.message.reply_text("Не удалось прочитать файл: сохрани его в кодировке UTF-8 и пришли снова.")
+        return IMPORT_FILE
+    except ValueError as e:
+        await update.message.reply_text(f"Не удалось прочитать файл: {e}. Исправь его и пришли снова или /cancel.")
+        return IMPORT_FILE
+
+    logger.info("Импорт для пользователя %s: добавлено %d, ошибок %d", user_id, report.imported, report.error_count)
+    await schedule_reminders(context, user_id, *report.dates)
+
+    message_parts = [f"📥 Добавлено подписок: {report.imported}."]
+    if report.error_count:
+        message_parts.append(f"Пропущено строк с ошибками: {report.error_count}.")
+        message_parts.extend(
+            f"Строка {line}: {message}" for line, message in report.errors[:IMPORT_ERRORS_SHOWN]
+        )
+        if report.error_count > IMPORT_ERRORS_SHOWN:
+            message_parts.append(f"...и еще {report.error_count - IMPORT_ERRORS_SHOWN}.")
+    if report.imported:
+        message_parts.append("Посмотреть подписки: /list")
+    # no markdown: error messages quote the file's contents
+    await update.message.reply_text("\n".join(message_parts))
+    return ConversationHandler.END
+
+@track_handler
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    user_id = update.effective_user.id
+    file_format = FORMAT_JSON if context.args and context.args[0].lower() == FORMAT_JSON else FORMAT_CSV
+
+    # written page by page into a temporary file, so a long list is never held in memory as a whole
+    with tempfile.TemporaryFile() as buffer:
+        # utf-8-sig: Excel opens the CSV with the right encoding
+        text = io.TextIOWrapper(buffer, encoding="utf-8-sig" if file_format == FORMAT_CSV else "utf-8", newline="")
+        count = await write_export(iter_subscriptions(user_id), file_format, text)
+        text.flush()
+        text.detach()
+
+        if not count:
+            await update.message.reply_text("У вас пока нет подписок для выгрузки. Используйте /add или /import.")
+            return
+
+        buffer.seek(0)
+        await update.message.reply_document(
+            document=InputFile(buffer, filename=f"subscriptions.{file_format}"),
+            caption=f"Подписок: {count}. Этот файл можно загрузить обратно через /import."
+        )
+
+@track_handler
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    user_id = update.effective_user.id
+    timezone, _ = await get_user_settings(user_id)
+    summary = await get_spending_summary(user_id, today=local_today(timezone))
+
+    if not summary.subscriptions:
+        await update.message.reply_text("У вас пока нет активных подписок. Используйте /add для добавления первой!")
+        return
+
+    message_parts = [
+        "📊 **Твои расходы на подписки**\n",
+        f"Подписок: {summary.subscriptions}",
+        f"В месяц: ~{format_total(summary.monthly_total)}",
+        f"В год: ~{format_total(summary.monthly_total * 12)}",
+        f"К оплате в ближайшие {STATS_HORIZON_DAYS} дней: {format_total(summary.upcoming_total)}",
+    ]
+    if summary.overdue_total:
+        message_parts.append(f"🚨 Просрочено: {format_total(summary.overdue_total)}")
+
+    message_parts.append("\n**Больше всего уходит на:**")
+    for place, (service_name, subscriptions, monthly_total) in enumerate(summary.top_services, 1):
+        count = f" ({subscriptions} шт.)" if subscriptions > 1 else ""
+        message_parts.append(f"{place}. **{service_name}**{count} - {format_total(monthly_total)} в месяц")
+
+    message_parts.append("\n_Недельные и годовые подписки пересчитаны в месяц._")
+    if summary.unconverted:
+        message_parts.append(
+            f"_Нет курса для {', '.join(summary.unconverted)}: эти подписки не вошли в суммы в {BASE_CURRENCY}._"
+        )
+    await update.message.reply_text("\n".join(message_parts), parse_mode=ParseMode.MARKDOWN)
+
+@track_handler
+async def settings_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    user_id = update.effective_user.id
+    timezone, delivery_hour = await get_user_settings(user_id)
+
+    if context.args:
+        try:
+            for arg in context.args:
+                if is_hour(arg):
+                    delivery_hour = parse_hour(arg)
+                else:
+                    timezone = parse_timezone(arg)
+        except ValueError as e:
+            # no Markdown: the message quotes what the user typed
+            await update.message.reply_text(f"❌ {e}")
+            return
+        await set_user_settings(user_id, timezone, delivery_hour)
+        logger.info("Пользователь %s: часовой пояс %s, час напоминаний %s", user_id, timezone, delivery_hour)
+        # reminders already planned for the old slot move to the new one
+        await schedule_reminders(context, user_id, *{sub[3] for sub in await get_subscribtion_by_user(user_id)})
+        header = "✅ **Настройки сохранены.**"
+    else:
+        header = "⚙️ **Настройки напоминаний**"
+
+    hour = DEFAULT_DELIVERY_HOUR if delivery_hour is None else delivery_hour
+    await update.message.reply_text(
+        f"{header}\n\n"
+        f"Часовой пояс: `{describe_timezone(timezone)}`\n"
+        f"Напоминания приходят в {hour:02d}:{delivery_minute(user_id):02d} по твоему времени.\n\n"
+        "Чтобы изменить, укажи часовой пояс и/или час: `/settings Europe/Moscow`, `/settings UTC+5`, "
+        "`/settings 9` или `/settings Asia/Yekaterinburg 21`.",
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+@track_handler
+async def paid_button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    user_id = update.effective_user.id
+    _, sub_id, page, day = parse_callback_data(query.data)
+    shown_date = datetime.date.fromordinal(day).isoformat()
+
+    success, service_name, new_date_str = await update_subscription_after_payment(user_id, sub_id, shown_date)
+    if success:
+        await schedule_reminders(context, user_id, new_date_str)
+        logger.info("Подписка ID %s отмечена оплаченной кнопкой. Новая дата: %s", sub_id, new_date_str)
+        notice = f"✅ Оплата «{service_name}» подтверждена. Следующая оплата: {new_date_str}"
+    elif service_name is not None:
+        notice = f"Оплата «{service_name}» уже отмечена. Следующая оплата: {new_date_str}"
+    else:
+        notice = "Подписка не найдена: возможно, она уже удалена."
+
+    await query.answer(notice)
+    if page is None:
+        # a reminder: its buttons for this subscription have done their job
+        await _edit_keyboard(query, replace_subscription_row(query.message.reply_markup, sub_id, None))
+    else:
+        text, reply_markup = await render_subscriptions_page(user_id, page, notice=notice)
+        await _edit_message(query, text, reply_markup)
+
+@track_handler
+async def delete_button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    user_id = update.effective_user.id
+    action, sub_id, page, _ = parse_callback_data(query.data)
+
+    if action == ACTION_DELETE:
+        await query.answer("Удалить подписку? Подтверди кнопкой ниже.")
+        await _edit_keyboard(
+            query, replace_subscription_row(query.message.reply_markup, sub_id, confirm_delete_row(sub_id, page))
+        )
+        return
+
+    notice = None
+    if action == ACTION_DELETE_CONFIRM:
+        deleted = await delete_subscription(user_id, sub_id)
+        notice = f"🗑 Подписка с ID {sub_id} удалена." if deleted else f"Подписка с ID {sub_id} уже удалена."
+        await query.answer(notice)
+    else:
+        await query.answer("Удаление отменено.")
+
+    if page is not None:
+        text, reply_markup = await render_subscriptions_page(user_id, page, notice=notice)
+        await _edit_message(query, text, reply_markup)
+        return
+
+    row = None
+    if action == ACTION_DELETE_CANCEL:
+        # a reminder: put the subscription's buttons back, if it still exists
+        for sub in await get_subscribtion_by_user(user_id):
+            if sub[0] == sub_id:
+                row = subscription_row(sub_id, sub[1], sub[3])
+    await _edit_keyboard(query, replace_subscription_row(query.message.reply_markup, sub_id, row))
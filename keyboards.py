@@ -0,0 +1,103 @@
+"""Inline keyboards for /list pages and reminders, and their callback data.
+
+Callback data is "<action>:<sub_id or cursor>:<page cursor>[:<payment day>]", well under Telegram's
+64 bytes. The page cursor is what the current /list page was read after; it is empty on buttons
+of a reminder message. The Paid button carries the payment date it was shown for, so a second
+tap doesn't move the date one more period.
+"""
+import datetime
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+# two buttons per subscription, Telegram allows 100 per message
+MAX_KEYBOARD_ITEMS = 50
+BUTTON_NAME_LENGTH = 24
+
+ACTION_PAGE_NEXT = "ln"  # page after the cursor id
+ACTION_PAGE_PREV = "lp"  # page before the cursor id
+ACTION_PAID = "pd"
+ACTION_DELETE = "dl"  # asks for confirmation
+ACTION_DELETE_CONFIRM = "dy"
+ACTION_DELETE_CANCEL = "dn"
+
+# patterns for CallbackQueryHandler
+PAGE_PATTERN = rf"^(?:{ACTION_PAGE_NEXT}|{ACTION_PAGE_PREV}):\d+:$"
+PAID_PATTERN = rf"^{ACTION_PAID}:\d+:\d*:\d+$"
+DELETE_PATTERN = rf"^(?:{ACTION_DELETE}|{ACTION_DELETE_CONFIRM}|{ACTION_DELETE_CANCEL}):\d+:\d*$"
+
+
+def callback_data(action: str, value: int, page: int | None = None, day: int | None = None) -> str:
+    data = f"{action}:{value}:{'' if page is None else page}"
+    return data if day is None else f"{data}:{day}"
+
+
+def parse_callback_data(data: str) -> tuple[str, int, int | None, int | None]:
+    """(action, sub_id or cursor, page cursor, payment day number); absent parts are None."""
+    action, value, page, *day = data.split(":")
+    return action, int(value), int(page) if page else None, int(day[0]) if day else None
+
+
+def _button_name(service_name: str) -> str:
+    if len(service_name) <= BUTTON_NAME_LENGTH:
+        return service_name
+    return service_name[:BUTTON_NAME_LENGTH - 1] + "…"
+
+
+def subscription_row(sub_id: int, service_name: str, next_payment_date: str,
+                     page: int | None = None) -> list[InlineKeyboardButton]:
+    day = datetime.date.fromisoformat(next_payment_date).toordinal()
+    return [
+        InlineKeyboardButton(
+            f"✅ {_button_name(service_name)}", callback_data=callback_data(ACTION_PAID, sub_id, page, day)
+        ),
+        InlineKeyboardButton("🗑 Удалить", callback_data=callback_data(ACTION_DELETE, sub_id, page)),
+    ]
+
+
+def list_keyboard(subscriptions: list[tuple], page: int, has_prev: bool, has_next: bool) -> InlineKeyboardMarkup:
+    """Buttons for a /list page of get_subscriptions_page() rows read after the page cursor."""
+    rows = [subscription_row(sub[0], sub[1], sub[3], page) for sub in subscriptions]
+    navigation = []
+    if has_prev:
+        navigation.append(
+            InlineKeyboardButton("◀ Назад", callback_data=callback_data(ACTION_PAGE_PREV, subscriptions[0][0]))
+        )
+    if has_next:
+        navigation.append(
+            InlineKeyboardButton("Вперед ▶", callback_data=callback_data(ACTION_PAGE_NEXT, subscriptions[-1][0]))
+        )
+    if navigation:
+        rows.append(navigation)
+    return InlineKeyboardMarkup(rows)
+
+
+def reminder_keyboard(items: list[tuple[int, str, str]]) -> InlineKeyboardMarkup:
+    """Buttons for a reminder about (sub_id, service_name, next_payment_date) items."""
+    return InlineKeyboardMarkup([subscription_row(*item) for item in items])
+
+
+def confirm_delete_row(sub_id: int, page: int | None) -> list[InlineKeyboardButton]:
+    return [
+        InlineKeyboardButton("Да, удалить", callback_data=callback_data(ACTION_DELETE_CONFIRM, sub_id, page)),
+        InlineKeyboardButton("Отмена", callback_data=callback_data(ACTION_DELETE_CANCEL, sub_id, page)),
+    ]
+
+
+def _row_sub_id(row) -> int | None:
+    """The subscription a keyboard row acts on, None for the navigation row."""
+    action, value, _, _ = parse_callback_data(row[0].callback_data)
+    return None if action in (ACTION_PAGE_NEXT, ACTION_PAGE_PREV) else value
+
+
+def replace_subscription_row(markup: InlineKeyboardMarkup | None, sub_id: int,
+                             row: list[InlineKeyboardButton] | None) -> InlineKeyboardMarkup | None:
+    """The keyboard with the buttons of sub_id swapped for row (dropped if None); None when nothing is left."""
+    if markup is None:
+        return None
+    rows = []
+    for current in markup.inline_keyboard:
+        if _row_sub_id(current) != sub_id:
+            rows.append(list(current))
+        elif row is not None:
+            rows.append(row)
+    return InlineKeyboardMarkup(rows) if rows else None
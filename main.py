@@ -6,6 +6,7 @@ import asyncio
 from telegram import Update
 from telegram.ext import (
     ApplicationBuilder,
+    CallbackQueryHandler,
     CommandHandler, 
     ContextTypes,
     ConversationHandler,
@@ -13,40 +14,110 @@ from telegram.ext import (
     filters
 )
 
-from db_manager import create_table
+from db_manager import run_migrations, init_pool, close_pool
 
 import handlers
+import keyboards
+from persistence import DatabasePersistence
 
-from reminder_scheduler import check_and_send_reminders 
+from rates import RATES_REFRESH_INTERVAL, refresh_rates, refresh_rates_job
+from reminder_scheduler import ReminderScheduler, REMINDER_SCHEDULER_KEY, REMINDER_SHARDS
+from metrics import start_metrics_server
 
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
+    level=os.getenv("LOG_LEVEL", "INFO").upper()
 )
 logging.getLogger("httpx").setLevel(logging.WARNING)
 
 TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # 0 - не поднимать /metrics
+
+BOT_MODE = os.getenv("BOT_MODE", "polling")  # polling | webhook
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # публичный https-адрес; без него собирается из listen/port/path
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "1"))
+TELEGRAM_BASE_URL = os.getenv("TELEGRAM_BASE_URL")  # например, локальный Bot API: http://127.0.0.1:8081/bot
+
+# messages and inline button presses (Paid/Delete, /list pages); other update types are not even fetched
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY]
+
+METRICS_SERVER_KEY = "metrics_server"
 
 async def post_init(application):
-    await create_table()
-    logging.info("База данных и таблица подписок проверены/созданы.")
+    await init_pool()
+    await run_migrations()
+    logging.info("База данных и схема подписок проверены/обновлены.")
 
-    application.job_queue.run_repeating(check_and_send_reminders, interval=3600*4, first=10, data="periodic_check")
-    logging.info("Задача проверки напоминаний запланирована.")
+    await refresh_rates()
+    if application.job_queue is not None:
+        application.job_queue.run_repeating(
+            refresh_rates_job, interval=RATES_REFRESH_INTERVAL, first=RATES_REFRESH_INTERVAL, name="exchange_rates"
+        )
+    else:
+        logging.warning("JobQueue недоступна (pip install \"python-telegram-bot[job-queue]\"): курсы валют не обновляются.")
 
-def main():
+    if REMINDER_SHARDS:
+        # two processes sweeping the same users would send everything twice
+        logging.info("Напоминания рассылают воркеры reminder_worker.py (%d шардов).", REMINDER_SHARDS)
+    else:
+        # recovery scans every subscription; updates are answered meanwhile
+        scheduler = ReminderScheduler(application.bot)
+        scheduler.start(recover=True)
+        application.bot_data[REMINDER_SCHEDULER_KEY] = scheduler
+        logging.info("Планировщик напоминаний запущен.")
 
-    if TOKEN is None:
-        print("Ошибка: Токен бота не найденю Установите переменную окружения")
-        return
-    
-    application = ApplicationBuilder().token(TOKEN).post_init(post_init).build()
+    if METRICS_PORT:
+        try:
+            application.bot_data[METRICS_SERVER_KEY] = await start_metrics_server(METRICS_HOST, METRICS_PORT)
+        except OSError as e:
+            # the port may be taken by another bot process on the host; the bot works without /metrics
+            logging.error("Не удалось открыть метрики на %s:%d: %s", METRICS_HOST, METRICS_PORT, e)
+
+async def post_stop(application):
+    # before Application.shutdown() closes the bot, so a sweep is never left sending through a closed bot
+    scheduler = application.bot_data.get(REMINDER_SCHEDULER_KEY)
+    if scheduler is not None:
+        await scheduler.stop()
+
+async def post_shutdown(application):
+    metrics_server = application.bot_data.get(METRICS_SERVER_KEY)
+    if metrics_server is not None:
+        metrics_server.close()
+        await metrics_server.wait_closed()
+    await close_pool()
+
+def build_application(token: str, base_url: str | None = TELEGRAM_BASE_URL,
+                      concurrent_updates: int = CONCURRENT_UPDATES):
+    builder = (
+        ApplicationBuilder()
+        .token(token)
+        .concurrent_updates(concurrent_updates)
+        .persistence(DatabasePersistence())
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+    )
+    if base_url:
+        builder = builder.base_url(base_url)
+    application = builder.build()
 
     start_handler = CommandHandler('start', handlers.start)
     help_handler = CommandHandler('help', handlers.help)
     list_handler = CommandHandler('list', handlers.list_subscriptions)
     cancel_in_main_menu_handler = CommandHandler('cancel', handlers.cancel_already_in_main_menu)
     paid_handler = CommandHandler('paid',handlers.paid_command)
+    period_handler = CommandHandler('period', handlers.period_command)
+    export_handler = CommandHandler('export', handlers.export_command)
+    stats_handler = CommandHandler('stats', handlers.stats_command)
+    settings_handler = CommandHandler('settings', handlers.settings_command)
+    list_page_handler = CallbackQueryHandler(handlers.list_page_button, pattern=keyboards.PAGE_PATTERN)
+    paid_button_handler = CallbackQueryHandler(handlers.paid_button, pattern=keyboards.PAID_PATTERN)
+    delete_button_handler = CallbackQueryHandler(handlers.delete_button, pattern=keyboards.DELETE_PATTERN)
     add_conversation_handler = ConversationHandler(
         entry_points=[CommandHandler('add', handlers.add_start)],
         states={
@@ -54,20 +125,65 @@ def main():
             handlers.ADD_AMOUNT: [MessageHandler(filters.TEXT & ~filters.COMMAND, handlers.add_amount)],
             handlers.ADD_DATE: [MessageHandler(filters.TEXT & ~filters.COMMAND, handlers.add_date)],
         },
-        fallbacks=[CommandHandler('cancel', handlers.cancel_command)]
+        fallbacks=[CommandHandler('cancel', handlers.cancel_command)],
+        # survives restarts, along with the answers collected so far in user_data
+        name="add_subscription",
+        persistent=True,
+    )
+    # a file is only imported right after /import, not whenever a document arrives
+    import_conversation_handler = ConversationHandler(
+        entry_points=[CommandHandler('import', handlers.import_command)],
+        states={
+            handlers.IMPORT_FILE: [MessageHandler(filters.Document.ALL, handlers.import_document)],
+        },
+        fallbacks=[CommandHandler('cancel', handlers.cancel_command)],
     )
     delete_handler = CommandHandler('delete', handlers.delete_subscription_command)
 
     application.add_handler(start_handler)
     application.add_handler(help_handler)
     application.add_handler(add_conversation_handler)
+    application.add_handler(import_conversation_handler)
     application.add_handler(list_handler)
     application.add_handler(delete_handler)
     application.add_handler(cancel_in_main_menu_handler)
     application.add_handler(paid_handler)
+    application.add_handler(period_handler)
+    application.add_handler(export_handler)
+    application.add_handler(stats_handler)
+    application.add_handler(settings_handler)
+    application.add_handler(list_page_handler)
+    application.add_handler(paid_button_handler)
+    application.add_handler(delete_button_handler)
+    return application
+
+def main():
+
+    if TOKEN is None:
+        logging.error("Ошибка: Токен бота не найден. Установите переменную окружения TELEGRAM_BOT_TOKEN")
+        return
+
+    application = build_application(TOKEN)
+
+    if BOT_MODE == "webhook":
+        if not WEBHOOK_SECRET:
+            logging.error("Ошибка: для режима webhook задайте WEBHOOK_SECRET")
+            return
+        logging.info("Бот запущен в режиме webhook на %s:%d/%s. Ctrl+C для остановки работы.",
+                     WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH)
+        # Telegram must send the secret in X-Telegram-Bot-Api-Secret-Token, other requests get 403
+        application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=ALLOWED_UPDATES,
+        )
+        return
 
     logging.info("Бот запущен. Ctrl+C для остановки работы.")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    application.run_polling(allowed_updates=ALLOWED_UPDATES)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,583 @@
+"""Versioned schema of the bot database.
+
+Steps are append-only: a released step is never edited, a new one is added instead.
+SQLite stores dates as day numbers (datetime.date.toordinal()); PostgreSQL uses DATE.
+POSTGRES_MIGRATIONS starts at the SQLite version it matches, so both backends share version numbers.
+"""
+
+SCHEMA_VERSION_TABLE = '''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_at TEXT NOT NULL DEFAULT (datetime('now'))
+    )
+'''
+
+# julianday('0001-01-01') == 1721425.5, date(1, 1, 1).toordinal() == 1
+_TEXT_TO_DAY = "CAST(julianday(next_payment_date) - 1721424.5 AS INTEGER)"
+
+
+# 30.4375 days in an average month; cost of one subscription per month for each period unit
+def _monthly_cost(row: str, amount: str = "amount") -> str:
+    return (
+        f"(COALESCE({row}.{amount}, 0) * CASE {row}.period_unit "
+        f"WHEN 'd' THEN 30.4375 WHEN 'w' THEN 30.4375 / 7 WHEN 'y' THEN 1.0 / 12 ELSE 1.0 END "
+        f"/ {row}.period_count)"
+    )
+
+
+# (table, key columns, the row's key values, counted value) of every spending aggregate;
+# since version 10 they are kept per currency, in minor units
+def _spending_aggregates(row: str, by_currency: bool = False) -> list[tuple[str, str, str, str]]:
+    amount = "amount_minor" if by_currency else "amount"
+    keys, values = (", currency", f", {row}.currency") if by_currency else ("", "")
+    return [
+        ("spending_by_user", f"user_id{keys}", f"{row}.user_id{values}", _monthly_cost(row, amount)),
+        ("spending_by_service", f"user_id, service_name{keys}", f"{row}.user_id, {row}.service_name{values}",
+         _monthly_cost(row, amount)),
+        ("spending_by_day", f"user_id, day{keys}", f"{row}.user_id, {row}.next_payment_date{values}",
+         f"COALESCE({row}.{amount}, 0)"),
+        ("spending_global_by_service", f"service_name{keys}", f"{row}.service_name{values}",
+         _monthly_cost(row, amount)),
+        ("spending_global_by_day", f"day{keys}", f"{row}.next_payment_date{values}", f"COALESCE({row}.{amount}, 0)"),
+    ]
+
+
+def _spending_statements(row: str, sign: int, by_currency: bool = False) -> str:
+    """Trigger body: adds (sign=1) or removes (sign=-1) a subscription row from every aggregate."""
+    statements = []
+    for table, keys, values, value in _spending_aggregates(row, by_currency):
+        column = "total" if table.endswith("_by_day") else "monthly_total"
+        statements.append(
+            f"INSERT INTO {table} ({keys}, subscriptions, {column}) VALUES ({values}, {sign}, {sign} * {value}) "
+            f"ON CONFLICT ({keys}) DO UPDATE SET subscriptions = {table}.subscriptions + excluded.subscriptions, "
+            f"{column} = {table}.{column} + excluded.{column};"
+        )
+        if sign < 0:
+            condition = " AND ".join(f"{key} = {v}" for key, v in zip(keys.split(", "), values.split(", ")))
+            statements.append(f"DELETE FROM {table} WHERE {condition} AND subscriptions <= 0;")
+    return "\n".join(statements)
+
+
+_SPENDING_COLUMNS = "user_id, service_name, amount, next_payment_date, period_unit, period_count"
+_CURRENCY_SPENDING_COLUMNS = "user_id, service_name, amount_minor, currency, next_payment_date, period_unit, period_count"
+
+# amount REAL -> amount_minor in kopecks; amounts so far were all in rubles
+_AMOUNT_TO_MINOR = "CAST(round(COALESCE(amount, 0) * 100) AS INTEGER)"
+
+# spending aggregates recomputed from subscriptions, per currency
+_SPENDING_BACKFILL = (
+    f"INSERT INTO spending_by_user SELECT user_id, currency, COUNT(*), "
+    f"SUM({_monthly_cost('subscriptions', 'amount_minor')}) FROM subscriptions GROUP BY user_id, currency",
+    f"INSERT INTO spending_by_service SELECT user_id, service_name, currency, COUNT(*), "
+    f"SUM({_monthly_cost('subscriptions', 'amount_minor')}) FROM subscriptions GROUP BY user_id, service_name, currency",
+    "INSERT INTO spending_by_day SELECT user_id, next_payment_date, currency, COUNT(*), SUM(amount_minor) "
+    "FROM subscriptions GROUP BY user_id, next_payment_date, currency",
+    f"INSERT INTO spending_global_by_service SELECT service_name, currency, COUNT(*), "
+    f"SUM({_monthly_cost('subscriptions', 'amount_minor')}) FROM subscriptions GROUP BY service_name, currency",
+    "INSERT INTO spending_global_by_day SELECT next_payment_date, currency, COUNT(*), SUM(amount_minor) "
+    "FROM subscriptions GROUP BY next_payment_date, currency",
+)
+
+_SPENDING_TABLES = (
+    "spending_by_user", "spending_by_service", "spending_by_day", "spending_global_by_service", "spending_global_by_day",
+)
+
+
+MIGRATIONS = [
+    (1, "таблица subscriptions", (
+        '''
+        CREATE TABLE IF NOT EXISTS subscriptions (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            service_name TEXT NOT NULL,
+            amount REAL,
+            next_payment_date TEXT NOT NULL,
+            reminder_status INTEGER DEFAULT 0 -- 0-ничего, 1-за 3 дня, 2-за 1 день, 3-просрочка
+        )
+        ''',
+    )),
+    (2, "даты оплаты как номера дней", (
+        '''
+        CREATE TABLE subscriptions_new (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            service_name TEXT NOT NULL,
+            amount REAL,
+            next_payment_date INTEGER NOT NULL, -- datetime.date.toordinal()
+            reminder_status INTEGER DEFAULT 0 -- 0-ничего, 1-за 3 дня, 2-за 1 день, 3-просрочка
+        )
+        ''',
+        f'''
+        INSERT INTO subscriptions_new (id, user_id, service_name, amount, next_payment_date, reminder_status)
+        SELECT id, user_id, service_name, amount, {_TEXT_TO_DAY}, reminder_status
+        FROM subscriptions
+        ''',
+        "DROP TABLE subscriptions",
+        "ALTER TABLE subscriptions_new RENAME TO subscriptions",
+    )),
+    (3, "индексы по user_id и сроку напоминаний", (
+        "CREATE INDEX IF NOT EXISTS idx_subscriptions_user ON subscriptions (user_id)",
+        '''
+        CREATE INDEX IF NOT EXISTS idx_subscriptions_due
+        ON subscriptions (next_payment_date, reminder_status)
+        WHERE reminder_status < 3
+        ''',
+    )),
+    (4, "таблица users с признаком блокировки бота", (
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            blocked INTEGER NOT NULL DEFAULT 0 -- 1: пользователь заблокировал бота, напоминания не отправляются
+        )
+        ''',
+    )),
+    (5, "outbox напоминаний", (
+        '''
+        CREATE TABLE IF NOT EXISTS reminder_outbox (
+            id INTEGER PRIMARY KEY,
+            idempotency_key TEXT NOT NULL UNIQUE, -- sub_id:next_payment_date:reminder_status
+            sub_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            service_name TEXT NOT NULL,
+            amount REAL,
+            next_payment_date INTEGER NOT NULL,
+            reminder_status INTEGER NOT NULL, -- статус, который это напоминание выставило подписке
+            state INTEGER NOT NULL DEFAULT 0, -- 0-ожидает, 1-отправляется, 2-доставлено, 3-ошибка, 4-бот заблокирован, 5-отменено
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL DEFAULT (datetime('now')),
+            sent_at TEXT
+        )
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_outbox_active
+        ON reminder_outbox (state, user_id)
+        WHERE state < 2
+        ''',
+    )),
+    (6, "аренда шардов для воркеров напоминаний", (
+        '''
+        CREATE TABLE IF NOT EXISTS reminder_shards (
+            shard INTEGER PRIMARY KEY, -- abs(user_id) % число шардов
+            owner TEXT, -- id воркера, NULL - шард свободен
+            lease_until REAL NOT NULL DEFAULT 0 -- unix time; после него шард может забрать другой воркер
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS reminder_workers (
+            worker_id TEXT PRIMARY KEY,
+            heartbeat_until REAL NOT NULL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS reminder_wakeups (
+            shard INTEGER NOT NULL,
+            wake_at TEXT NOT NULL, -- локальное время, когда воркеру шарда нужно проверить напоминания
+            PRIMARY KEY (shard, wake_at)
+        ) WITHOUT ROWID
+        ''',
+    )),
+    (7, "период подписки и якорный день оплаты", (
+        "ALTER TABLE subscriptions ADD COLUMN period_unit TEXT NOT NULL DEFAULT 'm'",  # d, w, m, y (recurrence.py)
+        "ALTER TABLE subscriptions ADD COLUMN period_count INTEGER NOT NULL DEFAULT 1",
+        "ALTER TABLE subscriptions ADD COLUMN anchor_day INTEGER",  # день месяца для помесячных периодов
+        "UPDATE subscriptions SET anchor_day = CAST(strftime('%d', next_payment_date + 1721424.5) AS INTEGER)",
+        # only subscriptions that already got the overdue reminder, for auto-advance
+        '''
+        CREATE INDEX IF NOT EXISTS idx_subscriptions_overdue
+        ON subscriptions (next_payment_date)
+        WHERE reminder_status = 3
+        ''',
+    )),
+    (8, "агрегаты расходов для /stats", (
+        '''
+        CREATE TABLE IF NOT EXISTS spending_by_user (
+            user_id INTEGER PRIMARY KEY,
+            subscriptions INTEGER NOT NULL,
+            monthly_total REAL NOT NULL  -- приведенная к месяцу стоимость всех подписок
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS spending_by_service (
+            user_id INTEGER NOT NULL,
+            service_name TEXT NOT NULL,
+            subscriptions INTEGER NOT NULL,
+            monthly_total REAL NOT NULL,
+            PRIMARY KEY (user_id, service_name)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS spending_by_day (
+            user_id INTEGER NOT NULL,
+            day INTEGER NOT NULL,  -- next_payment_date
+            subscriptions INTEGER NOT NULL,
+            total REAL NOT NULL,
+            PRIMARY KEY (user_id, day)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS spending_global_by_service (
+            service_name TEXT PRIMARY KEY,
+            subscriptions INTEGER NOT NULL,
+            monthly_total REAL NOT NULL
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS spending_global_by_day (
+            day INTEGER PRIMARY KEY,
+            subscriptions INTEGER NOT NULL,
+            total REAL NOT NULL
+        )
+        ''',
+        # the aggregates are updated in the same transaction as subscriptions, whatever the write path
+        f"CREATE TRIGGER subscriptions_spending_insert AFTER INSERT ON subscriptions BEGIN\n"
+        f"{_spending_statements('NEW', 1)}\nEND",
+        f"CREATE TRIGGER subscriptions_spending_delete AFTER DELETE ON subscriptions BEGIN\n"
+        f"{_spending_statements('OLD', -1)}\nEND",
+        # reminder_status updates don't touch the aggregates
+        f"CREATE TRIGGER subscriptions_spending_update AFTER UPDATE OF {_SPENDING_COLUMNS} ON subscriptions BEGIN\n"
+        f"{_spending_statements('OLD', -1)}\n{_spending_statements('NEW', 1)}\nEND",
+        f"INSERT INTO spending_by_user SELECT user_id, COUNT(*), SUM({_monthly_cost('subscriptions')}) "
+        f"FROM subscriptions GROUP BY user_id",
+        f"INSERT INTO spending_by_service SELECT user_id, service_name, COUNT(*), SUM({_monthly_cost('subscriptions')}) "
+        f"FROM subscriptions GROUP BY user_id, service_name",
+        "INSERT INTO spending_by_day SELECT user_id, next_payment_date, COUNT(*), SUM(COALESCE(amount, 0)) "
+        "FROM subscriptions GROUP BY user_id, next_payment_date",
+        f"INSERT INTO spending_global_by_service SELECT service_name, COUNT(*), SUM({_monthly_cost('subscriptions')}) "
+        f"FROM subscriptions GROUP BY service_name",
+        "INSERT INTO spending_global_by_day SELECT next_payment_date, COUNT(*), SUM(COALESCE(amount, 0)) "
+        "FROM subscriptions GROUP BY next_payment_date",
+    )),
+    (9, "часовой пояс и время напоминаний пользователя", (
+        "ALTER TABLE users ADD COLUMN timezone TEXT",  # имя IANA, NULL - DEFAULT_TIMEZONE
+        "ALTER TABLE users ADD COLUMN delivery_hour INTEGER",  # местный час, NULL - DEFAULT_DELIVERY_HOUR
+        "ALTER TABLE users ADD COLUMN utc_offset INTEGER",  # смещение timezone от UTC в минутах, обновляется проверкой напоминаний
+        "CREATE INDEX IF NOT EXISTS idx_users_timezone ON users (timezone) WHERE timezone IS NOT NULL",
+    )),
+    (10, "суммы в минимальных единицах валюты, валюта подписки, курсы валют", (
+        "DROP TRIGGER subscriptions_spending_insert",
+        "DROP TRIGGER subscriptions_spending_delete",
+        "DROP TRIGGER subscriptions_spending_update",
+        *(f"DROP TABLE {table}" for table in _SPENDING_TABLES),
+        "ALTER TABLE subscriptions ADD COLUMN amount_minor INTEGER NOT NULL DEFAULT 0",  # копейки, центы
+        "ALTER TABLE subscriptions ADD COLUMN currency TEXT NOT NULL DEFAULT 'RUB'",  # код ISO 4217
+        f"UPDATE subscriptions SET amount_minor = {_AMOUNT_TO_MINOR}",
+        "ALTER TABLE subscriptions DROP COLUMN amount",
+        "ALTER TABLE reminder_outbox ADD COLUMN amount_minor INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE reminder_outbox ADD COLUMN currency TEXT NOT NULL DEFAULT 'RUB'",
+        f"UPDATE reminder_outbox SET amount_minor = {_AMOUNT_TO_MINOR}",
+        "ALTER TABLE reminder_outbox DROP COLUMN amount",
+        '''
+        CREATE TABLE spending_by_user (
+            user_id INTEGER NOT NULL,
+            currency TEXT NOT NULL,
+            subscriptions INTEGER NOT NULL,
+            monthly_total REAL NOT NULL,  -- в минимальных единицах currency
+            PRIMARY KEY (user_id, currency)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE spending_by_service (
+            user_id INTEGER NOT NULL,
+            service_name TEXT NOT NULL,
+            currency TEXT NOT NULL,
+            subscriptions INTEGER NOT NULL,
+            monthly_total REAL NOT NULL,
+            PRIMARY KEY (user_id, service_name, currency)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE spending_by_day (
+            user_id INTEGER NOT NULL,
+            day INTEGER NOT NULL,  -- next_payment_date
+            currency TEXT NOT NULL,
+            subscriptions INTEGER NOT NULL,
+            total INTEGER NOT NULL,
+            PRIMARY KEY (user_id, day, currency)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE spending_global_by_service (
+            service_name TEXT NOT NULL,
+            currency TEXT NOT NULL,
+            subscriptions INTEGER NOT NULL,
+            monthly_total REAL NOT NULL,
+            PRIMARY KEY (service_name, currency)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE spending_global_by_day (
+            day INTEGER NOT NULL,
+            currency TEXT NOT NULL,
+            subscriptions INTEGER NOT NULL,
+            total INTEGER NOT NULL,
+            PRIMARY KEY (day, currency)
+        ) WITHOUT ROWID
+        ''',
+        f"CREATE TRIGGER subscriptions_spending_insert AFTER INSERT ON subscriptions BEGIN\n"
+        f"{_spending_statements('NEW', 1, by_currency=True)}\nEND",
+        f"CREATE TRIGGER subscriptions_spending_delete AFTER DELETE ON subscriptions BEGIN\n"
+        f"{_spending_statements('OLD', -1, by_currency=True)}\nEND",
+        f"CREATE TRIGGER subscriptions_spending_update AFTER UPDATE OF {_CURRENCY_SPENDING_COLUMNS} "
+        f"ON subscriptions BEGIN\n"
+        f"{_spending_statements('OLD', -1, by_currency=True)}\n{_spending_statements('NEW', 1, by_currency=True)}\nEND",
+        *_SPENDING_BACKFILL,
+        '''
+        CREATE TABLE IF NOT EXISTS exchange_rates (
+            currency TEXT PRIMARY KEY,
+            rate REAL NOT NULL,  -- цена единицы валюты в общей валюте котировки
+            updated_at TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+        ''',
+    )),
+    (11, "состояние диалогов и user_data бота", (
+        '''
+        CREATE TABLE IF NOT EXISTS bot_state (
+            kind TEXT NOT NULL,  -- user_data или conversation:<имя ConversationHandler>
+            key TEXT NOT NULL,
+            data BLOB NOT NULL,  -- pickle
+            updated_at TEXT NOT NULL DEFAULT (datetime('now')),
+            PRIMARY KEY (kind, key)
+        ) WITHOUT ROWID
+        ''',
+    )),
+]
+
+POSTGRES_SCHEMA_VERSION_TABLE = '''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+'''
+
+POSTGRES_MIGRATIONS = [
+    (6, "схема PostgreSQL (соответствует версии 6 SQLite)", (
+        '''
+        CREATE TABLE IF NOT EXISTS subscriptions (
+            id BIGSERIAL PRIMARY KEY,
+            user_id BIGINT NOT NULL,
+            service_name TEXT NOT NULL,
+            amount DOUBLE PRECISION,
+            next_payment_date DATE NOT NULL,
+            reminder_status SMALLINT NOT NULL DEFAULT 0 -- 0-ничего, 1-за 3 дня, 2-за 1 день, 3-просрочка
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_subscriptions_user ON subscriptions (user_id)",
+        '''
+        CREATE INDEX IF NOT EXISTS idx_subscriptions_due
+        ON subscriptions (next_payment_date, reminder_status, id)
+        WHERE reminder_status < 3
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id BIGINT PRIMARY KEY,
+            blocked SMALLINT NOT NULL DEFAULT 0
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS reminder_outbox (
+            id BIGSERIAL PRIMARY KEY,
+            idempotency_key TEXT NOT NULL UNIQUE,
+            sub_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            service_name TEXT NOT NULL,
+            amount DOUBLE PRECISION,
+            next_payment_date DATE NOT NULL,
+            reminder_status SMALLINT NOT NULL,
+            state SMALLINT NOT NULL DEFAULT 0,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            sent_at TIMESTAMPTZ
+        )
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_outbox_active
+        ON reminder_outbox (state, user_id)
+        WHERE state < 2
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS reminder_shards (
+            shard INTEGER PRIMARY KEY,
+            owner TEXT,
+            lease_until DOUBLE PRECISION NOT NULL DEFAULT 0
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS reminder_workers (
+            worker_id TEXT PRIMARY KEY,
+            heartbeat_until DOUBLE PRECISION NOT NULL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS reminder_wakeups (
+            shard INTEGER NOT NULL,
+            wake_at TIMESTAMP NOT NULL,
+            PRIMARY KEY (shard, wake_at)
+        )
+        ''',
+    )),
+    (7, "период подписки и якорный день оплаты", (
+        "ALTER TABLE subscriptions ADD COLUMN period_unit TEXT NOT NULL DEFAULT 'm'",
+        "ALTER TABLE subscriptions ADD COLUMN period_count INTEGER NOT NULL DEFAULT 1",
+        "ALTER TABLE subscriptions ADD COLUMN anchor_day SMALLINT",
+        "UPDATE subscriptions SET anchor_day = EXTRACT(DAY FROM next_payment_date)",
+        '''
+        CREATE INDEX IF NOT EXISTS idx_subscriptions_overdue
+        ON subscriptions (next_payment_date, id)
+        WHERE reminder_status = 3
+        ''',
+    )),
+    (8, "агрегаты расходов для /stats", (
+        '''
+        CREATE TABLE IF NOT EXISTS spending_by_user (
+            user_id BIGINT PRIMARY KEY,
+            subscriptions INTEGER NOT NULL,
+            monthly_total DOUBLE PRECISION NOT NULL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS spending_by_service (
+            user_id BIGINT NOT NULL,
+            service_name TEXT NOT NULL,
+            subscriptions INTEGER NOT NULL,
+            monthly_total DOUBLE PRECISION NOT NULL,
+            PRIMARY KEY (user_id, service_name)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS spending_by_day (
+            user_id BIGINT NOT NULL,
+            day DATE NOT NULL,
+            subscriptions INTEGER NOT NULL,
+            total DOUBLE PRECISION NOT NULL,
+            PRIMARY KEY (user_id, day)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS spending_global_by_service (
+            service_name TEXT PRIMARY KEY,
+            subscriptions INTEGER NOT NULL,
+            monthly_total DOUBLE PRECISION NOT NULL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS spending_global_by_day (
+            day DATE PRIMARY KEY,
+            subscriptions INTEGER NOT NULL,
+            total DOUBLE PRECISION NOT NULL
+        )
+        ''',
+        f"CREATE FUNCTION subscriptions_spending() RETURNS trigger LANGUAGE plpgsql AS $$\n"
+        f"BEGIN\n"
+        f"IF TG_OP IN ('UPDATE', 'DELETE') THEN\n{_spending_statements('OLD', -1)}\nEND IF;\n"
+        f"IF TG_OP IN ('UPDATE', 'INSERT') THEN\n{_spending_statements('NEW', 1)}\nEND IF;\n"
+        f"RETURN NULL;\n"
+        f"END $$",
+        f"CREATE TRIGGER subscriptions_spending AFTER INSERT OR DELETE OR UPDATE OF {_SPENDING_COLUMNS} "
+        f"ON subscriptions FOR EACH ROW EXECUTE FUNCTION subscriptions_spending()",
+        f"INSERT INTO spending_by_user SELECT user_id, COUNT(*), SUM({_monthly_cost('subscriptions')}) "
+        f"FROM subscriptions GROUP BY user_id",
+        f"INSERT INTO spending_by_service SELECT user_id, service_name, COUNT(*), SUM({_monthly_cost('subscriptions')}) "
+        f"FROM subscriptions GROUP BY user_id, service_name",
+        "INSERT INTO spending_by_day SELECT user_id, next_payment_date, COUNT(*), SUM(COALESCE(amount, 0)) "
+        "FROM subscriptions GROUP BY user_id, next_payment_date",
+        f"INSERT INTO spending_global_by_service SELECT service_name, COUNT(*), SUM({_monthly_cost('subscriptions')}) "
+        f"FROM subscriptions GROUP BY service_name",
+        "INSERT INTO spending_global_by_day SELECT next_payment_date, COUNT(*), SUM(COALESCE(amount, 0)) "
+        "FROM subscriptions GROUP BY next_payment_date",
+    )),
+    (9, "часовой пояс и время напоминаний пользователя", (
+        "ALTER TABLE users ADD COLUMN timezone TEXT",
+        "ALTER TABLE users ADD COLUMN delivery_hour SMALLINT",
+        "ALTER TABLE users ADD COLUMN utc_offset INTEGER",
+        "CREATE INDEX IF NOT EXISTS idx_users_timezone ON users (timezone) WHERE timezone IS NOT NULL",
+    )),
+    (10, "суммы в минимальных единицах валюты, валюта подписки, курсы валют", (
+        "DROP TRIGGER subscriptions_spending ON subscriptions",
+        "DROP FUNCTION subscriptions_spending()",
+        *(f"DROP TABLE {table}" for table in _SPENDING_TABLES),
+        "ALTER TABLE subscriptions ADD COLUMN amount_minor BIGINT NOT NULL DEFAULT 0",
+        "ALTER TABLE subscriptions ADD COLUMN currency TEXT NOT NULL DEFAULT 'RUB'",
+        f"UPDATE subscriptions SET amount_minor = {_AMOUNT_TO_MINOR}",
+        "ALTER TABLE subscriptions DROP COLUMN amount",
+        "ALTER TABLE reminder_outbox ADD COLUMN amount_minor BIGINT NOT NULL DEFAULT 0",
+        "ALTER TABLE reminder_outbox ADD COLUMN currency TEXT NOT NULL DEFAULT 'RUB'",
+        f"UPDATE reminder_outbox SET amount_minor = {_AMOUNT_TO_MINOR}",
+        "ALTER TABLE reminder_outbox DROP COLUMN amount",
+        '''
+        CREATE TABLE spending_by_user (
+            user_id BIGINT NOT NULL,
+            currency TEXT NOT NULL,
+            subscriptions INTEGER NOT NULL,
+            monthly_total DOUBLE PRECISION NOT NULL,
+            PRIMARY KEY (user_id, currency)
+        )
+        ''',
+        '''
+        CREATE TABLE spending_by_service (
+            user_id BIGINT NOT NULL,
+            service_name TEXT NOT NULL,
+            currency TEXT NOT NULL,
+            subscriptions INTEGER NOT NULL,
+            monthly_total DOUBLE PRECISION NOT NULL,
+            PRIMARY KEY (user_id, service_name, currency)
+        )
+        ''',
+        '''
+        CREATE TABLE spending_by_day (
+            user_id BIGINT NOT NULL,
+            day DATE NOT NULL,
+            currency TEXT NOT NULL,
+            subscriptions INTEGER NOT NULL,
+            total BIGINT NOT NULL,
+            PRIMARY KEY (user_id, day, currency)
+        )
+        ''',
+        '''
+        CREATE TABLE spending_global_by_service (
+            service_name TEXT NOT NULL,
+            currency TEXT NOT NULL,
+            subscriptions INTEGER NOT NULL,
+            monthly_total DOUBLE PRECISION NOT NULL,
+            PRIMARY KEY (service_name, currency)
+        )
+        ''',
+        '''
+        CREATE TABLE spending_global_by_day (
+            day DATE NOT NULL,
+            currency TEXT NOT NULL,
+            subscriptions INTEGER NOT NULL,
+            total BIGINT NOT NULL,
+            PRIMARY KEY (day, currency)
+        )
+        ''',
+        f"CREATE FUNCTION subscriptions_spending() RETURNS trigger LANGUAGE plpgsql AS $$\n"
+        f"BEGIN\n"
+        f"IF TG_OP IN ('UPDATE', 'DELETE') THEN\n{_spending_statements('OLD', -1, by_currency=True)}\nEND IF;\n"
+        f"IF TG_OP IN ('UPDATE', 'INSERT') THEN\n{_spending_statements('NEW', 1, by_currency=True)}\nEND IF;\n"
+        f"RETURN NULL;\n"
+        f"END $$",
+        f"CREATE TRIGGER subscriptions_spending AFTER INSERT OR DELETE OR UPDATE OF {_CURRENCY_SPENDING_COLUMNS} "
+        f"ON subscriptions FOR EACH ROW EXECUTE FUNCTION subscriptions_spending()",
+        *_SPENDING_BACKFILL,
+        '''
+        CREATE TABLE IF NOT EXISTS exchange_rates (
+            currency TEXT PRIMARY KEY,
+            rate DOUBLE PRECISION NOT NULL,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+        ''',
+    )),
+    (11, "состояние диалогов и user_data бота", (
+        '''
+        CREATE TABLE IF NOT EXISTS bot_state (
+            kind TEXT NOT NULL,
+            key TEXT NOT NULL,
+            data BYTEA NOT NULL,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (kind, key)
+        )
+        ''',
+    )),
+]
@@ -0,0 +1,118 @@
+"""Amounts with a currency, stored exactly as integer minor units (cents, kopecks).
+
+parse_money() reads what users type in /add and what import files contain: "9.99 USD", "9,99€",
+"$5", "1 490 ₽", or a bare number in the default currency. Totals across currencies are converted
+with ExchangeRates, a snapshot of the exchange_rates table that db_manager keeps in memory.
+"""
+import os
+import re
+from dataclasses import dataclass
+from decimal import Decimal, InvalidOperation
+
+# ISO 4217 code -> digits after the decimal point
+CURRENCY_EXPONENTS = {
+    "RUB": 2, "USD": 2, "EUR": 2, "GBP": 2, "CHF": 2, "CNY": 2, "JPY": 0, "KRW": 0, "INR": 2,
+    "TRY": 2, "AED": 2, "KZT": 2, "BYN": 2, "UAH": 2, "UZS": 2, "GEL": 2, "AMD": 2, "AZN": 2,
+    "KGS": 2, "PLN": 2, "CZK": 2, "SEK": 2, "NOK": 2, "CAD": 2, "AUD": 2, "ILS": 2, "THB": 2,
+}
+
+# symbols and words users write instead of the code, lowercase
+CURRENCY_ALIASES = {
+    "₽": "RUB", "р": "RUB", "р.": "RUB", "руб": "RUB", "руб.": "RUB", "рублей": "RUB", "rur": "RUB",
+    "$": "USD", "долл": "USD", "долл.": "USD", "долларов": "USD",
+    "€": "EUR", "евро": "EUR",
+    "£": "GBP", "¥": "JPY", "₹": "INR", "₺": "TRY", "₸": "KZT", "₴": "UAH", "₾": "GEL", "₩": "KRW",
+    "zł": "PLN", "₪": "ILS", "฿": "THB",
+}
+
+# what amounts without a currency are in, and what /stats totals are converted to
+BASE_CURRENCY = os.getenv("BASE_CURRENCY", "RUB").upper()
+
+MAX_AMOUNT_MINOR = 10 ** 15
+
+_MONEY_RE = re.compile(r"^(?P<before>[^\d\s.,]*)\s*(?P<number>\d[\d\s]*(?:[.,]\d+)?)\s*(?P<after>\D*)$")
+
+
+@dataclass(frozen=True)
+class Money:
+    minor: int
+    currency: str
+
+    @property
+    def exponent(self) -> int:
+        return CURRENCY_EXPONENTS.get(self.currency, 2)
+
+    @property
+    def amount(self) -> Decimal:
+        return Decimal(self.minor).scaleb(-self.exponent)
+
+    def __str__(self) -> str:
+        return f"{self.amount:.{self.exponent}f} {self.currency}"
+
+
+def parse_currency(text: str) -> str:
+    text = text.strip()
+    code = CURRENCY_ALIASES.get(text.lower(), text.upper())
+    if code not in CURRENCY_EXPONENTS:
+        raise ValueError(f"Неизвестная валюта: {text}. Пример: RUB, USD, EUR или ₽, $, €")
+    return code
+
+
+def parse_money(text: str, currency: str | None = None) -> Money:
+    """Amount with an optional currency before or after it. Raises ValueError.
+
+    currency applies when the text names none; without it that is BASE_CURRENCY.
+    """
+    if text.strip().startswith("-"):
+        raise ValueError(f"Сумма не может быть отрицательной: {text}")
+    match = _MONEY_RE.match(text.strip())
+    if not match:
+        raise ValueError(f"Не понял сумму: {text}. Пример: 299, 9.99 USD или 9,99€")
+    before, after = match.group("before").strip(), match.group("after").strip()
+    if before and after:
+        raise ValueError(f"Валюта указана дважды: {text}")
+    code = parse_currency(before or after) if before or after else currency or BASE_CURRENCY
+
+    number = re.sub(r"\s", "", match.group("number")).replace(",", ".")
+    try:
+        amount = Decimal(number)
+    except InvalidOperation:
+        raise ValueError(f"Сумма не число: {text}") from None
+    return from_decimal(amount, code)
+
+
+def from_decimal(amount: Decimal, currency: str) -> Money:
+    exponent = CURRENCY_EXPONENTS[currency]
+    minor = amount.scaleb(exponent)
+    if minor != minor.to_integral_value():
+        raise ValueError(f"В {currency} не бывает больше {exponent} знаков после запятой: {amount}")
+    if minor < 0 or minor >= MAX_AMOUNT_MINOR:
+        raise ValueError(f"Некорректная сумма: {amount}")
+    return Money(int(minor), currency)
+
+
+def format_total(value: float, currency: str = BASE_CURRENCY) -> str:
+    """A converted total, which is no longer exact, rounded to the currency's minor unit."""
+    return f"{value:.{CURRENCY_EXPONENTS.get(currency, 2)}f} {currency}"
+
+
+@dataclass(frozen=True)
+class ExchangeRates:
+    """Rates as the value of one unit of a currency in a common quote currency; any pair converts."""
+    rates: dict[str, float]
+
+    def factor(self, currency: str, to: str = BASE_CURRENCY) -> float | None:
+        """Multiplier from minor units of currency to major units of `to`; None without a rate."""
+        if currency == to:
+            return 10.0 ** -CURRENCY_EXPONENTS.get(currency, 2)
+        rate, to_rate = self.rates.get(currency), self.rates.get(to)
+        if rate is None or not to_rate:
+            return None
+        return rate / to_rate * 10.0 ** -CURRENCY_EXPONENTS.get(currency, 2)
+
+    def factors(self, currencies, to: str = BASE_CURRENCY) -> dict[str, float]:
+        """factor() of every currency that has a rate."""
+        return {
+            currency: factor for currency in currencies
+            if (factor := self.factor(currency, to)) is not None
+        }
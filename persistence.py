@@ -0,0 +1,127 @@
+"""Conversation states and user_data kept in the bot's database, so a restart doesn't drop a half-done /add.
+
+PTB hands changes over every update_interval seconds, one coroutine per changed user and
+conversation, all started together; they are collected into one transaction instead of a write
+each. Only what differs from the stored copy is written, and an emptied user_data is deleted,
+so the table holds just the users who are in the middle of something.
+"""
+import asyncio
+import json
+import logging
+import os
+import pickle
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+import db_manager
+
+logger = logging.getLogger(__name__)
+
+# how often PTB hands over changed state; a crash loses at most this many seconds of it
+PERSISTENCE_INTERVAL = float(os.getenv("PERSISTENCE_INTERVAL", "5"))
+
+USER_DATA = "user_data"
+CONVERSATION_PREFIX = "conversation:"
+
+
+class DatabasePersistence(BasePersistence):
+    """user_data and persistent ConversationHandler states; bot_data and chat_data stay in memory.
+
+    bot_data holds the scheduler and the metrics server, which have no business in the database.
+    """
+
+    def __init__(self, update_interval: float = PERSISTENCE_INTERVAL):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        # (kind, key) -> pickled data as it is in the database
+        self._stored: dict[tuple[str, str], bytes] = {}
+        # (kind, key) -> data to write, None to delete
+        self._pending: dict[tuple[str, str], bytes | None] = {}
+        self._write_task: asyncio.Task | None = None
+        self._ready = False
+
+    async def _load(self, kind: str) -> list[tuple[str, object]]:
+        if not self._ready:
+            # Application.initialize() reads the persistence before post_init opens the database
+            await db_manager.init_pool()
+            await db_manager.run_migrations()
+            self._ready = True
+        rows = await db_manager.get_bot_state(kind)
+        self._stored.update(((kind, key), data) for key, data in rows)
+        return [(key, pickle.loads(data)) for key, data in rows]
+
+    async def _write(self, kind: str, key: str, value) -> None:
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL) if value is not None else None
+        if self._stored.get((kind, key)) == data:
+            return
+        self._pending[(kind, key)] = data
+        if self._write_task is None:
+            # starts after the other update coroutines PTB gathered have queued their writes
+            self._write_task = asyncio.create_task(self._write_pending())
+        await asyncio.shield(self._write_task)
+
+    async def _write_pending(self) -> None:
+        pending, self._pending = self._pending, {}
+        self._write_task = None
+        try:
+            await db_manager.save_bot_state([(kind, key, data) for (kind, key), data in pending.items()])
+        except Exception:
+            # retried with the next write or on flush(); newer changes win
+            self._pending = {**pending, **self._pending}
+            raise
+        for item, data in pending.items():
+            if data is None:
+                self._stored.pop(item, None)
+            else:
+                self._stored[item] = data
+        logger.debug("Сохранено состояние бота: %d записей", len(pending))
+
+    async def get_user_data(self) -> dict[int, dict]:
+        return {int(key): data for key, data in await self._load(USER_DATA)}
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        await self._write(USER_DATA, str(user_id), data or None)
+
+    async def drop_user_data(self, user_id: int) -> None:
+        await self._write(USER_DATA, str(user_id), None)
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        """Nothing to do: this process is the only writer."""
+
+    async def get_conversations(self, name: str) -> dict:
+        return {tuple(json.loads(key)): state for key, state in await self._load(CONVERSATION_PREFIX + name)}
+
+    async def update_conversation(self, name: str, key: tuple, new_state: object | None) -> None:
+        await self._write(CONVERSATION_PREFIX + name, json.dumps(key), new_state)
+
+    async def flush(self) -> None:
+        """Called on shutdown, after the last update_* round."""
+        if self._write_task is not None:
+            await self._write_task
+        if self._pending:
+            await self._write_pending()
+
+    # not stored, see store_data
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def update_bot_data(self, data: dict) -> None: ...
+
+    async def refresh_bot_data(self, bot_data: dict) -> None: ...
+
+    async def get_chat_data(self) -> dict[int, dict]:
+        return {}
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None: ...
+
+    async def drop_chat_data(self, chat_id: int) -> None: ...
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None: ...
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def update_callback_data(self, data) -> None: ...
@@ -0,0 +1,82 @@
+"""Exchange rates for /stats totals: the rates file and the job that keeps the cache fresh.
+
+The file is JSON, {"base": "RUB", "rates": {"USD": 92.5, "EUR": 99.1}}, or CSV with currency,rate
+rows in BASE_CURRENCY; a rate is the price of one unit of the currency in base. Whatever fetches
+rates (cron, a script against a bank's API) only has to rewrite the file; the bot reloads it into
+the exchange_rates table when it changes and keeps an in-memory copy for the totals.
+"""
+import csv
+import json
+import logging
+import os
+
+import db_manager
+from money import BASE_CURRENCY, parse_currency
+
+logger = logging.getLogger(__name__)
+
+EXCHANGE_RATES_FILE = os.getenv("EXCHANGE_RATES_FILE")  # без файла курсы задаются через admin.py rates
+RATES_REFRESH_INTERVAL = int(os.getenv("RATES_REFRESH_INTERVAL", "3600"))  # секунд
+
+# mtime of EXCHANGE_RATES_FILE when it was last loaded
+_loaded_mtime: float | None = None
+
+
+def read_rates_file(path: str) -> dict[str, float]:
+    """{currency: rate} with the base currency's own rate of 1. Raises ValueError on a bad file."""
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        if path.lower().endswith(".json"):
+            data = json.load(f)
+            if not isinstance(data, dict) or not isinstance(data.get("rates", {}), dict):
+                raise ValueError('Ожидался объект {"base": ..., "rates": {...}}')
+            base, raw = data.get("base", BASE_CURRENCY), data.get("rates", {})
+            items = raw.items()
+        else:
+            base, items = BASE_CURRENCY, [row for row in csv.reader(f) if row and row[0].strip()]
+            if items and items[0][0].strip().lower() == "currency":
+                items = items[1:]
+    rates = {parse_currency(base): 1.0}
+    for item in items:
+        if len(item) != 2:
+            raise ValueError(f"Ожидалось currency,rate: {','.join(item)}")
+        currency, rate = item
+        try:
+            rate = float(rate)
+        except (TypeError, ValueError):
+            raise ValueError(f"Курс {currency} не число: {rate}") from None
+        if not rate > 0:
+            raise ValueError(f"Курс {currency} должен быть больше нуля: {rate}")
+        rates[parse_currency(currency)] = rate
+    return rates
+
+
+async def load_rates_file(path: str) -> int:
+    """Replaces the exchange_rates table with the file's rates; returns how many were loaded."""
+    rates = read_rates_file(path)
+    await db_manager.set_exchange_rates(rates)
+    logger.info("Загружены курсы валют из %s: %d", path, len(rates))
+    return len(rates)
+
+
+async def refresh_rates(path: str | None = EXCHANGE_RATES_FILE) -> None:
+    """Reloads the file if it changed since the last load, then the in-memory rates from the table.
+
+    The table is re-read even when the file is unchanged: admin.py or another bot process may
+    have written it.
+    """
+    global _loaded_mtime
+    if path:
+        try:
+            mtime = os.path.getmtime(path)
+            if mtime != _loaded_mtime:
+                await load_rates_file(path)
+                _loaded_mtime = mtime
+        except (OSError, ValueError) as e:
+            # keep the last good rates rather than stop converting
+            logger.error("Не удалось загрузить курсы валют из %s: %s", path, e)
+    await db_manager.refresh_exchange_rates()
+
+
+async def refresh_rates_job(context) -> None:
+    """JobQueue callback."""
+    await refresh_rates()
@@ -0,0 +1,126 @@
+"""Billing periods and next-payment-date math.
+
+Dates are day numbers (datetime.date.toordinal()), the same form SQLite stores, so bulk calls do
+integer arithmetic and only month-based periods touch the calendar, through a cached month table.
+Month-based periods (monthly, quarterly, yearly) keep an anchor day: a subscription billed on the
+31st is due on Feb 28 (29) and back on Mar 31, instead of drifting to the 28th for good.
+"""
+import datetime
+from calendar import monthrange
+from functools import lru_cache
+from typing import Iterable, NamedTuple
+
+DAY = "d"
+WEEK = "w"
+MONTH = "m"
+YEAR = "y"
+
+MAX_PERIOD_COUNT = 3650
+
+
+class Period(NamedTuple):
+    unit: str
+    count: int
+
+    @property
+    def code(self) -> str:
+        return f"{self.count}{self.unit}"
+
+
+WEEKLY = Period(WEEK, 1)
+MONTHLY = Period(MONTH, 1)
+QUARTERLY = Period(MONTH, 3)
+YEARLY = Period(YEAR, 1)
+
+PERIOD_ALIASES = {
+    "неделя": WEEKLY, "еженедельно": WEEKLY, "weekly": WEEKLY,
+    "месяц": MONTHLY, "ежемесячно": MONTHLY, "monthly": MONTHLY,
+    "квартал": QUARTERLY, "quarterly": QUARTERLY,
+    "год": YEARLY, "ежегодно": YEARLY, "yearly": YEARLY,
+}
+
+_UNIT_ALIASES = {
+    "d": DAY, "д": DAY, "дн": DAY, "day": DAY, "days": DAY,
+    "w": WEEK, "н": WEEK, "нед": WEEK, "week": WEEK, "weeks": WEEK,
+    "m": MONTH, "м": MONTH, "мес": MONTH, "month": MONTH, "months": MONTH,
+    "y": YEAR, "г": YEAR, "год": YEAR, "year": YEAR, "years": YEAR,
+}
+
+
+def parse_period(text: str) -> Period:
+    """"месяц", "quarterly", "2w", "14 дн", "1y" -> Period. Raises ValueError."""
+    text = text.strip().lower()
+    if text in PERIOD_ALIASES:
+        return PERIOD_ALIASES[text]
+    digits = len(text) - len(text.lstrip("0123456789"))
+    count_text, unit_text = text[:digits], text[digits:].strip().rstrip(".")
+    if not count_text or unit_text not in _UNIT_ALIASES:
+        raise ValueError(f"Неизвестный период: {text!r}")
+    count = int(count_text)
+    if not 1 <= count <= MAX_PERIOD_COUNT:
+        raise ValueError(f"Период должен быть от 1 до {MAX_PERIOD_COUNT}")
+    return Period(_UNIT_ALIASES[unit_text], count)
+
+
+def describe_period(period: Period) -> str:
+    if period == WEEKLY:
+        return "каждую неделю"
+    if period == MONTHLY:
+        return "каждый месяц"
+    if period == QUARTERLY:
+        return "раз в квартал"
+    if period == YEARLY:
+        return "каждый год"
+    units = {DAY: "дн.", WEEK: "нед.", MONTH: "мес.", YEAR: "г."}
+    return f"каждые {period.count} {units[period.unit]}"
+
+
+def _months(period: Period) -> int:
+    return period.count * 12 if period.unit == YEAR else period.count
+
+
+@lru_cache(maxsize=4096)
+def _month_bounds(month_index: int) -> tuple[int, int]:
+    """(day number of the 1st, number of days) for month_index = year * 12 + month - 1."""
+    year, month = divmod(month_index, 12)
+    return datetime.date(year, month + 1, 1).toordinal(), monthrange(year, month + 1)[1]
+
+
+def _on_anchor(month_index: int, anchor_day: int) -> int:
+    first, length = _month_bounds(month_index)
+    return first + min(anchor_day, length) - 1
+
+
+def advance(day: int, period: Period, anchor_day: int | None = None, steps: int = 1) -> int:
+    """The payment date `steps` periods after `day`. anchor_day defaults to day's day of month."""
+    if period.unit == DAY:
+        return day + period.count * steps
+    if period.unit == WEEK:
+        return day + 7 * period.count * steps
+    date = datetime.date.fromordinal(day)
+    month_index = date.year * 12 + date.month - 1 + _months(period) * steps
+    return _on_anchor(month_index, anchor_day or date.day)
+
+
+def roll_forward(day: int, period: Period, anchor_day: int | None, today: int) -> int:
+    """The first payment date on or after today, at least one period after `day`."""
+    if period.unit in (DAY, WEEK):
+        step = period.count * (7 if period.unit == WEEK else 1)
+        return day + step * max(1, -(-(today - day) // step))
+
+    date = datetime.date.fromordinal(day)
+    today_date = datetime.date.fromordinal(today)
+    anchor_day = anchor_day or date.day
+    months = _months(period)
+    month_index = date.year * 12 + date.month - 1
+    behind = (today_date.year * 12 + today_date.month - 1) - month_index
+    steps = max(1, -(-behind // months))
+    candidate = _on_anchor(month_index + steps * months, anchor_day)
+    if candidate < today:
+        candidate = _on_anchor(month_index + (steps + 1) * months, anchor_day)
+    return candidate
+
+
+def roll_forward_all(rows: Iterable[tuple[int, Period, int | None]], today: int) -> list[int]:
+    """roll_forward() over many (day, period, anchor_day) rows."""
+    return [roll_forward(day, period, anchor_day, today) for day, period, anchor_day in rows]
@@ -1,9 +1,22 @@
-import logging
+import asyncio
 import datetime
+import heapq
+import logging
+import os
 from telegram.ext import ContextTypes
 from telegram.constants import ParseMode
 
-from db_manager import get_subscriptions_for_reminders, update_reminder_status, get_overdue_subscriptions
+from db_manager import (
+    iter_due_reminders, enqueue_reminders, claim_outbox_batch, complete_outbox, recover_outbox, prune_outbox,
+    count_pending_outbox, auto_advance_overdue, refresh_utc_offsets,
+    mark_users_blocked, get_pending_reminder_keys,
+    ShardScope, OUTBOX_PENDING, OUTBOX_SENT, OUTBOX_BLOCKED
+)
+from metrics import OUTBOX_DEPTH, SWEEP_DURATION
+from money import Money
+from delivery import DeliveryClock, delivery_clock, reminder_day, slot_time
+from dispatcher import DispatchStats, ReminderDispatcher, SEND_OK, SEND_BLOCKED, SEND_FAILED
+from keyboards import MAX_KEYBOARD_ITEMS, reminder_keyboard
 
 logger = logging.getLogger(__name__)
 
@@ -13,67 +26,364 @@ REMINDER_STATUS_3_DAYS = 1
 REMINDER_STATUS_1_DAY = 2
 REMINDER_STATUS_OVERDUE = 3
 
-async def check_and_send_reminders(context: ContextTypes.DEFAULT_TYPE) -> None:
+# "single": one message per subscription, "digest": one message per user per sweep
+REMINDER_MODE_SINGLE = "single"
+REMINDER_MODE_DIGEST = "digest"
+REMINDER_MODE = os.getenv("REMINDER_MODE", REMINDER_MODE_SINGLE)
 
-    logger.info("Запуск проверки подписок на напоминания...")
-
-    # 3 days before
-    subscriptions_3_days = await get_subscriptions_for_reminders(3)
-    if subscriptions_3_days:
-        logger.info(f"Найдено {len(subscriptions_3_days)} подписок для напоминания за 3 дня.")
-        for sub_id, user_id, service_name, amount, next_payment_date, current_status in subscriptions_3_days:
-            message = (
-                f"⏰ **Напоминание об оплате!** ⏰\n\n"
-                f"Сервис: **{service_name}**\n"
-                f"Сумма: **{amount:.2f}**\n"
-                f"Дата следующей оплаты: **{next_payment_date}** (через 3 дня)\n\n"
-                f"Чтобы отметить подписку как оплаченную, используйте команду: `/paid {sub_id}`"
-            )
-            try:
-                await context.bot.send_message(chat_id=user_id, text=message, parse_mode=ParseMode.MARKDOWN)
-                await update_reminder_status(sub_id, REMINDER_STATUS_3_DAYS)
-                logger.info(f"Напоминание за 3 дня отправлено для подписки ID {sub_id}, user {user_id}")
-            except Exception as e:
-                logger.error(f"Не удалось отправить напоминание для подписки ID {sub_id}, user {user_id}: {e}")
+# 0: the bot process sends reminders itself; N > 0: reminder_worker.py processes split users into N shards
+REMINDER_SHARDS = int(os.getenv("REMINDER_SHARDS", "0"))
+
+# 0: overdue subscriptions stay put until /paid; N > 0: N days after the overdue reminder
+# they are rolled forward to their next period automatically
+AUTO_ADVANCE_OVERDUE_DAYS = int(os.getenv("AUTO_ADVANCE_OVERDUE_DAYS", "0"))
+
+# reminders for a day go out in each user's delivery slot, see delivery.py
+RETRY_SWEEP_DELAY = datetime.timedelta(minutes=15)
+SAFETY_SWEEP_INTERVAL = datetime.timedelta(days=1)
+
+REMINDER_SCHEDULER_KEY = "reminder_scheduler"
+
+MAX_MESSAGE_LENGTH = 4096
+DIGEST_USERS_PER_BATCH = 500
+DIGEST_SECTION_TITLES = {
+    REMINDER_STATUS_OVERDUE: "🚨 **Просрочены:**",
+    REMINDER_STATUS_1_DAY: "❗️ **Оплата завтра:**",
+    REMINDER_STATUS_3_DAYS: "⏰ **Оплата через 3 дня:**",
+}
+
+
+def build_reminder_message(new_status: int, sub_id: int, service_name: str, amount: Money, next_payment_date: str) -> str:
+    if new_status == REMINDER_STATUS_3_DAYS:
+        return (
+            f"⏰ **Напоминание об оплате!** ⏰\n\n"
+            f"Сервис: **{service_name}**\n"
+            f"Сумма: **{amount}**\n"
+            f"Дата следующей оплаты: **{next_payment_date}** (через 3 дня)\n\n"
+            f"Когда оплатишь, нажми ✅ под сообщением или используй команду `/paid {sub_id}`"
+        )
+    if new_status == REMINDER_STATUS_1_DAY:
+        return (
+            f"❗️ **Последнее напоминание!** ❗️\n\n"
+            f"Завтра, **{next_payment_date}**, наступает срок оплаты подписки:\n"
+            f"Сервис: **{service_name}**\n"
+            f"Сумма: **{amount}**\n\n"
+            f"Когда оплатишь, нажми ✅ под сообщением или используй команду `/paid {sub_id}`"
+        )
+    return (
+        f"🚨 **Подписка просрочена!** 🚨\n\n"
+        f"Срок оплаты подписки **{service_name}** на сумму **{amount}** истек **{next_payment_date}**.\n\n"
+        f"Когда оплатишь, нажми ✅ под сообщением или используй команду `/paid {sub_id}`, и напоминания сбросятся"
+    )
+
+
+def build_digest_parts(items: list[tuple]) -> list[tuple[str, list[tuple]]]:
+    """Groups one user's due items into digest messages no longer than MAX_MESSAGE_LENGTH.
+
+    Items are claimed outbox rows. Returns (text, items included in that text) pairs,
+    so only items that were actually sent are marked delivered.
+    """
+    parts = []
+    header = "📬 **Сводка по подпискам**"
+    text, included = header, []
+    for new_status in (REMINDER_STATUS_OVERDUE, REMINDER_STATUS_1_DAY, REMINDER_STATUS_3_DAYS):
+        section = [item for item in items if item[6] == new_status]
+        if not section:
+            continue
+        title = f"\n\n{DIGEST_SECTION_TITLES[new_status]}"
+        for item in section:
+            _, sub_id, _, service_name, amount, next_payment_date, _ = item
+            line = f"• **{service_name}** — {amount}, {next_payment_date} (`/paid {sub_id}`)"
+            addition = f"{title}\n{line}" if title else f"\n{line}"
+            # a part also stops at MAX_KEYBOARD_ITEMS, each item gets a row of buttons
+            if included and (len(text) + len(addition) > MAX_MESSAGE_LENGTH or len(included) >= MAX_KEYBOARD_ITEMS):
+                parts.append((text, included))
+                text, included = header, []
+                addition = f"\n\n{DIGEST_SECTION_TITLES[new_status]}\n{line}"
+            text += addition
+            included.append(item)
+            title = None
+    if included:
+        parts.append((text, included))
+    return parts
+
+
+SEND_RESULT_TO_OUTBOX_STATE = {
+    SEND_OK: OUTBOX_SENT,
+    SEND_BLOCKED: OUTBOX_BLOCKED,
+    SEND_FAILED: OUTBOX_PENDING,
+}
+
+
+async def _send_single(dispatcher: ReminderDispatcher, batch: list[tuple]) -> list[tuple[int, str]]:
+    results = await asyncio.gather(*(
+        dispatcher.send(
+            user_id,
+            build_reminder_message(new_status, sub_id, service_name, amount, next_payment_date),
+            parse_mode=ParseMode.MARKDOWN,
+            reply_markup=reminder_keyboard([(sub_id, service_name, next_payment_date)])
+        )
+        for _, sub_id, user_id, service_name, amount, next_payment_date, new_status in batch
+    ))
+    return [(item[0], result) for item, result in zip(batch, results)]
+
+
+async def _send_digest_to_user(dispatcher: ReminderDispatcher, user_id: int, items: list[tuple]) -> list[tuple[int, str]]:
+    outcomes = []
+    for text, included in build_digest_parts(items):
+        result = await dispatcher.send(
+            user_id, text, parse_mode=ParseMode.MARKDOWN,
+            reply_markup=reminder_keyboard([(item[1], item[3], item[5]) for item in included])
+        )
+        outcomes.extend((item[0], result) for item in included)
+        if result != SEND_OK:
+            # later parts are left for the next drain (or dropped by mark_users_blocked)
+            break
+    return outcomes
+
+
+async def _send_digests(dispatcher: ReminderDispatcher, batch: list[tuple]) -> list[tuple[int, str]]:
+    by_user: dict[int, list[tuple]] = {}
+    for item in batch:
+        by_user.setdefault(item[2], []).append(item)
+    results = await asyncio.gather(*(
+        _send_digest_to_user(dispatcher, user_id, items) for user_id, items in by_user.items()
+    ))
+    return [outcome for user_outcomes in results for outcome in user_outcomes]
+
+
+async def drain_outbox(dispatcher: ReminderDispatcher, scope: ShardScope | None = None) -> int:
+    """Sends pending outbox reminders batch by batch until the outbox is empty. Returns rows handled."""
+    handled = 0
+    # failed rows stay "sending" until the drain ends, so this drain does not claim them again
+    retry_later = []
+    try:
+        while True:
+            # claimed batches always hold all pending rows of their users, so digests are complete
+            batch = await claim_outbox_batch(scope=scope)
+            if not batch:
+                return handled
+            handled += len(batch)
+
+            if REMINDER_MODE == REMINDER_MODE_DIGEST:
+                outcomes = await _send_digests(dispatcher, batch)
+            else:
+                outcomes = await _send_single(dispatcher, batch)
+
+            attempted = {outbox_id for outbox_id, _ in outcomes}
+            # digest parts after a failed one were never attempted: back to the queue
+            outcomes.extend((item[0], SEND_FAILED) for item in batch if item[0] not in attempted)
+            retry_later.extend(outbox_id for outbox_id, result in outcomes if result == SEND_FAILED)
+            await complete_outbox([
+                (outbox_id, SEND_RESULT_TO_OUTBOX_STATE[result]) for outbox_id, result in outcomes
+                if result != SEND_FAILED
+            ])
+
+            user_by_outbox_id = {item[0]: item[2] for item in batch}
+            blocked_users = {user_by_outbox_id[outbox_id] for outbox_id, result in outcomes if result == SEND_BLOCKED}
+            await mark_users_blocked(sorted(blocked_users))
+
+            if all(result == SEND_FAILED for _, result in outcomes):
+                # nothing got through (Telegram is down?): leave the rest for the retry sweep
+                return handled
+    finally:
+        await complete_outbox([(outbox_id, OUTBOX_PENDING) for outbox_id in retry_later])
+
+
+async def run_reminder_sweep(bot, dispatcher: ReminderDispatcher | None = None,
+                             scope: ShardScope | None = None,
+                             clock: DeliveryClock | None = None) -> tuple[DispatchStats, set[tuple[str, int, int]]]:
+    """Enqueues everything due now into the outbox, then drains it.
+
+    Only users whose delivery slot has come are due, so each wake-up sends one slot's share
+    instead of the whole day at once. With a scope only the worker's shards are swept.
+    clock overrides "now", for benchmarks.
+    Returns dispatch stats and the enqueued (next_payment_date, new_status, slot) transitions.
+    """
+
+    logger.info("Запуск проверки подписок на напоминания (режим %s)...", REMINDER_MODE)
+    dispatcher = dispatcher or ReminderDispatcher(bot)
+    found = 0
+    transitions = set()
+
+    await refresh_utc_offsets()
+    clock = clock or delivery_clock()
+    if AUTO_ADVANCE_OVERDUE_DAYS:
+        # before the scan, so rolled-forward subscriptions aren't reminded as overdue again
+        new_dates = await auto_advance_overdue(AUTO_ADVANCE_OVERDUE_DAYS, scope, clock=clock)
+        transitions.update((new_date, REMINDER_STATUS_NONE, slot) for new_date, slot in new_dates)
+
+    async for chunk in iter_due_reminders(scope=scope, clock=clock):
+        found += len(chunk)
+        # one transaction per chunk: outbox rows and status transitions commit together
+        await enqueue_reminders(chunk)
+        transitions.update((item[4], item[6], item[7]) for item in chunk)
+
+    OUTBOX_DEPTH.set(await count_pending_outbox(scope))
+    handled = await drain_outbox(dispatcher, scope)
+    await prune_outbox()
+    OUTBOX_DEPTH.set(await count_pending_outbox(scope))
+
+    stats = dispatcher.finish()
+    SWEEP_DURATION.observe(stats.elapsed)
+    if handled:
+        logger.info(
+            "Проверка напоминаний завершена за %.1f с: найдено %d, в outbox обработано %d, "
+            "отправлено %d (%.1f сообщ./с), ошибок %d, заблокировали бота %d, повторов %d.",
+            stats.elapsed, found, handled, stats.sent, stats.throughput, stats.failed, stats.blocked, stats.retries
+        )
     else:
-        logger.info("Нет подписок для напоминания за 3 дня.")
-
-    # 1 day before
-    subscriptions_1_day = await get_subscriptions_for_reminders(1)
-    if subscriptions_1_day:
-        logger.info(f"Найдено {len(subscriptions_1_day)} подписок для напоминания за 1 день.")
-        for sub_id, user_id, service_name, amount, next_payment_date, current_status in subscriptions_1_day:
-            message = (
-                f"❗️ **Последнее напоминание!** ❗️\n\n"
-                f"Завтра, **{next_payment_date}**, наступает срок оплаты подписки:\n"
-                f"Сервис: **{service_name}**\n"
-                f"Сумма: **{amount:.2f}**\n\n"
-                f"Чтобы отметить подписку как оплаченную, используйте команду: /paid {sub_id}"
-            )
+        logger.info("Нет подписок для напоминаний.")
+    return stats, transitions
+
+
+async def check_and_send_reminders(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """JobQueue-compatible one-off sweep."""
+    await run_reminder_sweep(context.bot)
+
+
+def next_reminder_at(next_payment_date: str, reminder_status: int, slot: int,
+                     now: datetime.datetime | None = None) -> datetime.datetime | None:
+    """When the sweep will next have something to send for a subscription, or None if nothing is left.
+
+    Mirrors DUE_REMINDERS_QUERY: the 3-day and 1-day reminders fire only on their exact reminder
+    day, the overdue one on any day after the payment date; a day starts at the user's slot.
+    """
+    now = now or datetime.datetime.now()
+    today = reminder_day(slot, int(now.timestamp() // 60))
+    payment_day = datetime.date.fromisoformat(next_payment_date).toordinal()
+
+    candidates = []
+    if reminder_status < REMINDER_STATUS_3_DAYS:
+        candidates.append(payment_day - 3)
+    if reminder_status < REMINDER_STATUS_1_DAY:
+        candidates.append(payment_day - 1)
+    if reminder_status < REMINDER_STATUS_OVERDUE:
+        candidates.append(max(payment_day + 1, today))
+
+    for day in candidates:
+        if day >= today:
+            return max(slot_time(day, slot), now)
+    return None
+
+
+class ReminderScheduler:
+    """Sleeps until the earliest known reminder instant instead of polling the table.
+
+    The heap holds distinct wake-up instants; a wake-up runs one indexed sweep, which sends
+    everything due at that moment, and the delivered transitions schedule their next instants.
+    """
+
+    # how often _tick() runs while waiting; None - only on wake-ups
+    tick_interval: float | None = None
+
+    def __init__(self, bot, scope: ShardScope | None = None):
+        self.bot = bot
+        self.scope = scope
+        self._heap: list[datetime.datetime] = []
+        self._queued: set[datetime.datetime] = set()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._safety_sweep_at: datetime.datetime | None = None
+
+    def schedule(self, when: datetime.datetime) -> None:
+        if when in self._queued:
+            return
+        self._queued.add(when)
+        heapq.heappush(self._heap, when)
+        if self._heap[0] == when:
+            self._wakeup.set()
+
+    def schedule_subscription(self, next_payment_date: str, slot: int,
+                              reminder_status: int = REMINDER_STATUS_NONE) -> None:
+        when = next_reminder_at(next_payment_date, reminder_status, slot)
+        if when is not None:
+            self.schedule(when)
+
+    async def recover(self) -> None:
+        """Rebuilds the heap from the database after a restart."""
+        if await recover_outbox():
+            # a sweep was interrupted: finish draining it right away
+            self.schedule(datetime.datetime.now())
+        await self.load_pending()
+        self._ensure_safety_sweep()
+        logger.info("Планировщик напоминаний восстановлен: %d моментов пробуждения.", len(self._heap))
+
+    async def load_pending(self) -> None:
+        pending = await get_pending_reminder_keys(self.scope)
+        for next_payment_date, reminder_status, slot in pending:
+            self.schedule_subscription(next_payment_date, slot, reminder_status)
+
+    def start(self, recover: bool = False) -> None:
+        """Starts the wake-up loop.
+
+        With recover the heap is first rebuilt by recover() inside the loop's task, so startup
+        doesn't wait for a scan of every subscription.
+        """
+        self._task = asyncio.create_task(self._run(recover))
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _tick(self) -> None:
+        """Periodic housekeeping between sweeps; see tick_interval."""
+
+    def _new_dispatcher(self) -> ReminderDispatcher | None:
+        return None
+
+    async def _run(self, recover: bool = False) -> None:
+        if recover:
             try:
-                await context.bot.send_message(chat_id=user_id, text=message, parse_mode=ParseMode.MARKDOWN)
-                await update_reminder_status(sub_id, REMINDER_STATUS_1_DAY)
-                logger.info(f"Напоминание за 1 день отправлено для подписки ID {sub_id}, user {user_id}")
+                await self.recover()
             except Exception as e:
-                logger.error(f"Не удалось отправить напоминание для подписки ID {sub_id}, user {user_id}: {e}")
-    else:
-        logger.info("Нет подписок для напоминания за 1 день.")
-
-    overdue_subscriptions = await get_overdue_subscriptions()
-    if overdue_subscriptions:
-        logger.info(f"Найдено {len(overdue_subscriptions)} просроченных подписок.")
-        for sub_id, user_id, service_name, amount, next_payment_date, current_status in overdue_subscriptions:
-            message = (
-                f"🚨 **Подписка просрочена!** 🚨\n\n"
-                f"Срок оплаты подписки **{service_name}** на сумму **{amount:.2f}** истек **{next_payment_date}**.\n\n"
-                f"Чтобы отметить подписку как оплаченную и сбросить напоминания, используйте команду: `/paid {sub_id}`"
-            )
+                # the safety sweep still catches up on whatever was due
+                logger.error("Не удалось восстановить планировщик напоминаний: %s", e)
+                self.schedule(datetime.datetime.now() + RETRY_SWEEP_DELAY)
+                self._ensure_safety_sweep()
+        while True:
+            if self.tick_interval is not None:
+                await self._tick()
+            now = datetime.datetime.now()
+            if self._heap and self._heap[0] <= now:
+                while self._heap and self._heap[0] <= now:
+                    self._queued.discard(heapq.heappop(self._heap))
+                await self._sweep()
+                continue
+
+            timeout = (self._heap[0] - now).total_seconds() if self._heap else None
+            if self.tick_interval is not None:
+                timeout = min(timeout, self.tick_interval) if timeout is not None else self.tick_interval
+            self._wakeup.clear()
             try:
-                await context.bot.send_message(chat_id=user_id, text=message, parse_mode=ParseMode.MARKDOWN)
-                await update_reminder_status(sub_id, REMINDER_STATUS_OVERDUE)
-                logger.info(f"Напоминание о просрочке отправлено для подписки ID {sub_id}, user {user_id}")
-            except Exception as e:
-                logger.error(f"Не удалось отправить напоминание о просрочке для подписки ID {sub_id}, user {user_id}: {e}")
-    else:
-        logger.info("Нет просроченных подписок.")
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _sweep(self) -> None:
+        try:
+            stats, transitions = await run_reminder_sweep(self.bot, self._new_dispatcher(), self.scope)
+        except Exception as e:
+            logger.error("Ошибка во время проверки напоминаний: %s", e)
+            self.schedule(datetime.datetime.now() + RETRY_SWEEP_DELAY)
+            self._ensure_safety_sweep()
+            return
+
+        for next_payment_date, new_status, slot in transitions:
+            self.schedule_subscription(next_payment_date, slot, new_status)
+        if stats.failed:
+            self.schedule(datetime.datetime.now() + RETRY_SWEEP_DELAY)
+        self._ensure_safety_sweep()
 
+    def _ensure_safety_sweep(self) -> None:
+        # a rare extra pass covers anything written to the database behind the scheduler's back
+        now = datetime.datetime.now()
+        if self._safety_sweep_at is None or self._safety_sweep_at <= now:
+            self._safety_sweep_at = now + SAFETY_SWEEP_INTERVAL
+            self.schedule(self._safety_sweep_at)
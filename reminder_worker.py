@@ -0,0 +1,164 @@
+"""Reminder workers: send reminders separately from the bot front end, split by user.
+
+    REMINDER_SHARDS=16 python reminder_worker.py --processes 4
+
+Users are split into REMINDER_SHARDS shards by user_id. Every worker leases its fair share of shards
+in reminder_shards and keeps renewing the lease; when a worker dies, the others take its shards over
+once the lease expires. Run main.py with the same REMINDER_SHARDS so it leaves reminders to workers.
+"""
+from dotenv import load_dotenv
+load_dotenv()
+import argparse
+import asyncio
+import datetime
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import uuid
+
+from telegram import Bot
+
+from db_manager import (
+    init_pool, close_pool, run_migrations, init_shards, balance_shards, renew_shard_leases, release_shards,
+    pop_reminder_wakeups, ShardScope, SHARD_LEASE_SECONDS
+)
+from dispatcher import GLOBAL_RATE, ReminderDispatcher
+from reminder_scheduler import REMINDER_SHARDS, ReminderScheduler
+
+logger = logging.getLogger(__name__)
+
+TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+TELEGRAM_BASE_URL = os.getenv("TELEGRAM_BASE_URL")
+
+REBALANCE_INTERVAL = 5  # секунд между проверками шардов и очереди пробуждений
+RENEW_INTERVAL = SHARD_LEASE_SECONDS / 3
+
+
+class ShardedReminderScheduler(ReminderScheduler):
+    """ReminderScheduler limited to the shards this worker holds.
+
+    Between sweeps it rebalances leases and picks up wake-ups queued by the front end; a separate
+    task renews the leases, so a long sweep does not lose them.
+    """
+
+    tick_interval = REBALANCE_INTERVAL
+
+    def __init__(self, bot, scope: ShardScope):
+        super().__init__(bot, scope)
+        self.shards: list[int] = []
+        self._renew_task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        self._ensure_safety_sweep()
+        super().start()
+        self._renew_task = asyncio.create_task(self._renew())
+
+    async def stop(self) -> None:
+        if self._renew_task is not None:
+            self._renew_task.cancel()
+            try:
+                await self._renew_task
+            except asyncio.CancelledError:
+                pass
+            self._renew_task = None
+        await super().stop()
+        await release_shards(self.scope)
+
+    async def _tick(self) -> None:
+        try:
+            owned, taken = await balance_shards(self.scope)
+            if owned != self.shards:
+                logger.info("Воркер %s обслуживает шарды %s.", self.scope.owner, owned)
+            self.shards = owned
+            if taken:
+                # the new shards may have reminders due right now and later ones nobody told us about
+                self.schedule(datetime.datetime.now())
+                await self.load_pending()
+            for when in await pop_reminder_wakeups(self.scope):
+                self.schedule(when)
+        except Exception as e:
+            logger.error("Ошибка при перераспределении шардов: %s", e)
+
+    def _new_dispatcher(self) -> ReminderDispatcher:
+        # Telegram's 30 msg/s is per bot, so workers split it by their share of the shards
+        share = len(self.shards) / self.scope.shard_count
+        return ReminderDispatcher(self.bot, global_rate=max(GLOBAL_RATE * share, 1))
+
+    async def _renew(self) -> None:
+        while True:
+            await asyncio.sleep(RENEW_INTERVAL)
+            try:
+                await renew_shard_leases(self.scope)
+            except Exception as e:
+                logger.error("Не удалось продлить аренду шардов: %s", e)
+
+
+async def run_worker(token: str, shard_count: int) -> None:
+    await init_pool()
+    await run_migrations()
+    await init_shards(shard_count)
+
+    scope = ShardScope(f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}", shard_count)
+    bot = Bot(token, base_url=TELEGRAM_BASE_URL) if TELEGRAM_BASE_URL else Bot(token)
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    async with bot:
+        scheduler = ShardedReminderScheduler(bot, scope)
+        scheduler.start()
+        logger.info("Воркер напоминаний %s запущен, шардов всего: %d.", scope.owner, shard_count)
+        try:
+            await stop_event.wait()
+        finally:
+            await scheduler.stop()
+            await close_pool()
+            logger.info("Воркер напоминаний %s остановлен.", scope.owner)
+
+
+def _worker_process(token: str, shard_count: int) -> None:
+    logging.basicConfig(
+        format='%(asctime)s - %(process)d - %(name)s - %(levelname)s - %(message)s',
+        level=os.getenv("LOG_LEVEL", "INFO").upper()
+    )
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    asyncio.run(run_worker(token, shard_count))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Воркеры рассылки напоминаний")
+    parser.add_argument("--processes", type=int, default=1, help="сколько воркеров запустить на этой машине")
+    args = parser.parse_args()
+
+    if TOKEN is None:
+        print("Ошибка: Токен бота не найден. Установите переменную окружения TELEGRAM_BOT_TOKEN")
+        return
+    if REMINDER_SHARDS <= 0:
+        print("Ошибка: задайте REMINDER_SHARDS > 0, то же значение, что и у main.py")
+        return
+
+    if args.processes == 1:
+        _worker_process(TOKEN, REMINDER_SHARDS)
+        return
+
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=_worker_process, args=(TOKEN, REMINDER_SHARDS), daemon=False)
+        for _ in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        # the children got the same SIGINT and release their shards themselves
+        for process in processes:
+            process.join()
+
+
+if __name__ == '__main__':
+    main()
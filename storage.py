@@ -0,0 +1,229 @@
+"""Storage backend interface shared by the SQLite and PostgreSQL implementations.
+
+db_manager picks a backend in init_pool() and keeps caching and metrics on top of it, so the
+backends only deal with queries. Dates cross this interface as ISO strings ("YYYY-MM-DD"), amounts
+as money.Money, rows as the same tuples db_manager has always returned.
+"""
+import datetime
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import AsyncIterator
+
+from delivery import DeliveryClock
+from money import Money
+from recurrence import MONTHLY, Period
+
+# reminder_outbox.state
+OUTBOX_PENDING = 0
+OUTBOX_SENDING = 1
+OUTBOX_SENT = 2
+OUTBOX_FAILED = 3
+OUTBOX_BLOCKED = 4
+OUTBOX_CANCELLED = 5
+
+
+@dataclass(frozen=True)
+class ShardScope:
+    """The users a reminder worker is responsible for: shards it currently holds a lease on."""
+    owner: str
+    shard_count: int
+
+
+@dataclass(frozen=True)
+class SpendingSummary:
+    """Totals for one user's /stats or, for the admin report, for everyone, converted to one currency."""
+    users: int
+    subscriptions: int
+    monthly_total: float  # every subscription's cost brought to a month
+    upcoming_total: float  # payments due from today until the horizon
+    overdue_total: float
+    top_services: list[tuple[str, int, float]]  # (service_name, subscriptions, monthly_total)
+    unconverted: list[str]  # currencies with no exchange rate, left out of the totals
+
+
+def shard_of(user_id: int, shard_count: int) -> int:
+    # same expression as the backends' shard filters; abs() keeps negative chat ids in range
+    return abs(user_id) % shard_count
+
+
+def convert_totals(rows, factors: dict[str, float], columns: int) -> tuple[list[float], list[str]]:
+    """Column sums of (currency, total, ...) rows, each total multiplied by its currency's factor.
+
+    Also returns the currencies that have no factor; their rows are left out.
+    """
+    totals, unconverted = [0.0] * columns, []
+    for currency, *values in rows:
+        factor = factors.get(currency)
+        if factor is None:
+            unconverted.append(currency)
+            continue
+        for i, value in enumerate(values):
+            totals[i] += (value or 0) * factor
+    return totals, unconverted
+
+
+class Storage(ABC):
+    """Everything the bot, the scheduler and the workers need from the database."""
+
+    name: str
+
+    @abstractmethod
+    async def open(self) -> None: ...
+
+    @abstractmethod
+    async def close(self) -> None: ...
+
+    @abstractmethod
+    async def run_migrations(self) -> int:
+        """Applies pending schema steps; returns the schema version."""
+
+    # subscriptions
+
+    @abstractmethod
+    async def add_subscription(self, user_id: int, service_name: str, amount: Money, next_payment_date: str,
+                               period: Period = MONTHLY) -> int:
+        """Returns the new subscription id; the anchor day is taken from next_payment_date."""
+
+    @abstractmethod
+    async def add_subscriptions(self, rows: list[tuple[int, str, Money, str, Period]]) -> int:
+        """Inserts (user_id, service_name, amount, next_payment_date, period) rows in one transaction."""
+
+    @abstractmethod
+    async def list_subscriptions(self, user_id: int) -> list[tuple]:
+        """(id, service_name, amount, next_payment_date, period) ordered by id."""
+
+    @abstractmethod
+    async def list_subscriptions_page(self, user_id: int, cursor: int, limit: int,
+                                      backward: bool = False) -> list[tuple]:
+        """Up to limit list_subscriptions() rows with id > cursor, or with id < cursor when backward,
+        in id order either way."""
+
+    @abstractmethod
+    async def delete_subscription(self, user_id: int, sub_id: int) -> bool: ...
+
+    @abstractmethod
+    async def get_schedule(self, user_id: int, sub_id: int) -> tuple[str, str, Period, int | None] | None:
+        """(service_name, next_payment_date, period, anchor_day), or None if the user has no such subscription."""
+
+    @abstractmethod
+    async def move_payment_dates(self, updates: list[tuple[int, str, str]]) -> int:
+        """Applies (sub_id, expected current date, new date) and resets reminders; returns rows moved.
+
+        A row whose date no longer matches (changed concurrently) is left alone.
+        """
+
+    @abstractmethod
+    async def set_period(self, user_id: int, sub_id: int, period: Period) -> bool:
+        """Changes the period and re-anchors it on the current payment date."""
+
+    @abstractmethod
+    def iter_overdue(self, before: str, chunk_size: int, clock: DeliveryClock,
+                     scope: ShardScope | None = None) -> AsyncIterator[list[tuple]]:
+        """Chunks of (id, user_id, next_payment_date, period, anchor_day, slot) for subscriptions that
+        got the overdue reminder and are due before `before`; slot is the user's delivery slot."""
+
+    @abstractmethod
+    async def get_spending_summary(self, user_id: int | None, today: str, horizon: str, top: int,
+                                   factors: dict[str, float]) -> SpendingSummary:
+        """Reads the spending_* aggregates, never subscriptions; user_id None means everyone.
+
+        horizon is exclusive: upcoming payments are those in [today, horizon). The per-currency
+        sums are converted with factors, multipliers from minor units (ExchangeRates.factors()).
+        """
+
+    # reminders
+
+    @abstractmethod
+    def iter_due_reminders(self, chunk_size: int, clock: DeliveryClock,
+                           scope: ShardScope | None = None) -> AsyncIterator[list[tuple]]:
+        """Chunks of (id, user_id, service_name, amount, next_payment_date, reminder_status, new_status, slot).
+
+        Due is relative to each user's reminder day (see delivery.py), not the server's date.
+        """
+
+    @abstractmethod
+    async def enqueue_reminders(self, chunk: list[tuple]) -> None: ...
+
+    @abstractmethod
+    async def claim_outbox_batch(self, max_users: int, scope: ShardScope | None = None) -> list[tuple]:
+        """(outbox_id, sub_id, user_id, service_name, amount, next_payment_date, reminder_status)."""
+
+    @abstractmethod
+    async def complete_outbox(self, results: list[tuple[int, int]], max_attempts: int) -> None: ...
+
+    @abstractmethod
+    async def recover_outbox(self) -> int: ...
+
+    @abstractmethod
+    async def count_pending_outbox(self, scope: ShardScope | None = None) -> int: ...
+
+    @abstractmethod
+    async def prune_outbox(self, keep_days: int) -> None: ...
+
+    @abstractmethod
+    async def get_pending_reminder_keys(self, clock: DeliveryClock,
+                                        scope: ShardScope | None = None) -> list[tuple[str, int, int]]:
+        """Distinct (next_payment_date, reminder_status, slot) of subscriptions with reminders ahead."""
+
+    @abstractmethod
+    async def mark_users_blocked(self, user_ids: list[int]) -> None: ...
+
+    @abstractmethod
+    async def unblock_user(self, user_id: int) -> None: ...
+
+    # exchange rates
+
+    @abstractmethod
+    async def get_exchange_rates(self) -> dict[str, float]: ...
+
+    @abstractmethod
+    async def set_exchange_rates(self, rates: dict[str, float]) -> None:
+        """Replaces the whole table: currencies missing from rates lose theirs."""
+
+    # bot state (persistence.py)
+
+    @abstractmethod
+    async def get_bot_state(self, kind: str) -> list[tuple[str, bytes]]:
+        """(key, data) of every saved row of a kind."""
+
+    @abstractmethod
+    async def save_bot_state(self, rows: list[tuple[str, str, bytes | None]]) -> None:
+        """Upserts (kind, key, data) rows in one transaction; data None deletes the row."""
+
+    # delivery settings
+
+    @abstractmethod
+    async def get_user_settings(self, user_id: int) -> tuple[str | None, int | None]:
+        """(timezone, delivery_hour); None where the user kept the default."""
+
+    @abstractmethod
+    async def set_user_settings(self, user_id: int, timezone: str | None, delivery_hour: int | None,
+                                utc_offset: int | None) -> None: ...
+
+    @abstractmethod
+    async def list_user_timezones(self) -> list[tuple[str, int]]:
+        """Distinct (timezone, stored utc_offset) of users with their own timezone."""
+
+    @abstractmethod
+    async def set_utc_offsets(self, offsets: list[tuple[str, int]]) -> None:
+        """Stores the current (timezone, utc_offset) after a daylight saving change."""
+
+    # reminder worker shards
+
+    @abstractmethod
+    async def init_shards(self, shard_count: int) -> None: ...
+
+    @abstractmethod
+    async def balance_shards(self, scope: ShardScope, lease_seconds: float) -> tuple[list[int], list[int]]: ...
+
+    @abstractmethod
+    async def renew_shard_leases(self, scope: ShardScope, lease_seconds: float) -> int: ...
+
+    @abstractmethod
+    async def release_shards(self, scope: ShardScope) -> None: ...
+
+    @abstractmethod
+    async def add_reminder_wakeup(self, shard: int, when: datetime.datetime) -> None: ...
+
+    @abstractmethod
+    async def pop_reminder_wakeups(self, scope: ShardScope) -> list[datetime.datetime]: ...
@@ -0,0 +1,584 @@
+"""PostgreSQL backend: asyncpg pool, MVCC instead of SQLite's single writer.
+
+Selected by a postgresql:// DATABASE_URL. asyncpg prepares every statement once per connection and
+caches it, so the hot queries are planned once; the sweep scan prepares its chunk query explicitly.
+Outbox claiming picks its rows with SELECT ... FOR UPDATE SKIP LOCKED, so concurrent claimers never wait
+on each other and split the pending users between them.
+"""
+import datetime
+import logging
+import time
+
+import asyncpg
+
+from delivery import DeliveryClock
+from migrations import POSTGRES_MIGRATIONS, POSTGRES_SCHEMA_VERSION_TABLE
+from money import Money
+from recurrence import MONTHLY, Period
+from storage import (
+    OUTBOX_BLOCKED, OUTBOX_CANCELLED, OUTBOX_PENDING, OUTBOX_SENDING, ShardScope, SpendingSummary, Storage,
+    convert_totals
+)
+
+logger = logging.getLogger(__name__)
+
+# serializes migrations and shard rebalancing between processes
+MIGRATIONS_LOCK_ID = 7_340_001
+SHARDS_LOCK_ID = 7_340_002
+# row budget of an outbox claim per user in the batch
+CLAIM_ROWS_PER_USER = 20
+
+# The user's delivery slot (delivery.slot_of()) for subscriptions s LEFT JOIN users u; the clock's
+# default_hour, default_offset, slots_per_hour and slot_minutes are ${n}..${n + 3}.
+SLOT_EXPRESSION = (
+    "(COALESCE(u.delivery_hour, ${n}) * 60 - COALESCE(u.utc_offset, ${n1})"
+    " + abs(s.user_id) % ${n2} * ${n3})"
+)
+
+INSERT_SUBSCRIPTION = '''
+    INSERT INTO subscriptions
+        (user_id, service_name, amount_minor, currency, next_payment_date, period_unit, period_count, anchor_day)
+    VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+'''
+
+# $1 is the clock's minute, $2 its max_day, $3..$6 the slot arguments
+DUE_REMINDERS_QUERY = """
+    SELECT id, user_id, service_name, amount_minor, currency, next_payment_date, reminder_status, new_status, slot
+    FROM (
+        SELECT id, user_id, service_name, amount_minor, currency, next_payment_date, reminder_status, slot,
+            CASE
+                WHEN next_payment_date < reminder_day THEN 3
+                WHEN next_payment_date = reminder_day + 1 THEN 2
+                WHEN next_payment_date = reminder_day + 3 THEN 1
+                ELSE 0
+            END AS new_status
+        FROM (
+            SELECT s.id, s.user_id, s.service_name, s.amount_minor, s.currency, s.next_payment_date, s.reminder_status,
+                {slot} AS slot, DATE '1970-01-01' + (($1::bigint - {slot}) / 1440)::integer AS reminder_day
+            FROM subscriptions s
+            LEFT JOIN users u ON u.user_id = s.user_id
+            WHERE s.next_payment_date <= $2::date + 3 AND s.reminder_status < 3
+                AND (s.next_payment_date, s.reminder_status, s.id) > ($7, $8, $9)
+                AND COALESCE(u.blocked, 0) = 0
+                {shard_filter}
+        ) slotted
+    ) due
+    WHERE reminder_status < new_status
+    ORDER BY next_payment_date, reminder_status, id
+    LIMIT $10
+"""
+
+SHARD_FILTER = """
+    AND abs({column}) % ${n} IN (
+        SELECT shard FROM reminder_shards WHERE owner = ${n1} AND lease_until > ${n2}
+    )"""
+
+
+def _shard_filter(scope: ShardScope | None, column: str, first_param: int) -> tuple[str, list]:
+    """SQL fragment and its arguments, numbered from $first_param."""
+    if scope is None:
+        return "", []
+    sql = SHARD_FILTER.format(column=column, n=first_param, n1=first_param + 1, n2=first_param + 2)
+    return sql, [scope.shard_count, scope.owner, time.time()]
+
+
+def _slot_expression(first_param: int) -> str:
+    return SLOT_EXPRESSION.format(n=first_param, n1=first_param + 1, n2=first_param + 2, n3=first_param + 3)
+
+
+def _slot_args(clock: DeliveryClock) -> list:
+    return [clock.default_hour, clock.default_offset, clock.slots_per_hour, clock.slot_minutes]
+
+
+class PostgresStorage(Storage):
+
+    def __init__(self, dsn: str, pool_size: int):
+        self.name = dsn.rsplit("@", 1)[-1]  # without credentials, for logs
+        self.dsn = dsn
+        self.pool_size = pool_size
+        self.pool: asyncpg.Pool | None = None
+
+    async def open(self) -> None:
+        self.pool = await asyncpg.create_pool(self.dsn, min_size=1, max_size=self.pool_size)
+
+    async def close(self) -> None:
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    async def run_migrations(self) -> int:
+        async with self.pool.acquire() as con:
+            async with con.transaction():
+                await con.execute("SELECT pg_advisory_xact_lock($1)", MIGRATIONS_LOCK_ID)
+                await con.execute(POSTGRES_SCHEMA_VERSION_TABLE)
+                version = await con.fetchval("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+                for step_version, description, statements in POSTGRES_MIGRATIONS:
+                    if version >= step_version:
+                        continue
+                    for statement in statements:
+                        await con.execute(statement)
+                    await con.execute(
+                        "INSERT INTO schema_version (version, description) VALUES ($1, $2)", step_version, description
+                    )
+                    version = step_version
+                    logger.info("Применена миграция %d: %s", step_version, description)
+        return version
+
+    async def add_subscription(self, user_id: int, service_name: str, amount: Money, next_payment_date: str,
+                               period: Period = MONTHLY) -> int:
+        date = datetime.date.fromisoformat(next_payment_date)
+        return await self.pool.fetchval(
+            f"{INSERT_SUBSCRIPTION} RETURNING id",
+            user_id, service_name, amount.minor, amount.currency, date, period.unit, period.count, date.day
+        )
+
+    async def add_subscriptions(self, rows: list[tuple[int, str, Money, str, Period]]) -> int:
+        params = []
+        for user_id, service_name, amount, next_payment_date, period in rows:
+            date = datetime.date.fromisoformat(next_payment_date)
+            params.append((user_id, service_name, amount.minor, amount.currency, date, period.unit, period.count,
+                           date.day))
+        async with self.pool.acquire() as con:
+            async with con.transaction():
+                await con.executemany(INSERT_SUBSCRIPTION, params)
+        return len(params)
+
+    async def list_subscriptions(self, user_id: int) -> list[tuple]:
+        rows = await self.pool.fetch(
+            "SELECT id, service_name, amount_minor, currency, next_payment_date, period_unit, period_count "
+            "FROM subscriptions WHERE user_id = $1 ORDER BY id",
+            user_id
+        )
+        return [
+            (sub_id, service_name, Money(minor, currency), day.isoformat(), Period(unit, count))
+            for sub_id, service_name, minor, currency, day, unit, count in rows
+        ]
+
+    async def list_subscriptions_page(self, user_id: int, cursor: int, limit: int,
+                                      backward: bool = False) -> list[tuple]:
+        rows = await self.pool.fetch(f'''
+            SELECT id, service_name, amount_minor, currency, next_payment_date, period_unit, period_count
+            FROM subscriptions
+            WHERE user_id = $1 AND id {'<' if backward else '>'} $2
+            ORDER BY id {'DESC' if backward else ''}
+            LIMIT $3
+        ''', user_id, cursor, limit)
+        if backward:
+            rows.reverse()
+        return [
+            (sub_id, service_name, Money(minor, currency), day.isoformat(), Period(unit, count))
+            for sub_id, service_name, minor, currency, day, unit, count in rows
+        ]
+
+    async def delete_subscription(self, user_id: int, sub_id: int) -> bool:
+        status = await self.pool.execute("DELETE FROM subscriptions WHERE user_id = $1 AND id = $2", user_id, sub_id)
+        return status != "DELETE 0"
+
+    async def get_schedule(self, user_id: int, sub_id: int) -> tuple[str, str, Period, int | None] | None:
+        row = await self.pool.fetchrow(
+            "SELECT service_name, next_payment_date, period_unit, period_count, anchor_day "
+            "FROM subscriptions WHERE user_id = $1 AND id = $2",
+            user_id, sub_id
+        )
+        if row is None:
+            return None
+        service_name, day, unit, count, anchor_day = row
+        return service_name, day.isoformat(), Period(unit, count), anchor_day
+
+    async def move_payment_dates(self, updates: list[tuple[int, str, str]]) -> int:
+        if not updates:
+            return 0
+        sub_ids, old_dates, new_dates = zip(*(
+            (sub_id, datetime.date.fromisoformat(old_date), datetime.date.fromisoformat(new_date))
+            for sub_id, old_date, new_date in updates
+        ))
+        # one statement for the whole batch instead of a round trip per row
+        status = await self.pool.execute('''
+            UPDATE subscriptions s
+            SET next_payment_date = u.new_date, reminder_status = 0
+            FROM unnest($1::bigint[], $2::date[], $3::date[]) AS u(id, old_date, new_date)
+            WHERE s.id = u.id AND s.next_payment_date = u.old_date
+        ''', list(sub_ids), list(old_dates), list(new_dates))
+        return int(status.split()[-1])
+
+    async def set_period(self, user_id: int, sub_id: int, period: Period) -> bool:
+        status = await self.pool.execute('''
+            UPDATE subscriptions
+            SET period_unit = $1, period_count = $2, anchor_day = EXTRACT(DAY FROM next_payment_date)
+            WHERE user_id = $3 AND id = $4
+        ''', period.unit, period.count, user_id, sub_id)
+        return status != "UPDATE 0"
+
+    async def iter_overdue(self, before: str, chunk_size: int, clock: DeliveryClock,
+                           scope: ShardScope | None = None):
+        shard_filter, shard_args = _shard_filter(scope, "s.user_id", 9)
+        last_key = (datetime.date.min, 0)
+        async with self.pool.acquire() as con:
+            statement = await con.prepare(f'''
+                SELECT s.id, s.user_id, s.next_payment_date, s.period_unit, s.period_count, s.anchor_day,
+                    {_slot_expression(5)}
+                FROM subscriptions s
+                LEFT JOIN users u ON u.user_id = s.user_id
+                WHERE s.reminder_status = 3 AND s.next_payment_date < $1
+                    AND (s.next_payment_date, s.id) > ($2, $3)
+                    {shard_filter}
+                ORDER BY s.next_payment_date, s.id
+                LIMIT $4
+            ''')
+            while True:
+                rows = await statement.fetch(
+                    datetime.date.fromisoformat(before), *last_key, chunk_size, *_slot_args(clock), *shard_args
+                )
+                if not rows:
+                    return
+                last_key = (rows[-1][2], rows[-1][0])
+                yield [
+                    (sub_id, user_id, day.isoformat(), Period(unit, count), anchor_day, slot)
+                    for sub_id, user_id, day, unit, count, anchor_day, slot in rows
+                ]
+                if len(rows) < chunk_size:
+                    return
+
+    async def iter_due_reminders(self, chunk_size: int, clock: DeliveryClock, scope: ShardScope | None = None):
+        max_day = datetime.date.fromordinal(clock.max_day)
+        last_key = (datetime.date.min, 0, 0)
+        shard_filter, shard_args = _shard_filter(scope, "s.user_id", 11)
+        query = DUE_REMINDERS_QUERY.format(slot=_slot_expression(3), shard_filter=shard_filter)
+
+        async with self.pool.acquire() as con:
+            statement = await con.prepare(query)
+            while True:
+                rows = await statement.fetch(
+                    clock.now_minute, max_day, *_slot_args(clock), *last_key, chunk_size, *shard_args
+                )
+                if not rows:
+                    return
+                last_key = (rows[-1][5], rows[-1][6], rows[-1][0])
+                yield [
+                    (sub_id, user_id, service_name, Money(minor, currency), day.isoformat(), status, new_status, slot)
+                    for sub_id, user_id, service_name, minor, currency, day, status, new_status, slot in rows
+                ]
+                if len(rows) < chunk_size:
+                    return
+
+    async def enqueue_reminders(self, chunk: list[tuple]) -> None:
+        async with self.pool.acquire() as con:
+            async with con.transaction():
+                await con.executemany('''
+                    INSERT INTO reminder_outbox
+                        (idempotency_key, sub_id, user_id, service_name, amount_minor, currency, next_payment_date,
+                         reminder_status)
+                    VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+                    ON CONFLICT (idempotency_key) DO NOTHING
+                ''', [
+                    (f"{sub_id}:{datetime.date.fromisoformat(next_payment_date).toordinal()}:{new_status}",
+                     sub_id, user_id, service_name, amount.minor, amount.currency,
+                     datetime.date.fromisoformat(next_payment_date), new_status)
+                    for sub_id, user_id, service_name, amount, next_payment_date, _, new_status, _ in chunk
+                ])
+                await con.executemany(
+                    "UPDATE subscriptions SET reminder_status = $1 WHERE id = $2 AND next_payment_date = $3",
+                    [(new_status, sub_id, datetime.date.fromisoformat(next_payment_date))
+                     for sub_id, _, _, _, next_payment_date, _, new_status, _ in chunk]
+                )
+
+    async def claim_outbox_batch(self, max_users: int, scope: ShardScope | None = None) -> list[tuple]:
+        row_limit = max_users * CLAIM_ROWS_PER_USER
+        shard_filter, shard_args = _shard_filter(scope, "user_id", 2)
+        async with self.pool.acquire() as con:
+            async with con.transaction():
+                # candidates are locked first, skipping rows another claimer holds, so concurrent
+                # claimers end up with different users instead of the same ones
+                rows = await con.fetch('''
+                    WITH locked AS (
+                        SELECT id, user_id FROM reminder_outbox
+                        WHERE state = 0 {shard_filter}
+                        ORDER BY user_id, id
+                        LIMIT $1
+                        FOR UPDATE SKIP LOCKED
+                    ), counted AS (
+                        SELECT id, user_id, COUNT(*) OVER (PARTITION BY user_id) AS locked_rows FROM locked
+                    )
+                    SELECT o.id, o.sub_id, o.user_id, o.service_name, o.amount_minor, o.currency, o.next_payment_date,
+                        o.reminder_status,
+                        s.id IS NOT NULL AND s.next_payment_date = o.next_payment_date AS is_current,
+                        c.locked_rows = (
+                            SELECT COUNT(*) FROM reminder_outbox p WHERE p.state = 0 AND p.user_id = c.user_id
+                        ) AS complete
+                    FROM counted c
+                    JOIN reminder_outbox o ON o.id = c.id
+                    LEFT JOIN subscriptions s ON s.id = o.sub_id
+                    ORDER BY o.user_id, o.id
+                '''.format(shard_filter=shard_filter), row_limit, *shard_args)
+
+                # a user cut off by the limit or partly held by another claimer is left for a later
+                # batch, so a batch holds all pending rows of its users
+                users = sorted({row["user_id"] for row in rows if row["complete"]})[:max_users]
+                if not users and len(rows) >= row_limit:
+                    # one user with more pending reminders than a whole batch: sent in parts
+                    users = [rows[0]["user_id"]]
+                users = set(users)
+                rows = [row for row in rows if row["user_id"] in users]
+
+                claimed = [row for row in rows if row["is_current"]]
+                await con.execute(
+                    "UPDATE reminder_outbox SET state = $1, attempts = attempts + 1 WHERE id = ANY($2::bigint[])",
+                    OUTBOX_SENDING, [row["id"] for row in claimed]
+                )
+                await con.execute(
+                    "UPDATE reminder_outbox SET state = $1 WHERE id = ANY($2::bigint[])",
+                    OUTBOX_CANCELLED, [row["id"] for row in rows if not row["is_current"]]
+                )
+        return [
+            (outbox_id, sub_id, user_id, service_name, Money(minor, currency), day.isoformat(), status)
+            for outbox_id, sub_id, user_id, service_name, minor, currency, day, status, *_ in claimed
+        ]
+
+    async def complete_outbox(self, results: list[tuple[int, int]], max_attempts: int) -> None:
+        async with self.pool.acquire() as con:
+            await con.executemany('''
+                UPDATE reminder_outbox
+                SET state = CASE WHEN $1 = 0 AND attempts >= $3 THEN 3 ELSE $1 END,
+                    sent_at = CASE WHEN $1 = 2 THEN now() END
+                WHERE id = $2
+            ''', [(state, outbox_id, max_attempts) for outbox_id, state in results])
+
+    async def recover_outbox(self) -> int:
+        async with self.pool.acquire() as con:
+            async with con.transaction():
+                await con.execute("UPDATE reminder_outbox SET state = $1 WHERE state = $2", OUTBOX_PENDING, OUTBOX_SENDING)
+                return await con.fetchval("SELECT COUNT(*) FROM reminder_outbox WHERE state = $1", OUTBOX_PENDING)
+
+    async def count_pending_outbox(self, scope: ShardScope | None = None) -> int:
+        shard_filter, shard_args = _shard_filter(scope, "user_id", 2)
+        return await self.pool.fetchval(
+            f"SELECT COUNT(*) FROM reminder_outbox WHERE state = $1 {shard_filter}", OUTBOX_PENDING, *shard_args
+        )
+
+    async def prune_outbox(self, keep_days: int) -> None:
+        await self.pool.execute(
+            "DELETE FROM reminder_outbox WHERE state >= 2 AND created_at < now() - make_interval(days => $1)",
+            keep_days
+        )
+
+    async def get_spending_summary(self, user_id: int | None, today: str, horizon: str, top: int,
+                                   factors: dict[str, float]) -> SpendingSummary:
+        today_date, horizon_date = datetime.date.fromisoformat(today), datetime.date.fromisoformat(horizon)
+        # $1 is the user in the per-user queries, the global ones are numbered without it
+        if user_id is None:
+            args, user_filter, n = [], "", 1
+            by_day, by_service = "spending_global_by_day", "spending_global_by_service"
+        else:
+            args, user_filter, n = [user_id], "user_id = $1 AND", 2
+            by_day, by_service = "spending_by_day", "spending_by_service"
+
+        async with self.pool.acquire() as con:
+            async with con.transaction(isolation="repeatable_read", readonly=True):
+                users = await con.fetchval(
+                    f"SELECT COUNT(DISTINCT user_id) FROM spending_by_user WHERE {user_filter} subscriptions > 0",
+                    *args
+                )
+                by_currency = await con.fetch(
+                    "SELECT currency, SUM(subscriptions), SUM(monthly_total) "
+                    f"FROM spending_by_user WHERE {user_filter} subscriptions > 0 GROUP BY currency",
+                    *args
+                )
+                by_day_currency = await con.fetch(f'''
+                    SELECT currency, (SUM(total) FILTER (WHERE day >= ${n}))::float8,
+                        (SUM(total) FILTER (WHERE day < ${n}))::float8
+                    FROM {by_day}
+                    WHERE {user_filter} day < ${n + 1}
+                    GROUP BY currency
+                ''', *args, today_date, horizon_date)
+                # converted in the query, so ranking services across currencies is a single pass
+                top_services = await con.fetch(f'''
+                    SELECT b.service_name, SUM(b.subscriptions), SUM(b.monthly_total * f.factor) AS monthly_total
+                    FROM {by_service} b
+                    JOIN unnest(${n}::text[], ${n + 1}::float8[]) AS f (currency, factor) USING (currency)
+                    WHERE {user_filter} b.subscriptions > 0
+                    GROUP BY b.service_name
+                    ORDER BY monthly_total DESC, b.service_name
+                    LIMIT ${n + 2}
+                ''', *args, list(factors), list(factors.values()), top)
+
+        subscriptions = sum(count for _, count, _ in by_currency)
+        (monthly_total,), unconverted = convert_totals(
+            [(currency, total) for currency, _, total in by_currency], factors, 1
+        )
+        (upcoming_total, overdue_total), unconverted_days = convert_totals(by_day_currency, factors, 2)
+        return SpendingSummary(
+            users, subscriptions, monthly_total, upcoming_total, overdue_total, [tuple(row) for row in top_services],
+            sorted(set(unconverted) | set(unconverted_days)),
+        )
+
+    async def get_bot_state(self, kind: str) -> list[tuple[str, bytes]]:
+        rows = await self.pool.fetch("SELECT key, data FROM bot_state WHERE kind = $1", kind)
+        return [tuple(row) for row in rows]
+
+    async def save_bot_state(self, rows: list[tuple[str, str, bytes | None]]) -> None:
+        async with self.pool.acquire() as con:
+            async with con.transaction():
+                await con.executemany('''
+                    INSERT INTO bot_state (kind, key, data) VALUES ($1, $2, $3)
+                    ON CONFLICT (kind, key) DO UPDATE SET data = excluded.data, updated_at = now()
+                ''', [row for row in rows if row[2] is not None])
+                await con.executemany(
+                    "DELETE FROM bot_state WHERE kind = $1 AND key = $2",
+                    [(kind, key) for kind, key, data in rows if data is None]
+                )
+
+    async def get_exchange_rates(self) -> dict[str, float]:
+        return dict(await self.pool.fetch("SELECT currency, rate FROM exchange_rates"))
+
+    async def set_exchange_rates(self, rates: dict[str, float]) -> None:
+        async with self.pool.acquire() as con:
+            async with con.transaction():
+                await con.execute("DELETE FROM exchange_rates")
+                await con.executemany(
+                    "INSERT INTO exchange_rates (currency, rate) VALUES ($1, $2)", list(rates.items())
+                )
+
+    async def get_pending_reminder_keys(self, clock: DeliveryClock,
+                                        scope: ShardScope | None = None) -> list[tuple[str, int, int]]:
+        shard_filter, shard_args = _shard_filter(scope, "s.user_id", 5)
+        rows = await self.pool.fetch(
+            f"SELECT DISTINCT s.next_payment_date, s.reminder_status, {_slot_expression(1)} "
+            "FROM subscriptions s LEFT JOIN users u ON u.user_id = s.user_id "
+            f"WHERE s.reminder_status < 3 {shard_filter}",
+            *_slot_args(clock), *shard_args
+        )
+        return [(day.isoformat(), status, slot) for day, status, slot in rows]
+
+    async def mark_users_blocked(self, user_ids: list[int]) -> None:
+        async with self.pool.acquire() as con:
+            async with con.transaction():
+                await con.execute('''
+                    INSERT INTO users (user_id, blocked) SELECT unnest($1::bigint[]), 1
+                    ON CONFLICT (user_id) DO UPDATE SET blocked = 1
+                ''', user_ids)
+                await con.execute(
+                    "UPDATE reminder_outbox SET state = $1 WHERE user_id = ANY($2::bigint[]) AND state = $3",
+                    OUTBOX_BLOCKED, user_ids, OUTBOX_PENDING
+                )
+
+    async def unblock_user(self, user_id: int) -> None:
+        await self.pool.execute("UPDATE users SET blocked = 0 WHERE user_id = $1 AND blocked = 1", user_id)
+
+    async def get_user_settings(self, user_id: int) -> tuple[str | None, int | None]:
+        row = await self.pool.fetchrow("SELECT timezone, delivery_hour FROM users WHERE user_id = $1", user_id)
+        return (row[0], row[1]) if row else (None, None)
+
+    async def set_user_settings(self, user_id: int, timezone: str | None, delivery_hour: int | None,
+                                utc_offset: int | None) -> None:
+        await self.pool.execute('''
+            INSERT INTO users (user_id, timezone, delivery_hour, utc_offset) VALUES ($1, $2, $3, $4)
+            ON CONFLICT (user_id) DO UPDATE SET timezone = excluded.timezone,
+                delivery_hour = excluded.delivery_hour, utc_offset = excluded.utc_offset
+        ''', user_id, timezone, delivery_hour, utc_offset)
+
+    async def list_user_timezones(self) -> list[tuple[str, int]]:
+        rows = await self.pool.fetch("SELECT DISTINCT timezone, utc_offset FROM users WHERE timezone IS NOT NULL")
+        return [tuple(row) for row in rows]
+
+    async def set_utc_offsets(self, offsets: list[tuple[str, int]]) -> None:
+        await self.pool.executemany(
+            "UPDATE users SET utc_offset = $1 WHERE timezone = $2 AND utc_offset IS DISTINCT FROM $1",
+            [(offset, timezone) for timezone, offset in offsets]
+        )
+
+    async def init_shards(self, shard_count: int) -> None:
+        async with self.pool.acquire() as con:
+            async with con.transaction():
+                await con.execute("SELECT pg_advisory_xact_lock($1)", SHARDS_LOCK_ID)
+                existing, last_lease = await con.fetchrow(
+                    "SELECT COUNT(*), COALESCE(MAX(lease_until), 0) FROM reminder_shards"
+                )
+                if existing == shard_count:
+                    return
+                if existing and last_lease > time.time():
+                    raise RuntimeError(
+                        f"В базе {existing} шардов, а запрошено {shard_count}: сначала остановите все воркеры напоминаний."
+                    )
+                await con.execute("DELETE FROM reminder_shards")
+                await con.execute("INSERT INTO reminder_shards (shard) SELECT generate_series(0, $1 - 1)", shard_count)
+        logger.info("Напоминания разбиты на %d шардов.", shard_count)
+
+    async def balance_shards(self, scope: ShardScope, lease_seconds: float) -> tuple[list[int], list[int]]:
+        now = time.time()
+        async with self.pool.acquire() as con:
+            async with con.transaction():
+                await con.execute("SELECT pg_advisory_xact_lock($1)", SHARDS_LOCK_ID)
+                await con.execute('''
+                    INSERT INTO reminder_workers (worker_id, heartbeat_until) VALUES ($1, $2)
+                    ON CONFLICT (worker_id) DO UPDATE SET heartbeat_until = excluded.heartbeat_until
+                ''', scope.owner, now + lease_seconds)
+                await con.execute("DELETE FROM reminder_workers WHERE heartbeat_until < $1", now)
+                live_workers = await con.fetchval("SELECT COUNT(*) FROM reminder_workers")
+                fair_share = -(-scope.shard_count // live_workers)
+
+                owned = [row["shard"] for row in await con.fetch(
+                    "UPDATE reminder_shards SET lease_until = $1 WHERE owner = $2 RETURNING shard",
+                    now + lease_seconds, scope.owner
+                )]
+                owned.sort()
+
+                taken = []
+                if len(owned) > fair_share:
+                    await con.execute(
+                        "UPDATE reminder_shards SET owner = NULL, lease_until = 0 WHERE shard = ANY($1::int[])",
+                        owned[fair_share:]
+                    )
+                    owned = owned[:fair_share]
+                elif len(owned) < fair_share:
+                    free = await con.fetch(
+                        "SELECT shard, owner FROM reminder_shards WHERE owner IS NULL OR lease_until < $1 "
+                        "ORDER BY shard LIMIT $2",
+                        now, fair_share - len(owned)
+                    )
+                    taken = [row["shard"] for row in free]
+                    await con.execute(
+                        "UPDATE reminder_shards SET owner = $1, lease_until = $2 WHERE shard = ANY($3::int[])",
+                        scope.owner, now + lease_seconds, taken
+                    )
+                    await con.execute(
+                        "UPDATE reminder_outbox SET state = $1 WHERE state = $2 AND abs(user_id) % $3 = ANY($4::int[])",
+                        OUTBOX_PENDING, OUTBOX_SENDING, scope.shard_count,
+                        [row["shard"] for row in free if row["owner"] is not None]
+                    )
+                    owned = sorted(owned + taken)
+        return owned, taken
+
+    async def renew_shard_leases(self, scope: ShardScope, lease_seconds: float) -> int:
+        now = time.time()
+        async with self.pool.acquire() as con:
+            async with con.transaction():
+                await con.execute(
+                    "UPDATE reminder_workers SET heartbeat_until = $1 WHERE worker_id = $2", now + lease_seconds, scope.owner
+                )
+                status = await con.execute(
+                    "UPDATE reminder_shards SET lease_until = $1 WHERE owner = $2 AND lease_until > $3",
+                    now + lease_seconds, scope.owner, now
+                )
+        return int(status.split()[-1])
+
+    async def release_shards(self, scope: ShardScope) -> None:
+        async with self.pool.acquire() as con:
+            async with con.transaction():
+                await con.execute("SELECT pg_advisory_xact_lock($1)", SHARDS_LOCK_ID)
+                await con.execute('''
+                    UPDATE reminder_outbox SET state = $1
+                    WHERE state = $2 AND abs(user_id) % $3 IN (SELECT shard FROM reminder_shards WHERE owner = $4)
+                ''', OUTBOX_PENDING, OUTBOX_SENDING, scope.shard_count, scope.owner)
+                await con.execute("UPDATE reminder_shards SET owner = NULL, lease_until = 0 WHERE owner = $1", scope.owner)
+                await con.execute("DELETE FROM reminder_workers WHERE worker_id = $1", scope.owner)
+
+    async def add_reminder_wakeup(self, shard: int, when: datetime.datetime) -> None:
+        await self.pool.execute(
+            "INSERT INTO reminder_wakeups (shard, wake_at) VALUES ($1, $2) ON CONFLICT DO NOTHING",
+            shard, when.replace(microsecond=0)
+        )
+
+    async def pop_reminder_wakeups(self, scope: ShardScope) -> list[datetime.datetime]:
+        shard_filter, shard_args = _shard_filter(scope, "shard", 1)
+        rows = await self.pool.fetch(f"DELETE FROM reminder_wakeups WHERE TRUE {shard_filter} RETURNING wake_at", *shard_args)
+        return sorted({row["wake_at"] for row in rows})
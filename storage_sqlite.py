@@ -0,0 +1,663 @@
+"""SQLite backend (the default): aiosqlite with one writer and a pool of read-only readers."""
+import aiosqlite
+import asyncio
+import datetime
+import json
+import logging
+import time
+from contextlib import asynccontextmanager
+
+from delivery import EPOCH_DAY, DeliveryClock
+from migrations import MIGRATIONS, SCHEMA_VERSION_TABLE
+from money import Money
+from recurrence import MONTHLY, Period
+from storage import (
+    OUTBOX_BLOCKED, OUTBOX_CANCELLED, OUTBOX_PENDING, OUTBOX_SENDING, ShardScope, SpendingSummary, Storage,
+    convert_totals
+)
+
+logger = logging.getLogger(__name__)
+
+# applied once to every pooled connection
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode = WAL;",
+    "PRAGMA synchronous = NORMAL;",
+    "PRAGMA cache_size = -16000;",
+    "PRAGMA mmap_size = 268435456;",
+    "PRAGMA busy_timeout = 5000;",
+    "PRAGMA temp_store = MEMORY;",
+)
+
+
+class ConnectionPool:
+    """Long-lived connections: one writer and a fixed set of read-only readers."""
+
+    def __init__(self, db_name: str, readers: int):
+        self.db_name = db_name
+        self.readers_count = readers
+        self._writer = None
+        self._write_lock = asyncio.Lock()
+        self._readers = asyncio.Queue()
+        self._all_readers = []
+
+    async def _connect(self, read_only: bool) -> aiosqlite.Connection:
+        con = await aiosqlite.connect(self.db_name)
+        for pragma in CONNECTION_PRAGMAS:
+            await con.execute(pragma)
+        if read_only:
+            await con.execute("PRAGMA query_only = ON;")
+        return con
+
+    async def open(self) -> None:
+        self._writer = await self._connect(read_only=False)
+        for _ in range(self.readers_count):
+            con = await self._connect(read_only=True)
+            self._all_readers.append(con)
+            self._readers.put_nowait(con)
+
+    async def close(self) -> None:
+        for con in self._all_readers:
+            await con.close()
+        self._all_readers.clear()
+        self._readers = asyncio.Queue()
+        if self._writer is not None:
+            await self._writer.close()
+            self._writer = None
+
+    @asynccontextmanager
+    async def writer(self):
+        """Exclusive access to the writer; commits on success, rolls back on error."""
+        async with self._write_lock:
+            try:
+                yield self._writer
+                await self._writer.commit()
+            except BaseException:
+                await self._writer.rollback()
+                raise
+
+    @asynccontextmanager
+    async def reader(self):
+        con = await self._readers.get()
+        try:
+            yield con
+        finally:
+            self._readers.put_nowait(con)
+
+
+INSERT_SUBSCRIPTION = '''
+    INSERT INTO subscriptions
+        (user_id, service_name, amount_minor, currency, next_payment_date, period_unit, period_count, anchor_day)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# The user's delivery slot (delivery.slot_of()) for subscriptions s LEFT JOIN users u.
+SLOT_EXPRESSION = (
+    "(COALESCE(u.delivery_hour, :default_hour) * 60 - COALESCE(u.utc_offset, :default_offset)"
+    " + abs(s.user_id) % :slots_per_hour * :slot_minutes)"
+)
+
+# new_status: 1-за 3 дня, 2-за 1 день, 3-просрочка, counted from the user's reminder day;
+# rows already at that status are skipped.
+# The key ordering matches idx_subscriptions_due, so every chunk is a single index range scan.
+DUE_REMINDERS_QUERY = """
+    SELECT id, user_id, service_name, amount_minor, currency, next_payment_date, reminder_status, new_status, slot
+    FROM (
+        SELECT id, user_id, service_name, amount_minor, currency, next_payment_date, reminder_status, slot,
+            CASE
+                WHEN next_payment_date < reminder_day THEN 3
+                WHEN next_payment_date = reminder_day + 1 THEN 2
+                WHEN next_payment_date = reminder_day + 3 THEN 1
+                ELSE 0
+            END AS new_status
+        FROM (
+            SELECT s.id, s.user_id, s.service_name, s.amount_minor, s.currency, s.next_payment_date, s.reminder_status,
+                {slot} AS slot, :epoch_day + (:now_minute - {slot}) / 1440 AS reminder_day
+            FROM subscriptions s
+            LEFT JOIN users u ON u.user_id = s.user_id
+            WHERE s.next_payment_date <= :max_day + 3 AND s.reminder_status < 3
+                AND (s.next_payment_date, s.reminder_status, s.id) > (:last_date, :last_status, :last_id)
+                AND COALESCE(u.blocked, 0) = 0
+                {shard_filter}
+        )
+    )
+    WHERE reminder_status < new_status
+    ORDER BY next_payment_date, reminder_status, id
+    LIMIT :limit
+"""
+
+# The lease is checked inside the query itself, so a worker that lost a shard stops touching it
+# at its next statement, even before it notices.
+SHARD_FILTER = """
+    AND abs({column}) % :shard_count IN (
+        SELECT shard FROM reminder_shards WHERE owner = :owner AND lease_until > :now
+    )"""
+
+
+def _shard_filter(scope: ShardScope | None, column: str) -> tuple[str, dict]:
+    if scope is None:
+        return "", {}
+    return SHARD_FILTER.format(column=column), {
+        "owner": scope.owner, "shard_count": scope.shard_count, "now": time.time()
+    }
+
+
+def _clock_params(clock: DeliveryClock) -> dict:
+    return {
+        "now_minute": clock.now_minute, "default_hour": clock.default_hour, "default_offset": clock.default_offset,
+        "slots_per_hour": clock.slots_per_hour, "slot_minutes": clock.slot_minutes,
+        "epoch_day": EPOCH_DAY, "max_day": clock.max_day,
+    }
+
+
+def _to_day(date_str: str) -> int:
+    return datetime.date.fromisoformat(date_str).toordinal()
+
+
+def _from_day(day: int) -> str:
+    return datetime.date.fromordinal(day).isoformat()
+
+
+class SQLiteStorage(Storage):
+    """Dates are stored as day numbers (date.toordinal()), see migration 2."""
+
+    def __init__(self, db_name: str, readers: int):
+        self.name = db_name
+        self.pool = ConnectionPool(db_name, readers)
+
+    async def open(self) -> None:
+        await self.pool.open()
+
+    async def close(self) -> None:
+        await self.pool.close()
+
+    async def run_migrations(self) -> int:
+        async with self.pool.writer() as con:
+            await con.execute(SCHEMA_VERSION_TABLE)
+
+        version = 0
+        for step_version, description, statements in MIGRATIONS:
+            async with self.pool.writer() as con:
+                # IMMEDIATE takes the write lock up front, so concurrent starts apply each step once
+                await con.execute("BEGIN IMMEDIATE")
+                async with con.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version") as cur:
+                    (version,) = await cur.fetchone()
+                if version >= step_version:
+                    continue
+                for statement in statements:
+                    await con.execute(statement)
+                await con.execute(
+                    "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                    (step_version, description)
+                )
+                version = step_version
+                logger.info("Применена миграция %d: %s", step_version, description)
+        return version
+
+    async def add_subscription(self, user_id: int, service_name: str, amount: Money, next_payment_date: str,
+                               period: Period = MONTHLY) -> int:
+        date = datetime.date.fromisoformat(next_payment_date)
+        async with self.pool.writer() as con:
+            cur = await con.execute(INSERT_SUBSCRIPTION, (
+                user_id, service_name, amount.minor, amount.currency, date.toordinal(), period.unit, period.count,
+                date.day
+            ))
+        return cur.lastrowid
+
+    async def add_subscriptions(self, rows: list[tuple[int, str, Money, str, Period]]) -> int:
+        params = []
+        for user_id, service_name, amount, next_payment_date, period in rows:
+            date = datetime.date.fromisoformat(next_payment_date)
+            params.append((user_id, service_name, amount.minor, amount.currency, date.toordinal(), period.unit,
+                           period.count, date.day))
+        async with self.pool.writer() as con:
+            await con.executemany(INSERT_SUBSCRIPTION, params)
+        return len(params)
+
+    async def list_subscriptions(self, user_id: int) -> list[tuple]:
+        async with self.pool.reader() as con:
+            async with con.execute(
+                "SELECT id, service_name, amount_minor, currency, next_payment_date, period_unit, period_count "
+                "FROM subscriptions WHERE user_id = ? ORDER BY id",
+                (user_id,)
+            ) as cur:
+                rows = await cur.fetchall()
+        return [
+            (sub_id, service_name, Money(minor, currency), _from_day(day), Period(unit, count))
+            for sub_id, service_name, minor, currency, day, unit, count in rows
+        ]
+
+    async def list_subscriptions_page(self, user_id: int, cursor: int, limit: int,
+                                      backward: bool = False) -> list[tuple]:
+        async with self.pool.reader() as con:
+            async with con.execute(f'''
+                SELECT id, service_name, amount_minor, currency, next_payment_date, period_unit, period_count
+                FROM subscriptions
+                WHERE user_id = ? AND id {'<' if backward else '>'} ?
+                ORDER BY id {'DESC' if backward else ''}
+                LIMIT ?
+            ''', (user_id, cursor, limit)) as cur:
+                rows = await cur.fetchall()
+        if backward:
+            rows.reverse()
+        return [
+            (sub_id, service_name, Money(minor, currency), _from_day(day), Period(unit, count))
+            for sub_id, service_name, minor, currency, day, unit, count in rows
+        ]
+
+    async def delete_subscription(self, user_id: int, sub_id: int) -> bool:
+        async with self.pool.writer() as con:
+            cur = await con.execute("DELETE FROM subscriptions WHERE user_id = ? AND id = ?", (user_id, sub_id))
+        return cur.rowcount > 0
+
+    async def get_schedule(self, user_id: int, sub_id: int) -> tuple[str, str, Period, int | None] | None:
+        async with self.pool.reader() as con:
+            async with con.execute(
+                "SELECT service_name, next_payment_date, period_unit, period_count, anchor_day "
+                "FROM subscriptions WHERE user_id = ? AND id = ?",
+                (user_id, sub_id)
+            ) as cur:
+                row = await cur.fetchone()
+        if row is None:
+            return None
+        service_name, day, unit, count, anchor_day = row
+        return service_name, _from_day(day), Period(unit, count), anchor_day
+
+    async def move_payment_dates(self, updates: list[tuple[int, str, str]]) -> int:
+        async with self.pool.writer() as con:
+            cur = await con.executemany(
+                "UPDATE subscriptions SET next_payment_date = ?, reminder_status = 0 WHERE id = ? AND next_payment_date = ?",
+                [(_to_day(new_date), sub_id, _to_day(old_date)) for sub_id, old_date, new_date in updates]
+            )
+        return cur.rowcount
+
+    async def set_period(self, user_id: int, sub_id: int, period: Period) -> bool:
+        async with self.pool.writer() as con:
+            cur = await con.execute('''
+                UPDATE subscriptions
+                SET period_unit = ?, period_count = ?,
+                    anchor_day = CAST(strftime('%d', next_payment_date + 1721424.5) AS INTEGER)
+                WHERE user_id = ? AND id = ?
+            ''', (period.unit, period.count, user_id, sub_id))
+        return cur.rowcount > 0
+
+    async def iter_overdue(self, before: str, chunk_size: int, clock: DeliveryClock,
+                           scope: ShardScope | None = None):
+        shard_filter, shard_params = _shard_filter(scope, "s.user_id")
+        last_key = (0, 0)
+        while True:
+            async with self.pool.reader() as con:
+                async with con.execute(f'''
+                    SELECT s.id, s.user_id, s.next_payment_date, s.period_unit, s.period_count, s.anchor_day,
+                        {SLOT_EXPRESSION}
+                    FROM subscriptions s
+                    LEFT JOIN users u ON u.user_id = s.user_id
+                    WHERE s.reminder_status = 3 AND s.next_payment_date < :before
+                        AND (s.next_payment_date, s.id) > (:last_date, :last_id)
+                        {shard_filter}
+                    ORDER BY s.next_payment_date, s.id
+                    LIMIT :limit
+                ''', {"before": _to_day(before), "last_date": last_key[0], "last_id": last_key[1],
+                      "limit": chunk_size, **_clock_params(clock), **shard_params}) as cur:
+                    rows = await cur.fetchall()
+            if not rows:
+                return
+            last_key = (rows[-1][2], rows[-1][0])
+            yield [
+                (sub_id, user_id, _from_day(day), Period(unit, count), anchor_day, slot)
+                for sub_id, user_id, day, unit, count, anchor_day, slot in rows
+            ]
+            if len(rows) < chunk_size:
+                return
+
+    async def iter_due_reminders(self, chunk_size: int, clock: DeliveryClock, scope: ShardScope | None = None):
+        """Paginated by the (next_payment_date, reminder_status, id) key of idx_subscriptions_due."""
+        last_key = (0, 0, 0)
+        shard_filter, shard_params = _shard_filter(scope, "s.user_id")
+        query = DUE_REMINDERS_QUERY.format(slot=SLOT_EXPRESSION, shard_filter=shard_filter)
+
+        while True:
+            async with self.pool.reader() as con:
+                async with con.execute(query, {
+                    "last_date": last_key[0],
+                    "last_status": last_key[1],
+                    "last_id": last_key[2],
+                    "limit": chunk_size,
+                    **_clock_params(clock),
+                    **shard_params,
+                }) as cur:
+                    rows = await cur.fetchall()
+
+            if not rows:
+                return
+            last_key = (rows[-1][5], rows[-1][6], rows[-1][0])
+            yield [
+                (sub_id, user_id, service_name, Money(minor, currency), _from_day(day), status, new_status, slot)
+                for sub_id, user_id, service_name, minor, currency, day, status, new_status, slot in rows
+            ]
+            if len(rows) < chunk_size:
+                return
+
+    async def enqueue_reminders(self, chunk: list[tuple]) -> None:
+        async with self.pool.writer() as con:
+            await con.executemany('''
+                INSERT OR IGNORE INTO reminder_outbox
+                    (idempotency_key, sub_id, user_id, service_name, amount_minor, currency, next_payment_date,
+                     reminder_status)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [
+                (f"{sub_id}:{_to_day(next_payment_date)}:{new_status}", sub_id, user_id, service_name, amount.minor,
+                 amount.currency, _to_day(next_payment_date), new_status)
+                for sub_id, user_id, service_name, amount, next_payment_date, _, new_status, _ in chunk
+            ])
+            await con.executemany(
+                "UPDATE subscriptions SET reminder_status = ? WHERE id = ? AND next_payment_date = ?",
+                [(new_status, sub_id, _to_day(next_payment_date))
+                 for sub_id, _, _, _, next_payment_date, _, new_status, _ in chunk]
+            )
+
+    async def claim_outbox_batch(self, max_users: int, scope: ShardScope | None = None) -> list[tuple]:
+        shard_filter, shard_params = _shard_filter(scope, "user_id")
+        async with self.pool.writer() as con:
+            await con.execute("BEGIN IMMEDIATE")
+            async with con.execute('''
+                SELECT o.id, o.sub_id, o.user_id, o.service_name, o.amount_minor, o.currency, o.next_payment_date,
+                    o.reminder_status,
+                    s.id IS NOT NULL AND s.next_payment_date = o.next_payment_date AS is_current
+                FROM reminder_outbox o
+                LEFT JOIN subscriptions s ON s.id = o.sub_id
+                WHERE o.state = 0 AND o.user_id IN (
+                    SELECT DISTINCT user_id FROM reminder_outbox WHERE state = 0 {shard_filter}
+                    ORDER BY user_id LIMIT :max_users
+                )
+                ORDER BY o.user_id, o.id
+            '''.format(shard_filter=shard_filter), {"max_users": max_users, **shard_params}) as cur:
+                rows = await cur.fetchall()
+
+            claimed = [row[:8] for row in rows if row[8]]
+            stale = [(OUTBOX_CANCELLED, row[0]) for row in rows if not row[8]]
+            await con.executemany(
+                "UPDATE reminder_outbox SET state = ?, attempts = attempts + 1 WHERE id = ?",
+                [(OUTBOX_SENDING, row[0]) for row in claimed]
+            )
+            await con.executemany("UPDATE reminder_outbox SET state = ? WHERE id = ?", stale)
+
+        return [
+            (outbox_id, sub_id, user_id, service_name, Money(minor, currency), _from_day(day), status)
+            for outbox_id, sub_id, user_id, service_name, minor, currency, day, status in claimed
+        ]
+
+    async def complete_outbox(self, results: list[tuple[int, int]], max_attempts: int) -> None:
+        async with self.pool.writer() as con:
+            await con.executemany('''
+                UPDATE reminder_outbox
+                SET state = CASE WHEN :state = 0 AND attempts >= :max_attempts THEN 3 ELSE :state END,
+                    sent_at = CASE WHEN :state = 2 THEN datetime('now') END
+                WHERE id = :id
+            ''', [{"state": state, "id": outbox_id, "max_attempts": max_attempts} for outbox_id, state in results])
+
+    async def recover_outbox(self) -> int:
+        async with self.pool.writer() as con:
+            await con.execute("UPDATE reminder_outbox SET state = ? WHERE state = ?", (OUTBOX_PENDING, OUTBOX_SENDING))
+            async with con.execute("SELECT COUNT(*) FROM reminder_outbox WHERE state = ?", (OUTBOX_PENDING,)) as cur:
+                (pending,) = await cur.fetchone()
+        return pending
+
+    async def count_pending_outbox(self, scope: ShardScope | None = None) -> int:
+        shard_filter, shard_params = _shard_filter(scope, "user_id")
+        async with self.pool.reader() as con:
+            async with con.execute(
+                f"SELECT COUNT(*) FROM reminder_outbox WHERE state = :state {shard_filter}",
+                {"state": OUTBOX_PENDING, **shard_params}
+            ) as cur:
+                (pending,) = await cur.fetchone()
+        return pending
+
+    async def prune_outbox(self, keep_days: int) -> None:
+        async with self.pool.writer() as con:
+            await con.execute(
+                "DELETE FROM reminder_outbox WHERE state >= 2 AND created_at < datetime('now', ?)",
+                (f"-{keep_days} days",)
+            )
+
+    async def get_spending_summary(self, user_id: int | None, today: str, horizon: str, top: int,
+                                   factors: dict[str, float]) -> SpendingSummary:
+        params = {
+            "user_id": user_id, "today": _to_day(today), "horizon": _to_day(horizon), "top": top,
+            "factors": json.dumps(factors),
+        }
+        if user_id is None:
+            user_filter, by_day, by_service = "", "spending_global_by_day", "spending_global_by_service"
+        else:
+            user_filter, by_day, by_service = "user_id = :user_id AND", "spending_by_day", "spending_by_service"
+
+        async with self.pool.reader() as con:
+            async with con.execute(
+                f"SELECT COUNT(DISTINCT user_id) FROM spending_by_user WHERE {user_filter} subscriptions > 0",
+                params
+            ) as cur:
+                (users,) = await cur.fetchone()
+            async with con.execute(
+                "SELECT currency, SUM(subscriptions), SUM(monthly_total) "
+                f"FROM spending_by_user WHERE {user_filter} subscriptions > 0 GROUP BY currency",
+                params
+            ) as cur:
+                by_currency = await cur.fetchall()
+            async with con.execute(f'''
+                SELECT currency, SUM(CASE WHEN day >= :today THEN total END),
+                    SUM(CASE WHEN day < :today THEN total END)
+                FROM {by_day}
+                WHERE {user_filter} day < :horizon
+                GROUP BY currency
+            ''', params) as cur:
+                by_day_currency = await cur.fetchall()
+            # converted in the query, so ranking services across currencies is a single pass
+            async with con.execute(f'''
+                SELECT b.service_name, SUM(b.subscriptions), SUM(b.monthly_total * f.value) AS monthly_total
+                FROM {by_service} b
+                JOIN json_each(:factors) f ON f.key = b.currency
+                WHERE {user_filter} b.subscriptions > 0
+                GROUP BY b.service_name
+                ORDER BY monthly_total DESC, b.service_name
+                LIMIT :top
+            ''', params) as cur:
+                top_services = await cur.fetchall()
+
+        subscriptions = sum(count for _, count, _ in by_currency)
+        (monthly_total,), unconverted = convert_totals(
+            [(currency, total) for currency, _, total in by_currency], factors, 1
+        )
+        (upcoming_total, overdue_total), unconverted_days = convert_totals(by_day_currency, factors, 2)
+        return SpendingSummary(
+            users, subscriptions, monthly_total, upcoming_total, overdue_total, top_services,
+            sorted(set(unconverted) | set(unconverted_days)),
+        )
+
+    async def get_bot_state(self, kind: str) -> list[tuple[str, bytes]]:
+        async with self.pool.reader() as con:
+            async with con.execute("SELECT key, data FROM bot_state WHERE kind = ?", (kind,)) as cur:
+                return await cur.fetchall()
+
+    async def save_bot_state(self, rows: list[tuple[str, str, bytes | None]]) -> None:
+        async with self.pool.writer() as con:
+            await con.executemany('''
+                INSERT INTO bot_state (kind, key, data) VALUES (?, ?, ?)
+                ON CONFLICT (kind, key) DO UPDATE SET data = excluded.data, updated_at = datetime('now')
+            ''', [row for row in rows if row[2] is not None])
+            await con.executemany(
+                "DELETE FROM bot_state WHERE kind = ? AND key = ?",
+                [(kind, key) for kind, key, data in rows if data is None]
+            )
+
+    async def get_exchange_rates(self) -> dict[str, float]:
+        async with self.pool.reader() as con:
+            async with con.execute("SELECT currency, rate FROM exchange_rates") as cur:
+                rows = await cur.fetchall()
+        return dict(rows)
+
+    async def set_exchange_rates(self, rates: dict[str, float]) -> None:
+        async with self.pool.writer() as con:
+            await con.execute("DELETE FROM exchange_rates")
+            await con.executemany(
+                "INSERT INTO exchange_rates (currency, rate) VALUES (?, ?)", list(rates.items())
+            )
+
+    async def get_pending_reminder_keys(self, clock: DeliveryClock,
+                                        scope: ShardScope | None = None) -> list[tuple[str, int, int]]:
+        shard_filter, shard_params = _shard_filter(scope, "s.user_id")
+        async with self.pool.reader() as con:
+            async with con.execute(
+                f"SELECT DISTINCT s.next_payment_date, s.reminder_status, {SLOT_EXPRESSION} "
+                "FROM subscriptions s LEFT JOIN users u ON u.user_id = s.user_id "
+                f"WHERE s.reminder_status < 3 {shard_filter}",
+                {**_clock_params(clock), **shard_params}
+            ) as cur:
+                rows = await cur.fetchall()
+        return [(_from_day(day), status, slot) for day, status, slot in rows]
+
+    async def mark_users_blocked(self, user_ids: list[int]) -> None:
+        async with self.pool.writer() as con:
+            await con.executemany('''
+                INSERT INTO users (user_id, blocked) VALUES (?, 1)
+                ON CONFLICT (user_id) DO UPDATE SET blocked = 1
+            ''', [(user_id,) for user_id in user_ids])
+            await con.executemany(
+                "UPDATE reminder_outbox SET state = ? WHERE user_id = ? AND state = ?",
+                [(OUTBOX_BLOCKED, user_id, OUTBOX_PENDING) for user_id in user_ids]
+            )
+
+    async def unblock_user(self, user_id: int) -> None:
+        async with self.pool.writer() as con:
+            await con.execute("UPDATE users SET blocked = 0 WHERE user_id = ? AND blocked = 1", (user_id,))
+
+    async def get_user_settings(self, user_id: int) -> tuple[str | None, int | None]:
+        async with self.pool.reader() as con:
+            async with con.execute(
+                "SELECT timezone, delivery_hour FROM users WHERE user_id = ?", (user_id,)
+            ) as cur:
+                row = await cur.fetchone()
+        return (row[0], row[1]) if row else (None, None)
+
+    async def set_user_settings(self, user_id: int, timezone: str | None, delivery_hour: int | None,
+                                utc_offset: int | None) -> None:
+        async with self.pool.writer() as con:
+            await con.execute('''
+                INSERT INTO users (user_id, timezone, delivery_hour, utc_offset) VALUES (?, ?, ?, ?)
+                ON CONFLICT (user_id) DO UPDATE SET timezone = excluded.timezone,
+                    delivery_hour = excluded.delivery_hour, utc_offset = excluded.utc_offset
+            ''', (user_id, timezone, delivery_hour, utc_offset))
+
+    async def list_user_timezones(self) -> list[tuple[str, int]]:
+        async with self.pool.reader() as con:
+            async with con.execute(
+                "SELECT DISTINCT timezone, utc_offset FROM users WHERE timezone IS NOT NULL"
+            ) as cur:
+                return [tuple(row) for row in await cur.fetchall()]
+
+    async def set_utc_offsets(self, offsets: list[tuple[str, int]]) -> None:
+        async with self.pool.writer() as con:
+            await con.executemany(
+                "UPDATE users SET utc_offset = ? WHERE timezone = ? AND utc_offset IS NOT ?",
+                [(offset, timezone, offset) for timezone, offset in offsets]
+            )
+
+    async def init_shards(self, shard_count: int) -> None:
+        async with self.pool.writer() as con:
+            await con.execute("BEGIN IMMEDIATE")
+            async with con.execute("SELECT COUNT(*), COALESCE(MAX(lease_until), 0) FROM reminder_shards") as cur:
+                existing, last_lease = await cur.fetchone()
+            if existing == shard_count:
+                return
+            if existing and last_lease > time.time():
+                raise RuntimeError(
+                    f"В базе {existing} шардов, а запрошено {shard_count}: сначала остановите все воркеры напоминаний."
+                )
+            await con.execute("DELETE FROM reminder_shards")
+            await con.executemany(
+                "INSERT INTO reminder_shards (shard) VALUES (?)", [(shard,) for shard in range(shard_count)]
+            )
+        logger.info("Напоминания разбиты на %d шардов.", shard_count)
+
+    async def balance_shards(self, scope: ShardScope, lease_seconds: float) -> tuple[list[int], list[int]]:
+        now = time.time()
+        async with self.pool.writer() as con:
+            await con.execute("BEGIN IMMEDIATE")
+            await con.execute('''
+                INSERT INTO reminder_workers (worker_id, heartbeat_until) VALUES (?, ?)
+                ON CONFLICT (worker_id) DO UPDATE SET heartbeat_until = excluded.heartbeat_until
+            ''', (scope.owner, now + lease_seconds))
+            await con.execute("DELETE FROM reminder_workers WHERE heartbeat_until < ?", (now,))
+            async with con.execute("SELECT COUNT(*) FROM reminder_workers") as cur:
+                (live_workers,) = await cur.fetchone()
+            fair_share = -(-scope.shard_count // live_workers)
+
+            await con.execute(
+                "UPDATE reminder_shards SET lease_until = ? WHERE owner = ?", (now + lease_seconds, scope.owner)
+            )
+            async with con.execute(
+                "SELECT shard FROM reminder_shards WHERE owner = ? ORDER BY shard", (scope.owner,)
+            ) as cur:
+                owned = [shard for (shard,) in await cur.fetchall()]
+
+            taken = []
+            if len(owned) > fair_share:
+                await con.executemany(
+                    "UPDATE reminder_shards SET owner = NULL, lease_until = 0 WHERE shard = ?",
+                    [(shard,) for shard in owned[fair_share:]]
+                )
+                owned = owned[:fair_share]
+            elif len(owned) < fair_share:
+                async with con.execute(
+                    "SELECT shard, owner FROM reminder_shards WHERE owner IS NULL OR lease_until < ? ORDER BY shard LIMIT ?",
+                    (now, fair_share - len(owned))
+                ) as cur:
+                    free = await cur.fetchall()
+                await con.executemany(
+                    "UPDATE reminder_shards SET owner = ?, lease_until = ? WHERE shard = ?",
+                    [(scope.owner, now + lease_seconds, shard) for shard, _ in free]
+                )
+                await con.executemany(
+                    "UPDATE reminder_outbox SET state = ? WHERE state = ? AND abs(user_id) % ? = ?",
+                    [(OUTBOX_PENDING, OUTBOX_SENDING, scope.shard_count, shard)
+                     for shard, previous_owner in free if previous_owner is not None]
+                )
+                taken = [shard for shard, _ in free]
+                owned = sorted(owned + taken)
+        return owned, taken
+
+    async def renew_shard_leases(self, scope: ShardScope, lease_seconds: float) -> int:
+        now = time.time()
+        async with self.pool.writer() as con:
+            await con.execute(
+                "UPDATE reminder_workers SET heartbeat_until = ? WHERE worker_id = ?", (now + lease_seconds, scope.owner)
+            )
+            cur = await con.execute(
+                "UPDATE reminder_shards SET lease_until = ? WHERE owner = ? AND lease_until > ?",
+                (now + lease_seconds, scope.owner, now)
+            )
+        return cur.rowcount
+
+    async def release_shards(self, scope: ShardScope) -> None:
+        async with self.pool.writer() as con:
+            await con.execute("BEGIN IMMEDIATE")
+            await con.execute('''
+                UPDATE reminder_outbox SET state = ?
+                WHERE state = ? AND abs(user_id) % ? IN (SELECT shard FROM reminder_shards WHERE owner = ?)
+            ''', (OUTBOX_PENDING, OUTBOX_SENDING, scope.shard_count, scope.owner))
+            await con.execute("UPDATE reminder_shards SET owner = NULL, lease_until = 0 WHERE owner = ?", (scope.owner,))
+            await con.execute("DELETE FROM reminder_workers WHERE worker_id = ?", (scope.owner,))
+
+    async def add_reminder_wakeup(self, shard: int, when: datetime.datetime) -> None:
+        async with self.pool.writer() as con:
+            await con.execute(
+                "INSERT OR IGNORE INTO reminder_wakeups (shard, wake_at) VALUES (?, ?)",
+                (shard, when.isoformat(timespec="seconds"))
+            )
+
+    async def pop_reminder_wakeups(self, scope: ShardScope) -> list[datetime.datetime]:
+        shard_filter, shard_params = _shard_filter(scope, "shard")
+        async with self.pool.writer() as con:
+            async with con.execute(
+                f"DELETE FROM reminder_wakeups WHERE 1 {shard_filter} RETURNING wake_at", shard_params
+            ) as cur:
+                rows = await cur.fetchall()
+        return sorted({datetime.datetime.fromisoformat(wake_at) for (wake_at,) in rows})
@@ -0,0 +1,256 @@
+"""Import and export of subscriptions as CSV or JSON.
+
+Files are parsed as a stream of records, so memory use doesn't depend on the file size: CSV line by
+line, JSON (an array of objects or JSON Lines) decoded value by value. Valid rows are inserted in
+batches, one executemany transaction per batch; invalid ones are reported with their line number
+and skipped. Exports are written a page of rows at a time, as the pages are read.
+"""
+import csv
+import datetime
+import itertools
+import json
+import math
+from decimal import Decimal
+from dataclasses import dataclass, field
+from typing import AsyncIterable, Callable, Iterable, Iterator, TextIO
+
+from db_manager import add_subscriptions
+from money import BASE_CURRENCY, Money, from_decimal, parse_currency, parse_money
+from recurrence import MONTHLY, Period, parse_period
+
+FORMAT_CSV = "csv"
+FORMAT_JSON = "json"
+
+FIELDS = ("service_name", "amount", "currency", "next_payment_date", "period")
+REQUIRED_FIELDS = ("service_name", "amount", "next_payment_date")
+
+IMPORT_BATCH_SIZE = 5000
+SERVICE_NAME_MAX_LENGTH = 200
+MAX_REPORTED_ERRORS = 20
+# a JSON value that doesn't close within this many characters is treated as malformed
+MAX_RECORD_LENGTH = 64 * 1024
+READ_CHUNK_SIZE = 64 * 1024
+
+
+@dataclass
+class ImportReport:
+    imported: int = 0
+    error_count: int = 0
+    # the first MAX_REPORTED_ERRORS (line, message) pairs
+    errors: list[tuple[int, str]] = field(default_factory=list)
+    # distinct payment dates of the imported rows, for scheduling reminders
+    dates: set[str] = field(default_factory=set)
+
+    def add_error(self, line: int, message: str) -> None:
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+
+def detect_format(file_name: str | None) -> str | None:
+    suffix = (file_name or "").rsplit(".", 1)[-1].lower()
+    if suffix == "csv":
+        return FORMAT_CSV
+    if suffix in ("json", "jsonl", "ndjson"):
+        return FORMAT_JSON
+    return None
+
+
+def iter_csv_records(text: TextIO) -> Iterator[tuple[int, dict | ValueError]]:
+    """(line, record) pairs; the header names the columns, "," or ";" separated."""
+    header_line = text.readline()
+    if not header_line.strip():
+        raise ValueError("Файл пустой")
+    delimiter = ";" if header_line.count(";") > header_line.count(",") else ","
+    reader = csv.reader(itertools.chain([header_line], text), delimiter=delimiter)
+    header = [name.strip().lower() for name in next(reader)]
+    missing = [name for name in REQUIRED_FIELDS if name not in header]
+    if missing:
+        raise ValueError(f"В заголовке нет колонок: {', '.join(missing)}")
+
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        if len(row) > len(header):
+            yield reader.line_num, ValueError("Лишние значения в строке")
+            continue
+        yield reader.line_num, dict(zip(header, row))
+
+
+def iter_json_records(text: TextIO) -> Iterator[tuple[int, dict | ValueError]]:
+    """(line, record) pairs from a JSON array of objects or from JSON Lines, decoded incrementally.
+
+    A malformed line in JSON Lines is reported and skipped; inside an array there is no way to
+    resynchronize, so a syntax error ends the file.
+    """
+    decoder = json.JSONDecoder()
+    chunks = iter(lambda: text.read(READ_CHUNK_SIZE), "")
+    buffer, pos, line = "", 0, 1
+    eof = False
+    json_lines = None
+
+    while True:
+        # separators between top-level values: whitespace, commas and the array brackets
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,[]":
+                if json_lines is None and buffer[pos] not in " \t\r\n":
+                    json_lines = buffer[pos] != "["
+                if buffer[pos] == "\n":
+                    line += 1
+                pos += 1
+            if pos < len(buffer) or eof:
+                break
+            chunk = next(chunks, None)
+            if chunk is None:
+                eof = True
+            else:
+                buffer, pos = buffer[pos:] + chunk, 0
+        if pos >= len(buffer):
+            return
+        if json_lines is None:
+            json_lines = True
+
+        try:
+            record, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            complete_line = json_lines and "\n" in buffer[pos:]
+            if not eof and not complete_line and len(buffer) - pos < MAX_RECORD_LENGTH:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    eof = True
+                else:
+                    buffer, pos = buffer[pos:] + chunk, 0
+                continue
+            yield line, ValueError("Некорректный JSON")
+            if not json_lines:
+                return
+            newline = buffer.find("\n", pos)
+            if newline == -1:
+                return
+            pos = newline
+            continue
+
+        yield line, record if isinstance(record, dict) else ValueError("Ожидался объект JSON")
+        line += buffer.count("\n", pos, end)
+        pos = end
+
+
+def _parse_amount(value, currency: str | None) -> Money:
+    """A JSON number or text like "9.99", "9,99 EUR" or "$5"; currency applies when the text names none."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        if not math.isfinite(value):
+            raise ValueError(f"Некорректная сумма: {value!r}")
+        # str() of a float is its shortest repr, so 9.99 stays 9.99 rather than 9.9900000000000002131...
+        return from_decimal(Decimal(str(value)), currency or BASE_CURRENCY)
+    return parse_money(str(value), currency)
+
+
+def parse_record(record: dict, user_id: int | None = None) -> tuple[int, str, Money, str, Period]:
+    """Validates a record into an add_subscriptions() row. Raises ValueError.
+
+    With user_id the rows belong to that user (the bot's /import); without it every record
+    needs a user_id field (the admin loader).
+    """
+    missing = [name for name in REQUIRED_FIELDS if record.get(name) in (None, "")]
+    if missing:
+        raise ValueError(f"Не заполнено: {', '.join(missing)}")
+
+    if user_id is None:
+        try:
+            user_id = int(str(record.get("user_id", "")).strip())
+        except ValueError:
+            raise ValueError(f"Некорректный user_id: {record.get('user_id')!r}") from None
+
+    service_name = str(record["service_name"]).strip()
+    if not service_name or len(service_name) > SERVICE_NAME_MAX_LENGTH:
+        raise ValueError(f"Название должно быть от 1 до {SERVICE_NAME_MAX_LENGTH} символов")
+
+    currency_text = str(record.get("currency") or "").strip()
+    amount = _parse_amount(record["amount"], parse_currency(currency_text) if currency_text else None)
+
+    date_str = str(record["next_payment_date"]).strip()
+    try:
+        date_str = datetime.date.fromisoformat(date_str).isoformat()
+    except ValueError:
+        raise ValueError(f"Дата не в формате ГГГГ-ММ-ДД: {date_str!r}") from None
+
+    period_text = str(record.get("period") or "").strip()
+    period = parse_period(period_text) if period_text else MONTHLY
+    return user_id, service_name, amount, date_str, period
+
+
+async def import_records(records: Iterable[tuple[int, dict | ValueError]], user_id: int | None = None,
+                         batch_size: int = IMPORT_BATCH_SIZE, max_rows: int | None = None,
+                         on_error: Callable[[int, str], None] | None = None) -> ImportReport:
+    """Validates records and inserts the valid ones in batches of batch_size.
+
+    Every invalid record goes to on_error as well as into the report. With max_rows, reading stops
+    once that many records were seen.
+    """
+    report = ImportReport()
+    batch = []
+
+    def reject(line: int, message: str) -> None:
+        report.add_error(line, message)
+        if on_error is not None:
+            on_error(line, message)
+
+    for seen, (line, record) in enumerate(records, 1):
+        if max_rows is not None and seen > max_rows:
+            reject(line, f"Превышен лимит в {max_rows} строк, остальное не загружено")
+            break
+        if isinstance(record, ValueError):
+            reject(line, str(record))
+            continue
+        try:
+            row = parse_record(record, user_id)
+        except ValueError as e:
+            reject(line, str(e))
+            continue
+        batch.append(row)
+        if len(batch) >= batch_size:
+            report.imported += await add_subscriptions(batch)
+            report.dates.update(row[3] for row in batch)
+            batch = []
+
+    if batch:
+        report.imported += await add_subscriptions(batch)
+        report.dates.update(row[3] for row in batch)
+    return report
+
+
+def open_records(text: TextIO, file_format: str) -> Iterator[tuple[int, dict | ValueError]]:
+    if file_format == FORMAT_CSV:
+        return iter_csv_records(text)
+    return iter_json_records(text)
+
+
+async def write_export(chunks: AsyncIterable[list[tuple]], file_format: str, out: TextIO) -> int:
+    """Writes chunks of iter_subscriptions() rows, as they arrive, in a form import_records() reads back.
+
+    Returns the number of rows written.
+    """
+    written = 0
+    if file_format == FORMAT_CSV:
+        writer = csv.writer(out)
+        writer.writerow(FIELDS)
+        async for chunk in chunks:
+            writer.writerows(
+                (service_name, str(amount.amount), amount.currency, next_payment_date, period.code)
+                for _, service_name, amount, next_payment_date, period in chunk
+            )
+            written += len(chunk)
+        return written
+
+    # one object per line inside the array, so the file also diffs and greps well
+    out.write("[")
+    async for chunk in chunks:
+        for _, service_name, amount, next_payment_date, period in chunk:
+            out.write(",\n" if written else "\n")
+            out.write(json.dumps(
+                dict(zip(FIELDS, (service_name, float(amount.amount), amount.currency, next_payment_date, period.code))),
+                ensure_ascii=False
+            ))
+            written += 1
+    out.write("\n]\n")
+    return written
@@ -0,0 +1,38 @@
+"""Storage fixtures: every storage test runs against SQLite and PostgreSQL.
+
+PostgreSQL comes from pgserver (pip install pgserver), an embedded server started once per
+session; without it the postgres cases are skipped. Each test gets an empty database.
+"""
+import pytest
+
+from storage_postgres import PostgresStorage
+from storage_sqlite import SQLiteStorage
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(scope="session")
+def postgres_url(tmp_path_factory):
+    pgserver = pytest.importorskip("pgserver")
+    server = pgserver.get_server(tmp_path_factory.mktemp("pgdata"), cleanup_mode="stop")
+    server.psql("CREATE DATABASE bot_test;")
+    return server.get_uri("bot_test")
+
+
+@pytest.fixture(params=["sqlite", "postgres"])
+async def storage(request, tmp_path, anyio_backend):
+    if request.param == "sqlite":
+        storage = SQLiteStorage(str(tmp_path / "bot.db"), readers=2)
+    else:
+        storage = PostgresStorage(request.getfixturevalue("postgres_url"), pool_size=3)
+    await storage.open()
+    try:
+        if request.param == "postgres":
+            await storage.pool.execute("DROP SCHEMA public CASCADE; CREATE SCHEMA public;")
+        await storage.run_migrations()
+        yield storage
+    finally:
+        await storage.close()
@@ -0,0 +1,83 @@
+import datetime
+import sqlite3
+
+import pytest
+
+from migrations import MIGRATIONS
+from money import Money
+from recurrence import MONTHLY
+from storage_sqlite import SQLiteStorage
+
+pytestmark = pytest.mark.anyio
+
+# subscription.db as the bot created it before versioned migrations: REAL amounts, TEXT dates
+BASELINE_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS subscriptions (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        service_name TEXT NOT NULL,
+        amount REAL,
+        next_payment_date TEXT NOT NULL,
+        reminder_status INTEGER DEFAULT 0
+    )
+'''
+
+
+@pytest.fixture
+def baseline_db(tmp_path):
+    path = str(tmp_path / "subscription.db")
+    con = sqlite3.connect(path)
+    con.execute(BASELINE_SCHEMA)
+    con.executemany(
+        "INSERT INTO subscriptions (user_id, service_name, amount, next_payment_date, reminder_status) "
+        "VALUES (?, ?, ?, ?, ?)",
+        [
+            (1, "Netflix", 9.99, "2025-03-31", 0),
+            (1, "Мелочь", 0.295, "2025-02-28", 1),
+            (1, "Кинопоиск", 299.0, "2024-12-31", 3),
+            (2, "Без суммы", None, "2025-01-15", 0),
+        ]
+    )
+    con.commit()
+    con.close()
+    return path
+
+
+async def test_baseline_database_is_migrated(baseline_db, anyio_backend):
+    storage = SQLiteStorage(baseline_db, readers=1)
+    await storage.open()
+    try:
+        assert await storage.run_migrations() == MIGRATIONS[-1][0]
+
+        subscriptions = await storage.list_subscriptions(1)
+        assert [(name, amount, date, period) for _, name, amount, date, period in subscriptions] == [
+            ("Netflix", Money(999, "RUB"), "2025-03-31", MONTHLY),
+            ("Мелочь", Money(30, "RUB"), "2025-02-28", MONTHLY),
+            ("Кинопоиск", Money(29900, "RUB"), "2024-12-31", MONTHLY),
+        ]
+        [(_, _, amount, date, _)] = await storage.list_subscriptions(2)
+        assert (amount, date) == (Money(0, "RUB"), "2025-01-15")
+
+        # the anchor day comes from the old date, so Mar 31 stays on the 31st
+        netflix_id = subscriptions[0][0]
+        assert await storage.get_schedule(1, netflix_id) == ("Netflix", "2025-03-31", MONTHLY, 31)
+
+        # the spending aggregates are backfilled from the migrated amounts
+        summary = await storage.get_spending_summary(
+            1, "2025-01-01", "2025-04-01", 10, {"RUB": 0.01}
+        )
+        assert (summary.users, summary.subscriptions) == (1, 3)
+        assert summary.monthly_total == pytest.approx(9.99 + 0.30 + 299)
+        assert summary.upcoming_total == pytest.approx(9.99 + 0.30)
+        assert summary.overdue_total == pytest.approx(299)
+
+        # reminder statuses are kept, dates become day numbers
+        async with storage.pool.reader() as con:
+            async with con.execute("SELECT service_name, reminder_status FROM subscriptions ORDER BY id") as cur:
+                assert await cur.fetchall() == [("Netflix", 0), ("Мелочь", 1), ("Кинопоиск", 3), ("Без суммы", 0)]
+            async with con.execute(
+                "SELECT next_payment_date FROM subscriptions WHERE service_name = 'Netflix'"
+            ) as cur:
+                assert await cur.fetchone() == (datetime.date(2025, 3, 31).toordinal(),)
+    finally:
+        await storage.close()
@@ -0,0 +1,92 @@
+from decimal import Decimal
+
+import pytest
+
+from money import BASE_CURRENCY, ExchangeRates, Money, format_total, from_decimal, parse_currency, parse_money
+from storage import convert_totals
+
+
+@pytest.mark.parametrize("text, money", [
+    ("9.99 USD", Money(999, "USD")),
+    ("9,99 USD", Money(999, "USD")),
+    ("9,99€", Money(999, "EUR")),
+    ("€9.99", Money(999, "EUR")),
+    ("$5", Money(500, "USD")),
+    ("1 490 ₽", Money(149000, "RUB")),
+    ("299 руб.", Money(29900, "RUB")),
+    ("10 eur", Money(1000, "EUR")),
+    ("9.9 GBP", Money(990, "GBP")),
+    ("0", Money(0, BASE_CURRENCY)),
+])
+def test_parse_money(text, money):
+    assert parse_money(text) == money
+
+
+def test_parse_money_default_currency():
+    assert parse_money("299") == Money(29900, BASE_CURRENCY)
+    assert parse_money("299", "USD") == Money(29900, "USD")
+    # a currency in the text wins over the default
+    assert parse_money("299 EUR", "USD") == Money(29900, "EUR")
+
+
+def test_zero_decimal_currency():
+    assert parse_money("1500 JPY") == Money(1500, "JPY")
+    assert parse_money("¥1 500") == Money(1500, "JPY")
+    assert str(Money(1500, "JPY")) == "1500 JPY"
+    assert Money(1500, "JPY").amount == Decimal(1500)
+    with pytest.raises(ValueError):
+        parse_money("15.5 JPY")
+
+
+def test_amounts_are_exact():
+    assert str(Money(999, "USD")) == "9.99 USD"
+    assert Money(10, "RUB").amount == Decimal("0.10")
+    # more digits than the currency has are refused, not rounded
+    with pytest.raises(ValueError):
+        parse_money("9.999 USD")
+    assert from_decimal(Decimal("9.990"), "USD") == Money(999, "USD")
+
+
+@pytest.mark.parametrize("text", ["5 XYZ", "$5 USD", "abc", "", "-5", "5 - 3", "1e5", "9.99.9"])
+def test_parse_money_rejects(text):
+    with pytest.raises(ValueError):
+        parse_money(text)
+
+
+def test_parse_money_rejects_huge_amounts():
+    with pytest.raises(ValueError):
+        parse_money("10000000000000 USD")
+
+
+def test_parse_currency():
+    assert parse_currency(" usd ") == "USD"
+    assert parse_currency("₽") == "RUB"
+    with pytest.raises(ValueError, match="Неизвестная валюта"):
+        parse_currency("XYZ")
+
+
+def test_format_total_rounds_to_minor_unit():
+    assert format_total(1234.5678, "USD") == "1234.57 USD"
+    assert format_total(1500.4, "JPY") == "1500 JPY"
+    assert format_total(0, "RUB") == "0.00 RUB"
+
+
+def test_exchange_rate_factors():
+    rates = ExchangeRates({"RUB": 1.0, "USD": 90.0, "EUR": 100.0, "JPY": 0.6})
+    assert rates.factor("USD", "RUB") == pytest.approx(0.9)
+    assert rates.factor("USD", "EUR") == pytest.approx(0.009)
+    # JPY has no minor unit: 1 yen is 0.6 RUB
+    assert rates.factor("JPY", "RUB") == pytest.approx(0.6)
+    assert rates.factor("RUB", "RUB") == pytest.approx(0.01)
+    assert rates.factor("GBP", "RUB") is None
+    assert rates.factors(["RUB", "USD", "GBP"], "RUB") == pytest.approx({"RUB": 0.01, "USD": 0.9})
+
+
+def test_unconverted_totals_without_rates():
+    factors = ExchangeRates({}).factors(["RUB", "USD", "EUR"], "RUB")
+    assert factors == {"RUB": 0.01}
+
+    rows = [("RUB", 99900, 100), ("USD", 1200, None), ("EUR", 500, 500)]
+    totals, unconverted = convert_totals(rows, factors, 2)
+    assert totals == pytest.approx([999.0, 1.0])
+    assert unconverted == ["USD", "EUR"]
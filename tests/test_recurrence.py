@@ -0,0 +1,102 @@
+import datetime
+
+import pytest
+
+from recurrence import (
+    MONTHLY, QUARTERLY, WEEKLY, YEARLY, Period, advance, parse_period, roll_forward, roll_forward_all
+)
+
+
+def _day(text: str) -> int:
+    return datetime.date.fromisoformat(text).toordinal()
+
+
+def _date(day: int) -> str:
+    return datetime.date.fromordinal(day).isoformat()
+
+
+@pytest.mark.parametrize("text, period", [
+    ("месяц", MONTHLY),
+    ("Quarterly", QUARTERLY),
+    ("год", YEARLY),
+    ("неделя", WEEKLY),
+    ("2w", Period("w", 2)),
+    ("14 дн", Period("d", 14)),
+    ("3 мес.", Period("m", 3)),
+    ("1y", Period("y", 1)),
+])
+def test_parse_period(text, period):
+    assert parse_period(text) == period
+
+
+@pytest.mark.parametrize("text", ["", "w", "0m", "3651d", "5 лет", "-1m", "1.5m"])
+def test_parse_period_rejects(text):
+    with pytest.raises(ValueError):
+        parse_period(text)
+
+
+def test_month_end_keeps_anchor_day():
+    day = _day("2025-01-31")
+    dates = []
+    for _ in range(4):
+        day = advance(day, MONTHLY, anchor_day=31)
+        dates.append(_date(day))
+    assert dates == ["2025-02-28", "2025-03-31", "2025-04-30", "2025-05-31"]
+
+
+def test_advance_without_anchor_uses_day_of_month():
+    # without the anchor the 28th is all that is left of Jan 31 after February
+    assert _date(advance(_day("2025-02-28"), MONTHLY)) == "2025-03-28"
+    assert _date(advance(_day("2025-02-28"), MONTHLY, anchor_day=31)) == "2025-03-31"
+
+
+@pytest.mark.parametrize("start, period, anchor_day, expected", [
+    ("2024-02-29", YEARLY, 29, "2025-02-28"),
+    ("2025-02-28", YEARLY, 29, "2026-02-28"),
+    ("2027-02-28", YEARLY, 29, "2028-02-29"),
+    ("2025-11-30", QUARTERLY, 31, "2026-02-28"),
+    ("2025-12-31", MONTHLY, None, "2026-01-31"),
+    ("2025-12-29", WEEKLY, None, "2026-01-05"),
+    ("2025-12-30", Period("d", 3), None, "2026-01-02"),
+])
+def test_advance(start, period, anchor_day, expected):
+    assert _date(advance(_day(start), period, anchor_day)) == expected
+
+
+def test_advance_steps():
+    assert _date(advance(_day("2025-01-31"), MONTHLY, 31, steps=3)) == "2025-04-30"
+    assert _date(advance(_day("2025-01-01"), WEEKLY, steps=2)) == "2025-01-15"
+
+
+@pytest.mark.parametrize("start, period, anchor_day, today, expected", [
+    # several periods behind: the first date on or after today, on the anchor day
+    ("2025-01-31", MONTHLY, 31, "2025-06-15", "2025-06-30"),
+    ("2025-01-31", MONTHLY, 31, "2025-07-31", "2025-07-31"),
+    ("2025-01-31", MONTHLY, 31, "2025-08-01", "2025-08-31"),
+    ("2025-01-15", QUARTERLY, 15, "2025-10-16", "2026-01-15"),
+    ("2020-02-29", YEARLY, 29, "2024-01-01", "2024-02-29"),
+    ("2025-01-01", WEEKLY, None, "2025-02-01", "2025-02-05"),
+    ("2025-01-01", Period("d", 10), None, "2025-01-21", "2025-01-21"),
+    # not behind at all: still one period ahead
+    ("2025-03-10", MONTHLY, 10, "2025-03-01", "2025-04-10"),
+    ("2025-03-10", WEEKLY, None, "2025-03-01", "2025-03-17"),
+])
+def test_roll_forward(start, period, anchor_day, today, expected):
+    assert _date(roll_forward(_day(start), period, anchor_day, _day(today))) == expected
+
+
+def test_roll_forward_matches_repeated_advance():
+    today = _day("2026-03-15")
+    for start in ("2024-01-31", "2024-02-29", "2025-05-30", "2025-12-31"):
+        for period in (MONTHLY, QUARTERLY, YEARLY, WEEKLY, Period("m", 2), Period("d", 45)):
+            day = _day(start)
+            anchor_day = datetime.date.fromordinal(day).day
+            expected = advance(day, period, anchor_day)
+            while expected < today:
+                expected = advance(expected, period, anchor_day)
+            assert roll_forward(day, period, anchor_day, today) == expected, (start, period)
+
+
+def test_roll_forward_all():
+    rows = [(_day("2025-01-31"), MONTHLY, 31), (_day("2025-01-01"), WEEKLY, None)]
+    assert roll_forward_all(rows, _day("2025-03-01")) == [_day("2025-03-31"), _day("2025-03-05")]
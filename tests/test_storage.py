@@ -0,0 +1,301 @@
+import datetime
+import io
+
+import pytest
+
+import db_manager
+from delivery import delivery_clock, reminder_day
+from migrations import MIGRATIONS, POSTGRES_MIGRATIONS
+from money import ExchangeRates, Money
+from recurrence import MONTHLY, WEEKLY, YEARLY, advance
+from storage import OUTBOX_PENDING, OUTBOX_SENT, ShardScope
+from storage_postgres import PostgresStorage
+from subscription_io import FORMAT_CSV, FORMAT_JSON, open_records, parse_record, write_export
+
+pytestmark = pytest.mark.anyio
+
+TODAY = datetime.date.today()
+
+
+def _day(offset: int) -> str:
+    return (TODAY + datetime.timedelta(days=offset)).isoformat()
+
+
+def _ordinal(offset: int) -> int:
+    return (TODAY + datetime.timedelta(days=offset)).toordinal()
+
+
+def _end_of_today():
+    """A clock at which every user's delivery slot for today has come."""
+    return delivery_clock(datetime.datetime.combine(TODAY, datetime.time(23, 59)).timestamp())
+
+
+async def _due(storage, chunk_size: int = 1000) -> list[list[tuple]]:
+    return [chunk async for chunk in storage.iter_due_reminders(chunk_size, _end_of_today())]
+
+
+async def _enqueue_due(storage) -> list[tuple]:
+    rows = [row for chunk in await _due(storage) for row in chunk]
+    await storage.enqueue_reminders(rows)
+    return rows
+
+
+async def test_migrations_are_applied_once(storage):
+    last = (POSTGRES_MIGRATIONS if isinstance(storage, PostgresStorage) else MIGRATIONS)[-1][0]
+    assert await storage.run_migrations() == last
+    assert await storage.run_migrations() == last
+
+
+async def test_due_reminders(storage):
+    ids = {
+        "3 days": await storage.add_subscription(1, "A", Money(100, "RUB"), _day(3)),
+        "1 day": await storage.add_subscription(1, "B", Money(100, "RUB"), _day(1)),
+        "overdue": await storage.add_subscription(2, "C", Money(100, "RUB"), _day(-2)),
+    }
+    await storage.add_subscription(2, "later", Money(100, "RUB"), _day(10))
+    await storage.add_subscription(3, "today", Money(100, "RUB"), _day(0))
+
+    rows = [row for chunk in await _due(storage) for row in chunk]
+    assert {row[0]: row[6] for row in rows} == {ids["3 days"]: 1, ids["1 day"]: 2, ids["overdue"]: 3}
+    assert all(row[5] == 0 for row in rows)
+
+
+async def test_due_reminders_keyset_pagination(storage):
+    ids = [await storage.add_subscription(user_id, "S", Money(100, "RUB"), _day(offset))
+           for user_id in range(1, 4) for offset in (-3, -1, 1, 3)]
+
+    chunks = await _due(storage, chunk_size=5)
+    assert [len(chunk) for chunk in chunks] == [5, 5, 2]
+    seen = [row[0] for chunk in chunks for row in chunk]
+    assert sorted(seen) == sorted(ids)
+    keys = [(row[4], row[5], row[0]) for chunk in chunks for row in chunk]
+    assert keys == sorted(keys)
+
+
+async def test_subscriptions_page(storage):
+    ids = [await storage.add_subscription(7, f"S{i}", Money(100, "RUB"), _day(i)) for i in range(5)]
+    await storage.add_subscription(8, "other user", Money(100, "RUB"), _day(1))
+
+    assert [row[0] for row in await storage.list_subscriptions_page(7, 0, 2)] == ids[:2]
+    assert [row[0] for row in await storage.list_subscriptions_page(7, ids[1], 2)] == ids[2:4]
+    assert [row[0] for row in await storage.list_subscriptions_page(7, ids[4], 2, backward=True)] == ids[2:4]
+    assert [row[0] for row in await storage.list_subscriptions_page(7, ids[4], 10)] == []
+
+
+async def test_outbox_enqueue_claim_complete(storage):
+    sub_id = await storage.add_subscription(1, "Netflix", Money(999, "EUR"), _day(1))
+    rows = await _enqueue_due(storage)
+    # re-enqueueing the same reminder is a no-op
+    await storage.enqueue_reminders(rows)
+    assert await storage.count_pending_outbox() == 1
+    assert [row for chunk in await _due(storage) for row in chunk] == []
+
+    [(outbox_id, claimed_sub_id, user_id, name, amount, date, status)] = await storage.claim_outbox_batch(10)
+    assert (claimed_sub_id, user_id, name, amount, date, status) == (
+        sub_id, 1, "Netflix", Money(999, "EUR"), _day(1), 2
+    )
+    assert await storage.claim_outbox_batch(10) == []
+
+    await storage.complete_outbox([(outbox_id, OUTBOX_SENT)], max_attempts=5)
+    assert await storage.count_pending_outbox() == 0
+    assert await storage.claim_outbox_batch(10) == []
+
+
+async def test_outbox_retries_until_max_attempts(storage):
+    await storage.add_subscription(1, "Netflix", Money(999, "RUB"), _day(1))
+    await _enqueue_due(storage)
+
+    [row] = await storage.claim_outbox_batch(10)
+    await storage.complete_outbox([(row[0], OUTBOX_PENDING)], max_attempts=2)
+    assert await storage.count_pending_outbox() == 1
+
+    [row] = await storage.claim_outbox_batch(10)
+    await storage.complete_outbox([(row[0], OUTBOX_PENDING)], max_attempts=2)
+    assert await storage.count_pending_outbox() == 0
+
+
+async def test_outbox_cancels_reminders_of_moved_dates(storage):
+    sub_id = await storage.add_subscription(1, "Netflix", Money(999, "RUB"), _day(1))
+    await _enqueue_due(storage)
+    assert await storage.move_payment_dates([(sub_id, _day(1), _day(31))]) == 1
+
+    assert await storage.claim_outbox_batch(10) == []
+    assert await storage.count_pending_outbox() == 0
+
+
+async def test_recover_outbox_returns_claimed_rows(storage):
+    await storage.add_subscription(1, "Netflix", Money(999, "RUB"), _day(1))
+    await _enqueue_due(storage)
+    assert len(await storage.claim_outbox_batch(10)) == 1
+
+    assert await storage.recover_outbox() == 1
+    assert len(await storage.claim_outbox_batch(10)) == 1
+
+
+async def test_claim_keeps_users_whole(storage):
+    for user_id in (1, 2, 3):
+        for offset in (1, 3):
+            await storage.add_subscription(user_id, "S", Money(100, "RUB"), _day(offset))
+    await _enqueue_due(storage)
+
+    assert [row[2] for row in await storage.claim_outbox_batch(2)] == [1, 1, 2, 2]
+    assert [row[2] for row in await storage.claim_outbox_batch(2)] == [3, 3]
+
+
+async def test_claim_skips_users_held_by_another_claimer(storage):
+    if not isinstance(storage, PostgresStorage):
+        pytest.skip("SQLite claims under its single writer")
+    ids = {}
+    for user_id in (1, 2):
+        for offset in (1, 3):
+            ids[user_id, offset] = await storage.add_subscription(user_id, "S", Money(100, "RUB"), _day(offset))
+    await _enqueue_due(storage)
+
+    async with storage.pool.acquire() as con:
+        async with con.transaction():
+            # another claimer holds one of user 1's rows: the whole user is left to it
+            await con.execute("SELECT id FROM reminder_outbox WHERE sub_id = $1 FOR UPDATE", ids[1, 1])
+            assert [row[2] for row in await storage.claim_outbox_batch(1)] == [2, 2]
+            assert await storage.claim_outbox_batch(1) == []
+    assert [row[2] for row in await storage.claim_outbox_batch(1)] == [1, 1]
+
+
+async def test_payment_with_expected_date(storage, monkeypatch):
+    monkeypatch.setattr(db_manager, "_storage", storage)
+    db_manager._subscriptions_cache.clear()
+    sub_id = await storage.add_subscription(5, "Netflix", Money(999, "RUB"), "2026-01-31")
+
+    paid = db_manager.update_subscription_after_payment
+    assert await paid(5, sub_id, "2026-01-31") == (True, "Netflix", "2026-02-28")
+    # a second tap on the same button doesn't move the date again
+    assert await paid(5, sub_id, "2026-01-31") == (False, "Netflix", "2026-02-28")
+    # back to the anchor day
+    assert await paid(5, sub_id) == (True, "Netflix", "2026-03-31")
+    assert await paid(6, sub_id) == (False, None, None)
+
+
+@pytest.mark.parametrize("file_format", [FORMAT_CSV, FORMAT_JSON])
+async def test_export_reads_back(storage, monkeypatch, file_format):
+    monkeypatch.setattr(db_manager, "_storage", storage)
+    for i in range(5):
+        await storage.add_subscription(1, f"S{i}", Money(100 * i + 99, "USD"), _day(i), WEEKLY)
+    await storage.add_subscription(2, "other user", Money(100, "RUB"), _day(1))
+
+    out = io.StringIO()
+    assert await write_export(db_manager.iter_subscriptions(1, chunk_size=2), file_format, out) == 5
+    out.seek(0)
+    records = [parse_record(record, 1) for _, record in open_records(out, file_format)]
+    assert records == [(1, f"S{i}", Money(100 * i + 99, "USD"), _day(i), WEEKLY) for i in range(5)]
+
+    out = io.StringIO()
+    assert await write_export(db_manager.iter_subscriptions(3), file_format, out) == 0
+
+
+async def test_auto_advance_overdue(storage, monkeypatch):
+    monkeypatch.setattr(db_manager, "_storage", storage)
+    db_manager._subscriptions_cache.clear()
+    monthly = await storage.add_subscription(1, "Netflix", Money(999, "RUB"), _day(-40))
+    weekly = await storage.add_subscription(2, "Gym", Money(500, "RUB"), _day(-20), WEEKLY)
+    recent = await storage.add_subscription(3, "Spotify", Money(299, "RUB"), _day(-2))
+    # only rows that already got the overdue reminder are moved
+    await _enqueue_due(storage)
+    rows = await storage.claim_outbox_batch(10)
+    await storage.complete_outbox([(row[0], OUTBOX_SENT) for row in rows], max_attempts=5)
+
+    clock = _end_of_today()
+    new_dates = await db_manager.auto_advance_overdue(7, clock=clock)
+    for user_id, sub_id, period in ((1, monthly, MONTHLY), (2, weekly, WEEKLY)):
+        _, new_date, _, anchor_day = await storage.get_schedule(user_id, sub_id)
+        [slot] = {slot for date, slot in new_dates if date == new_date}
+        today = reminder_day(slot, clock.now_minute)
+        expected = advance(_ordinal(-40 if period == MONTHLY else -20), period, anchor_day)
+        while expected < today:
+            expected = advance(expected, period, anchor_day)
+        assert new_date == datetime.date.fromordinal(expected).isoformat()
+    assert (await storage.get_schedule(3, recent))[1] == _day(-2)
+    assert len(new_dates) == 2
+
+
+async def test_spending_summary(storage):
+    await storage.add_subscription(1, "Netflix", Money(999, "RUB"), _day(5))
+    await storage.add_subscription(1, "Spotify", Money(1200, "USD"), _day(-2), YEARLY)
+    await storage.add_subscription(2, "Netflix", Money(500, "RUB"), _day(40), MONTHLY)
+    factors = ExchangeRates({"RUB": 1.0, "USD": 90.0}).factors(["RUB", "USD"], "RUB")
+
+    summary = await storage.get_spending_summary(1, _day(0), _day(30), 10, factors)
+    assert (summary.users, summary.subscriptions, summary.unconverted) == (1, 2, [])
+    # 12.00 USD a year is 1080 RUB, 90 a month
+    assert summary.monthly_total == pytest.approx(9.99 + 90)
+    assert summary.upcoming_total == pytest.approx(9.99)
+    assert summary.overdue_total == pytest.approx(1080)
+    assert [(name, count) for name, count, _ in summary.top_services] == [("Spotify", 1), ("Netflix", 1)]
+    assert [total for _, _, total in summary.top_services] == pytest.approx([90, 9.99])
+
+    summary = await storage.get_spending_summary(None, _day(0), _day(30), 10, factors)
+    assert (summary.users, summary.subscriptions) == (2, 3)
+    assert summary.upcoming_total == pytest.approx(9.99)
+    assert [(name, count) for name, count, _ in summary.top_services] == [("Spotify", 1), ("Netflix", 2)]
+    assert summary.top_services[1][2] == pytest.approx(14.99)
+
+    # without a USD rate the USD subscription is left out, and said so
+    summary = await storage.get_spending_summary(1, _day(0), _day(30), 10, {"RUB": 0.01})
+    assert summary.unconverted == ["USD"]
+    assert summary.monthly_total == pytest.approx(9.99)
+    assert summary.overdue_total == 0
+
+
+async def test_spending_summary_follows_deletes(storage):
+    sub_id = await storage.add_subscription(1, "Netflix", Money(999, "RUB"), _day(5))
+    assert await storage.delete_subscription(1, sub_id)
+
+    summary = await storage.get_spending_summary(1, _day(0), _day(30), 10, {"RUB": 0.01})
+    assert (summary.users, summary.subscriptions, summary.monthly_total, summary.top_services) == (0, 0, 0, [])
+
+
+async def test_shards_are_balanced_between_workers(storage):
+    await storage.init_shards(4)
+    a, b = ShardScope("a", 4), ShardScope("b", 4)
+
+    assert await storage.balance_shards(a, 30) == ([0, 1, 2, 3], [0, 1, 2, 3])
+    # b joins: nothing is free until a gives up its extra shards
+    assert await storage.balance_shards(b, 30) == ([], [])
+    assert await storage.balance_shards(a, 30) == ([0, 1], [])
+    assert await storage.balance_shards(b, 30) == ([2, 3], [2, 3])
+    assert await storage.renew_shard_leases(a, 30) == 2
+
+
+async def test_expired_worker_reminders_are_requeued(storage):
+    await storage.init_shards(2)
+    a, b = ShardScope("a", 2), ShardScope("b", 2)
+    await storage.add_subscription(4, "Netflix", Money(999, "RUB"), _day(1))
+    await _enqueue_due(storage)
+    await storage.balance_shards(a, 30)
+    assert len(await storage.claim_outbox_batch(10, a)) == 1
+
+    # a dies mid-send: its heartbeat and leases run out
+    await storage.renew_shard_leases(a, -1)
+    assert await storage.balance_shards(b, 30) == ([0, 1], [0, 1])
+    assert len(await storage.claim_outbox_batch(10, b)) == 1
+
+
+async def test_released_shards_return_in_flight_reminders(storage):
+    await storage.init_shards(2)
+    a, b = ShardScope("a", 2), ShardScope("b", 2)
+    await storage.add_subscription(4, "Netflix", Money(999, "RUB"), _day(1))
+    await _enqueue_due(storage)
+    await storage.balance_shards(a, 30)
+    assert len(await storage.claim_outbox_batch(10, a)) == 1
+
+    # a graceful stop cancels the sweep with the batch still "sending"
+    await storage.release_shards(a)
+    assert await storage.balance_shards(b, 30) == ([0, 1], [0, 1])
+    assert len(await storage.claim_outbox_batch(10, b)) == 1
+
+
+async def test_bot_state(storage):
+    await storage.save_bot_state([("user_data", "1", b"one"), ("user_data", "2", b"two"), ("conv", "[1, 1]", b"x")])
+    await storage.save_bot_state([("user_data", "1", b"uno"), ("user_data", "2", None)])
+
+    assert sorted(await storage.get_bot_state("user_data")) == [("1", b"uno")]
+    assert await storage.get_bot_state("conv") == [("[1, 1]", b"x")]
+    assert await storage.get_bot_state("missing") == []